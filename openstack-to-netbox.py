@@ -21,6 +21,7 @@
 
 import sys
 import time
+import argparse
 
 from scripts.openstack.fetchinfo import get_keystone
 from scripts.openstack.fetchinfo import get_nova
@@ -32,6 +33,7 @@ from scripts.netbox.fetchinfo import nbfetchvms
 from scripts.netbox.fetchinfo import nbfetchvolumes
 from scripts.netbox.fetchinfo import nbfetchvrfs
 from scripts.netbox.fetchinfo import nbfetchsubnets
+from scripts.netbox.fetchinfo import nbfetchtaggedaddresses
 from scripts.netbox.fetchinfo import nbfetchaddresses
 
 from scripts.parse_nova_vm import nova_to_netboxvms
@@ -45,124 +47,174 @@ from scripts.parse_neutron_networks import netboxipamsubnets
 from scripts.parse_neutron_ipam import netboxipam
 from scripts.parse_neutron_ipam import netboxipamfloat
 
+from scripts.netbox.bulk import print_bulk_summary
+from scripts.netbox.fielddiff import print_field_change_summary
+from scripts.netbox.fingerprints import save_fingerprints
+from scripts.netbox.delete import reconcile_deletes
+from scripts.netbox.statestore import set_mode
+from scripts.netbox.transport import print_transport_summary
+from scripts.openstack.snapshot import set_mode as set_snapshot_mode
+from scripts.openstack.snapshot import save_snapshots
+
+from scripts.scheduler import Task
+from scripts.scheduler import run_tasks
+from scripts.scheduler import print_task_timings
+from scripts.daemon import run_daemon
+
 import settings
 nb = settings.nb
 cluster_name = settings.cluster_name
 cluster_type = settings.cluster_type
 
-try:
-    print(f'\nFetching information from OpenStack \n')
-    keystone_tenant_dictionary = get_keystone()
-    nova_instances, nova_flavor_dictionary = get_nova()
-    cinder_volume_dictionary = get_cinder()
-    (neutron_interface_dictionary, neutron_network_private_dictionary, neutron_float_dictionary,
-     neutron_router_dictionary, neutron_dhcpagent_dictionary, neutron_subnet_dictionary) = get_neutron()
-    print(f'Finished fetching information from OpenStack. \n')
-except Exception as e:
-    print(f"Unable to collect information from OpenStack \n{e}")
-    sys.exit(1)
-
-try:
-    print(f'Fetching information from NetBox for cluster {cluster_name}\n')
-    netboxvmdic = nbfetchvms()
-    netboxinterfacedic = nbfetchinterfaces()
-    netboxvoldic = nbfetchvolumes()
-    netboxvrfdic = nbfetchvrfs()
-    netboxsubnetdic = nbfetchsubnets()
-    netboxlanaddressdic, netboxwanaddressdic = nbfetchaddresses()
-    print(f'\nFinished collecting information from NetBox for cluster {cluster_name}')
-except Exception as e:
-    print(f"Unable to collect information from NetBox \n{e}")
-    sys.exit(1)
-
-
-print(f'Creation and or updating of NetBox objects will start in 5 seconds. \n')
-time.sleep(5)
-
-
-try:
-    print(f"Attempting to create/update NetBox Virtual Machines based on OpenStack Instances")
-    nova_to_netboxvms(nova_instances, nova_flavor_dictionary, keystone_tenant_dictionary, netboxvmdic)
-    print('NetBox Virtual Machines have been created or updated succesfully \n')
-except Exception as e:
-    # We really only want to proceed to the next functions, when the previous step has been completed succesfully
-    print(f"NetBox Virtual Machine creation or updating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"Attempting to create/update NetBox Virtual Machines based on OpenStack routers")
-    neutronrouter_to_netboxvms(neutron_router_dictionary, nova_flavor_dictionary,
-                               keystone_tenant_dictionary, netboxvmdic)
-    print('NetBox routers have been created or updated succesfully \n')
-except Exception as e:
-    print(f"NetBox Router creation or updating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"Attempting to create/update NetBox Virtual Machines based on Neutron DHCP agents")
-    neutrondhcp_to_netboxvms(neutron_dhcpagent_dictionary, netboxvmdic)
-    print('NetBox DHCP agents have been created or updated succesfully \n')
-except Exception as e:
-    print(f"NetBox DHCP agent creation or updating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"Re-fetching Virtual Machines from NetBox as states may have been modified")
-    netboxvmdic = nbfetchvms()
-except Exception as e:
-    print(f"Unable to re-fetch Virtual Machines from NetBox cluster {cluster_name} \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"\nAttempting to create/update Netbox Virtual Disks based on Volumes associated with OpenStack Instances")
-    cinder_to_netboxdisks(cinder_volume_dictionary, netboxvoldic, netboxvmdic)
-    print(f'NetBox disks have been created or updated succesfully \n')
-except Exception as e:
-    print(f"NetBox disk creation or updating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"Attempting to create/update Netbox Interfaces based on interfaces associated with OpenStack Instances")
-    netboxinterfaces(neutron_interface_dictionary, netboxinterfacedic, netboxvmdic)
-    print('NetBox Interfaces have been created or updated succesfully \n')
-except Exception as e:
-    print(f"NetBox Interfaces creation or updating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f'Re-fetching NetBox Interfaces information')
-    netboxinterfacedic = nbfetchinterfaces()
-    print(f'Finished re-fetching NetBox Interfaces \n')
-except Exception as e:
-    print(f"Unable to collect Interface information from NetBox \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"Attempting to create and or associate NetBox MAC-addresses based on Neutron interfaces.")
-    netboxmacs(neutron_interface_dictionary, netboxinterfacedic)
-    print('NetBox MAC-addresses have been created and or associated succesfully \n')
-except Exception as e:
-    print(f"NetBox MAC-addresses creation or associating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"Attempting to create/update Netbox VRFs based on OpenStack networks containing private IP-addresses")
-    netboxipamvrfs(neutron_network_private_dictionary, netboxvrfdic)
-    print(f"NetBox VRFs have been created or updated succesfully \n")
+parser = argparse.ArgumentParser(description="Create and update NetBox objects based on OpenStack")
+parser.add_argument("--reconcile", action="store_true",
+                    help="Afterwards, also delete the NetBox objects that no longer exist in OpenStack. "
+                         "This uses the information fetched for creating and updating, "
+                         "rather than fetching everything again like scripts/tool_nb_cleanup_unused.py")
+parser.add_argument("--verify-state", action="store_true",
+                    help="Fetch every NetBox object anyway, print where the state store disagrees with NetBox "
+                         "and correct the store. The same goes for the OpenStack snapshot, "
+                         "if os_collection_mode is incremental")
+parser.add_argument("--rebuild-state", action="store_true",
+                    help="Empty the state store and fetch every NetBox object again, "
+                         "and collect everything from OpenStack again")
+parser.add_argument("--daemon", action="store_true",
+                    help="Keep running and sync every daemon_interval seconds, rather than syncing once. "
+                         "Sessions, fetched NetBox objects and the OpenStack snapshot stay in memory between cycles")
+args = parser.parse_args()
+
+if args.rebuild_state:
+    set_mode("rebuild")
+    set_snapshot_mode("rebuild")
+elif args.verify_state:
+    set_mode("verify")
+    set_snapshot_mode("verify")
+
+
+def collect_information():
+    # The stages below work with these module variables
+    global keystone_tenant_dictionary, nova_instances, nova_flavor_dictionary, cinder_volume_dictionary
+    global neutron_interface_dictionary, neutron_network_private_dictionary, neutron_float_dictionary
+    global neutron_router_dictionary, neutron_dhcpagent_dictionary, neutron_subnet_dictionary
+    global netboxvmdic, netboxinterfacedic, netboxvoldic, netboxvrfdic, netboxsubnetdic
+    global netboxlanaddressdic, netboxwanaddressdic
+    try:
+        print(f'\nFetching information from OpenStack and from NetBox for cluster {cluster_name}\n')
+        # Neither side depends on the other, so Keystone, Nova, Cinder, Neutron and every NetBox endpoint
+        # are queried at the same time. Collecting takes about as long as the slowest of them
+        collection_results, collection_timings = run_tasks([Task("Keystone", get_keystone),
+                                                            Task("Nova", get_nova),
+                                                            Task("Cinder", get_cinder),
+                                                            Task("Neutron", get_neutron),
+                                                            Task("NetBox VMs", nbfetchvms),
+                                                            Task("NetBox Interfaces", nbfetchinterfaces),
+                                                            Task("NetBox Disks", nbfetchvolumes),
+                                                            Task("NetBox VRFs", nbfetchvrfs),
+                                                            Task("NetBox Prefixes", nbfetchsubnets),
+                                                            Task("NetBox tagged addresses", nbfetchtaggedaddresses),
+                                                            # Global addresses are only fetched for the OpenStack
+                                                            # subnets and Floating-IPs, so this waits for Neutron
+                                                            Task("NetBox addresses",
+                                                                 lambda tagged, neutron: nbfetchaddresses(tagged,
+                                                                                                          neutron[5],
+                                                                                                          neutron[2]),
+                                                                 depends_on=["NetBox tagged addresses", "Neutron"])],
+                                                           settings.os_api_workers + settings.netbox_workers)
+        keystone_tenant_dictionary = collection_results["Keystone"]
+        nova_instances, nova_flavor_dictionary = collection_results["Nova"]
+        cinder_volume_dictionary = collection_results["Cinder"]
+        (neutron_interface_dictionary, neutron_network_private_dictionary, neutron_float_dictionary,
+         neutron_router_dictionary, neutron_dhcpagent_dictionary,
+         neutron_subnet_dictionary) = collection_results["Neutron"]
+        netboxvmdic = collection_results["NetBox VMs"]
+        netboxinterfacedic = collection_results["NetBox Interfaces"]
+        netboxvoldic = collection_results["NetBox Disks"]
+        netboxvrfdic = collection_results["NetBox VRFs"]
+        netboxsubnetdic = collection_results["NetBox Prefixes"]
+        netboxlanaddressdic, netboxwanaddressdic = collection_results["NetBox addresses"]
+        print_task_timings(collection_timings, "OpenStack and NetBox collection")
+        print(f'\nFinished collecting information from OpenStack and from NetBox for cluster {cluster_name}')
+    except Exception as e:
+        print(f"Unable to collect information from OpenStack or NetBox \n{e}")
+        sys.exit(1)
+
+
+# Every stage below creates and updates one kind of NetBox object. We really only want to start a stage,
+# when the stages it builds on have been completed succesfully, but stages that don't need each other run side by side
+
+
+def sync_nova_vms():
     try:
-        print(f'Re-fetching NetBox VRF information')
-        netboxvrfdic = nbfetchvrfs()
+        print(f"Attempting to create/update NetBox Virtual Machines based on OpenStack Instances")
+        nova_to_netboxvms(nova_instances, nova_flavor_dictionary, keystone_tenant_dictionary, netboxvmdic)
+        print('NetBox Virtual Machines have been created or updated succesfully \n')
     except Exception as e:
-        print(f"Unable to collect VRF information from NetBox \n{e}")
+        print(f"NetBox Virtual Machine creation or updating failed \n{e}")
         sys.exit(1)
+
+
+def sync_routers():
+    try:
+        print(f"Attempting to create/update NetBox Virtual Machines based on OpenStack routers")
+        neutronrouter_to_netboxvms(neutron_router_dictionary, nova_flavor_dictionary,
+                                   keystone_tenant_dictionary, netboxvmdic)
+        print('NetBox routers have been created or updated succesfully \n')
+    except Exception as e:
+        print(f"NetBox Router creation or updating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_dhcp_agents():
+    try:
+        print(f"Attempting to create/update NetBox Virtual Machines based on Neutron DHCP agents")
+        neutrondhcp_to_netboxvms(neutron_dhcpagent_dictionary, netboxvmdic)
+        print('NetBox DHCP agents have been created or updated succesfully \n')
+    except Exception as e:
+        print(f"NetBox DHCP agent creation or updating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_disks():
+    try:
+        print(f"\nAttempting to create/update Netbox Virtual Disks based on Volumes associated with OpenStack Instances")
+        cinder_to_netboxdisks(cinder_volume_dictionary, netboxvoldic, netboxvmdic)
+        print(f'NetBox disks have been created or updated succesfully \n')
+    except Exception as e:
+        print(f"NetBox disk creation or updating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_interfaces():
+    try:
+        print(f"Attempting to create/update Netbox Interfaces based on interfaces associated with OpenStack Instances")
+        netboxinterfaces(neutron_interface_dictionary, netboxinterfacedic, netboxvmdic)
+        print('NetBox Interfaces have been created or updated succesfully \n')
+    except Exception as e:
+        print(f"NetBox Interfaces creation or updating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_macs():
+    try:
+        print(f"Attempting to create and or associate NetBox MAC-addresses based on Neutron interfaces.")
+        netboxmacs(neutron_interface_dictionary, netboxinterfacedic)
+        print('NetBox MAC-addresses have been created and or associated succesfully \n')
+    except Exception as e:
+        print(f"NetBox MAC-addresses creation or associating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_vrfs():
+    try:
+        print(f"Attempting to create/update Netbox VRFs based on OpenStack networks containing private IP-addresses")
+        netboxipamvrfs(neutron_network_private_dictionary, netboxvrfdic)
+        print(f"NetBox VRFs have been created or updated succesfully \n")
+    except Exception as e:
+        print(f"NetBox VRF creation or updating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_subnets():
     try:
         print(f"\nAttempting to create/update NetBox subnets based on OpenStack subnets containing relevant addresses")
         netboxipamsubnets(neutron_subnet_dictionary, neutron_interface_dictionary, netboxsubnetdic, netboxvrfdic)
@@ -170,35 +222,78 @@ try:
     except Exception as e:
         print(f"NetBox subnets based on OpenStack subnets creation or updating failed \n{e}")
         sys.exit(1)
-except Exception as e:
-    print(f"NetBox VRF creation or updating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f'Re-fetching NetBox subnet information')
-    netboxsubnetdic = nbfetchsubnets()
-except Exception as e:
-    print(f"Unable to collect subnet information from NetBox \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"\nAttempting to create/update NetBox IP-addresses based on Interfaces bound to OpenStack Instances")
-    netboxipam(neutron_interface_dictionary, neutron_subnet_dictionary, netboxvmdic, netboxinterfacedic, netboxvrfdic,
-               netboxlanaddressdic, netboxwanaddressdic)
-    print(f'NetBox IP-addresses based on OpenStack Interfaces have been created or updated succesfully \n')
-except Exception as e:
-    print(f"NetBox IP-addresses based on Instance Interfaces creation or updating failed \n{e}")
-    sys.exit(1)
-
-
-try:
-    print(f"Attempting to create/update NetBox IP-addresses based on Floating-IPs bound to Instances")
-    netboxipamfloat(neutron_float_dictionary, neutron_subnet_dictionary, netboxvmdic, netboxinterfacedic, netboxvrfdic,
-                    netboxlanaddressdic, netboxwanaddressdic)
-    print(f'NetBox IP-addresses based on Floating-IPs have been created or updated succesfully \n')
+
+
+def sync_addresses():
+    try:
+        print(f"\nAttempting to create/update NetBox IP-addresses based on Interfaces bound to OpenStack Instances")
+        netboxipam(neutron_interface_dictionary, neutron_subnet_dictionary, netboxvmdic, netboxinterfacedic,
+                   netboxvrfdic, netboxlanaddressdic, netboxwanaddressdic)
+        print(f'NetBox IP-addresses based on OpenStack Interfaces have been created or updated succesfully \n')
+    except Exception as e:
+        print(f"NetBox IP-addresses based on Instance Interfaces creation or updating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_floating_ips():
+    try:
+        print(f"Attempting to create/update NetBox IP-addresses based on Floating-IPs bound to Instances")
+        netboxipamfloat(neutron_float_dictionary, neutron_subnet_dictionary, netboxvmdic, netboxinterfacedic,
+                        netboxvrfdic, netboxlanaddressdic, netboxwanaddressdic)
+        print(f'NetBox IP-addresses based on Floating-IPs have been created or updated succesfully \n')
+    except Exception as e:
+        print(f"NetBox IP-addresses based on Floating-IPs creation or updating failed \n{e}")
+        sys.exit(1)
+
+
+def sync_netbox():
+    # VMs come first, as Instances, routers and DHCP agents share the NetBox VM names. VRFs don't need VMs at all
+    # Disks, Interfaces → MAC-addresses and VRFs → subnets are independent of each other
+    # IP-addresses need their Interfaces and VRFs, Floating-IPs come last so they can find the addresses above
+    # IP-addresses also wait for the MAC-addresses, which change the Interfaces dictionary the IP-addresses go through
+    stage_results, stage_timings = run_tasks([
+        Task("Virtual Machines", sync_nova_vms),
+        Task("Routers", sync_routers, depends_on=["Virtual Machines"], pass_results=False),
+        Task("DHCP agents", sync_dhcp_agents, depends_on=["Routers"], pass_results=False),
+        Task("Virtual Disks", sync_disks, depends_on=["DHCP agents"], pass_results=False),
+        Task("Interfaces", sync_interfaces, depends_on=["DHCP agents"], pass_results=False),
+        Task("MAC-addresses", sync_macs, depends_on=["Interfaces"], pass_results=False),
+        Task("VRFs", sync_vrfs),
+        Task("Subnets", sync_subnets, depends_on=["VRFs"], pass_results=False),
+        Task("IP-addresses", sync_addresses, depends_on=["MAC-addresses", "Subnets"], pass_results=False),
+        Task("Floating-IPs", sync_floating_ips, depends_on=["IP-addresses"], pass_results=False)
+    ], settings.netbox_stage_workers)
+
+    if args.reconcile:
+        try:
+            print(f"Attempting to delete NetBox objects in cluster {cluster_name} that no longer exist in OpenStack")
+            reconcile_deletes(nova_instances, neutron_router_dictionary, neutron_dhcpagent_dictionary,
+                              cinder_volume_dictionary, neutron_interface_dictionary, neutron_float_dictionary,
+                              netboxvmdic, netboxvoldic, netboxinterfacedic, netboxlanaddressdic, netboxwanaddressdic,
+                              netboxsubnetdic, netboxvrfdic)
+            print(f"Old NetBox objects have been deleted succesfully \n")
+        except Exception as e:
+            print(f"Deleting old NetBox objects failed \n{e}")
+            sys.exit(1)
+
+    print_task_timings(stage_timings, "NetBox stages")
+    print_field_change_summary()
+    print_bulk_summary()
+    print_transport_summary(settings.netbox_transport)
+    save_fingerprints()
+    save_snapshots()
+
+
+def sync_cycle():
+    collect_information()
+    if not args.daemon:
+        print(f'Creation and or updating of NetBox objects will start in 5 seconds. \n')
+        time.sleep(5)
+    sync_netbox()
+
+
+if args.daemon:
+    run_daemon(sync_cycle)
+else:
+    sync_cycle()
     print(f"The script has finished succesfully!")
-except Exception as e:
-    print(f"NetBox IP-addresses based on Floating-IPs creation or updating failed \n{e}")
-    sys.exit(1)
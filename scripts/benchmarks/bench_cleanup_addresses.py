@@ -0,0 +1,123 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+# Compares how long cleanaddresses in tool_nb_cleanup_unused.py takes to decide which NetBox addresses to delete,
+# with the old loop over every Floating-IP per address and with build_interface_address_map
+# Runs without NetBox or OpenStack: python3 scripts/benchmarks/bench_cleanup_addresses.py
+
+import sys
+import os
+import time
+import uuid
+import ipaddress
+
+sys.path.insert(1, os.path.join(sys.path[0], '..', '..'))
+from scripts.netbox.indexes import build_interface_address_map
+
+address_amount = 50000
+float_amount = 20000
+stale_address_ratio = 0.05  # Part of the NetBox addresses that no longer exist in Neutron
+max_sampled_addresses = 200  # The old loop is too slow to run completely, so we extrapolate
+
+
+class FakeRecord(object):
+    def __init__(self, netbox_id, **fields):
+        self.id = netbox_id
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+def build_environment():
+    neutron_interfaces = {}
+    neutron_floats = {}
+    nb_addresses = {}
+    netbox_int_dic = {}
+    first_fixed_ip = int(ipaddress.ip_address("10.0.0.0"))
+    first_float_ip = int(ipaddress.ip_address("100.0.0.0"))  # Floating-IPs are usually global, any range will do
+    for number in range(address_amount):
+        interface_id = str(uuid.uuid4())
+        fixed_ip = str(ipaddress.ip_address(first_fixed_ip + number))
+        neutron_interfaces[interface_id] = {"interfaceid": interface_id, "interfaceips": [{"ip_address": fixed_ip}]}
+        netbox_int_dic[number] = FakeRecord(number, custom_fields={"openstack_interfaceid": interface_id})
+        if number < address_amount * stale_address_ratio:
+            # NetBox still has an address that Neutron removed from this Interface
+            fixed_ip = str(ipaddress.ip_address(first_fixed_ip + address_amount + number))
+        nb_addresses[number] = FakeRecord(number, address=f"{fixed_ip}/16", assigned_object=FakeRecord(number))
+        if number < float_amount:
+            float_id = str(uuid.uuid4())
+            neutron_floats[float_id] = {"floatid": float_id, "boundtointerfaceid": interface_id,
+                                        "floatip": str(ipaddress.ip_address(first_float_ip + number))}
+    return neutron_interfaces, neutron_floats, nb_addresses, netbox_int_dic
+
+
+def clean_before(neutroninterfaces, neutronfloat, nb_addresses, netbox_int_dic):
+    netboxaddressesdeleteid = []
+    for nb_address_id, nb_address in nb_addresses.items():
+        address_interface = netbox_int_dic.get(nb_address.assigned_object.id)
+        nb_interface_os_id = address_interface.custom_fields['openstack_interfaceid']
+        neutron_addresses = set()
+        split_address = str(nb_address.address).split('/')[0]
+        for ip in neutroninterfaces[nb_interface_os_id]["interfaceips"]:
+            neutron_addresses.add(ip["ip_address"])
+        for floatid in neutronfloat:
+            if neutronfloat[floatid]["boundtointerfaceid"] == nb_interface_os_id:
+                neutron_addresses.add(neutronfloat[floatid]["floatip"])
+        if split_address not in neutron_addresses:
+            netboxaddressesdeleteid.append(nb_address.id)
+    return netboxaddressesdeleteid
+
+
+def clean_after(neutroninterfaces, neutronfloat, nb_addresses, netbox_int_dic):
+    netboxaddressesdeleteid = []
+    neutron_addresses = build_interface_address_map(neutroninterfaces, neutronfloat)
+    netbox_addresses = {}
+    for nb_address_id, nb_address in nb_addresses.items():
+        address_interface = netbox_int_dic.get(nb_address.assigned_object.id)
+        nb_interface_os_id = address_interface.custom_fields['openstack_interfaceid']
+        split_address = str(nb_address.address).split('/')[0]
+        netbox_addresses.setdefault(nb_interface_os_id, {}).setdefault(split_address, []).append(nb_address)
+    for nb_interface_os_id, nb_interface_addresses in netbox_addresses.items():
+        for split_address in nb_interface_addresses.keys() - neutron_addresses.get(nb_interface_os_id, set()):
+            for nb_address in nb_interface_addresses[split_address]:
+                netboxaddressesdeleteid.append(nb_address.id)
+    return netboxaddressesdeleteid
+
+
+def run_benchmark():
+    neutron_interfaces, neutron_floats, nb_addresses, netbox_int_dic = build_environment()
+    # We sample evenly, so stale and current addresses are represented like they are in the whole set
+    step = max(1, len(nb_addresses) // max_sampled_addresses)
+    sample = {nb_id: nb_address for nb_id, nb_address in list(nb_addresses.items())[::step]}
+    started = time.perf_counter()
+    sampled_deletes = clean_before(neutron_interfaces, neutron_floats, sample, netbox_int_dic)
+    before = (time.perf_counter() - started) * len(nb_addresses) / len(sample)
+    started = time.perf_counter()
+    deletes = clean_after(neutron_interfaces, neutron_floats, nb_addresses, netbox_int_dic)
+    after = time.perf_counter() - started
+    # Both ways should pick the same addresses for deletion
+    assert sorted(sampled_deletes) == sorted(nb_id for nb_id in deletes if nb_id in sample)
+    print(f"{'NetBox addresses':>16} {'Floating-IPs':>13} {'before (s)':>12} {'after (s)':>12} {'speedup':>10}")
+    print(f"{address_amount:>16} {float_amount:>13} {before:>12.2f} {after:>12.4f} {before / after:>9.0f}x")
+    print(f"\n{len(deletes)} addresses would be deleted")
+    print(f"The 'before' column is extrapolated from {len(sample)} sampled addresses")
+
+
+run_benchmark()
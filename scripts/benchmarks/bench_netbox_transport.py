@@ -0,0 +1,183 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# Sends the same burst of requests to a local stand-in for an overloaded NetBox, once through a plain HTTPAdapter
+# and once through NetboxTransport with its retries and AimdLimiter, see scripts/netbox/transport.py
+# The stand-in handles a few requests at a time, slows down as more arrive, answers 503 when too many arrive
+# and throws in the occasional 502 and 429, like a NetBox behind a proxy with a handful of Gunicorn workers
+# A burst of POSTs and PATCHes then checks that writes are only retried after a 429, never after a 5xx:
+# NetBox may have saved the objects before the proxy gave up, so sending them again could create them twice
+# Runs without NetBox or OpenStack, only requests is needed: python3 scripts/benchmarks/bench_netbox_transport.py
+
+import sys
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(1, os.path.join(sys.path[0], '..', '..'))
+from scripts.netbox.transport import NetboxTransport
+
+request_amount = 2000
+client_threads = 32  # Like a generous netbox_pool_size
+server_capacity = 4  # Requests the stand-in handles at full speed
+server_overload = 12  # From this many requests in flight, the stand-in answers 503
+base_latency = 0.01  # Seconds per request at full speed
+random_502_ratio = 0.01
+random_429_ratio = 0.01
+
+write_amount = 300
+write_5xx_statuses = (500, 502, 503, 504)
+
+server_lock = threading.Lock()
+server_state = {"in_flight": 0, "errors": 0}
+write_arrivals = {}  # Path of a POST or PATCH → how many times it reached the stand-in
+
+
+class OverloadedNetbox(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like NetBox behind a proxy
+
+    def do_GET(self):
+        with server_lock:
+            server_state["in_flight"] = server_state["in_flight"] + 1
+            in_flight = server_state["in_flight"]
+        try:
+            chance = random.random()
+            if in_flight >= server_overload or chance < random_502_ratio:
+                self.answer(503 if in_flight >= server_overload else 502, b'{"detail": "Bad Gateway"}')
+            elif chance < random_502_ratio + random_429_ratio:
+                self.answer(429, b'{"detail": "Too Many Requests"}', {"Retry-After": "0"})
+            else:
+                # Every request beyond our capacity slows all of them down
+                time.sleep(base_latency * max(1, in_flight / server_capacity))
+                self.answer(200, b'{"count": 0, "next": null, "previous": null, "results": []}')
+        finally:
+            with server_lock:
+                server_state["in_flight"] = server_state["in_flight"] - 1
+
+    def do_POST(self):
+        self.answer_write()
+
+    def do_PATCH(self):
+        self.answer_write()
+
+    def answer_write(self):
+        # The number at the end of the path decides the answer: a 5xx, a 429 the first time, or a success
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        number = int(self.path.rstrip("/").rsplit("/", 1)[1])
+        with server_lock:
+            write_arrivals[self.path] = write_arrivals.get(self.path, 0) + 1
+            arrivals = write_arrivals[self.path]
+        if number % 3 == 0:
+            self.answer(write_5xx_statuses[number % len(write_5xx_statuses)], b'{"detail": "Bad Gateway"}')
+        elif number % 3 == 1 and arrivals == 1:
+            self.answer(429, b'{"detail": "Too Many Requests"}', {"Retry-After": "0"})
+        else:
+            self.answer(201, b'[]')
+
+    def answer(self, status, body, headers=None):
+        if status >= 500:
+            with server_lock:
+                server_state["errors"] = server_state["errors"] + 1
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_burst(adapter, url):
+    session = requests.Session()
+    session.mount("http://", adapter)
+    server_state["errors"] = 0
+
+    def get(number):
+        return session.get(f"{url}/api/ipam/ip-addresses/?offset={number}").status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=client_threads) as pool:
+        statuses = list(pool.map(get, range(request_amount)))
+    seconds = time.perf_counter() - started
+    failed = len([status for status in statuses if status != 200])
+    return seconds, failed, server_state["errors"]
+
+
+def check_write_retries(url):
+    session = requests.Session()
+    session.mount("http://", NetboxTransport(client_threads, retries=5, retry_backoff=0.01, retry_backoff_max=0.1))
+    write_arrivals.clear()
+
+    def write(number):
+        method = "POST" if number % 2 == 0 else "PATCH"
+        path = f"/api/ipam/ip-addresses/{number}/"
+        return path, session.request(method, f"{url}{path}", json=[{"address": "10.0.0.1/24"}]).status_code
+
+    with ThreadPoolExecutor(max_workers=client_threads) as pool:
+        results = list(pool.map(write, range(write_amount)))
+    for path, status in results:
+        number = int(path.rstrip("/").rsplit("/", 1)[1])
+        if number % 3 == 0:
+            assert status in write_5xx_statuses and write_arrivals[path] == 1, \
+                f"{path} was answered with a 5xx but sent {write_arrivals[path]} times"
+        elif number % 3 == 1:
+            assert status == 201 and write_arrivals[path] == 2, \
+                f"{path} was answered with a 429 but not sent again, it ended with {status}"
+        else:
+            assert status == 201 and write_arrivals[path] == 1, f"{path} was sent {write_arrivals[path]} times"
+    print(f"\n{write_amount} POSTs and PATCHes: those answered with a 5xx were sent once, "
+          f"those answered with a 429 were sent again")
+
+
+def run_benchmark():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OverloadedNetbox)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    random.seed(1)
+    plain = run_burst(HTTPAdapter(pool_connections=1, pool_maxsize=client_threads, pool_block=True), url)
+    transport = NetboxTransport(client_threads, retries=5, retry_backoff=0.05, retry_backoff_max=1.0,
+                                latency_target=base_latency * 5)
+    controlled = run_burst(transport, url)
+    print(f"{'transport':>16} {'seconds':>9} {'failed requests':>16} {'5xx from server':>16}")
+    for name, (seconds, failed, errors) in (("plain", plain), ("NetboxTransport", controlled)):
+        print(f"{name:>16} {seconds:>9.2f} {failed:>16} {errors:>16}")
+    limiter = transport.limiter
+    print(f"\n{request_amount} requests from {client_threads} threads, the stand-in handles {server_capacity} at "
+          f"full speed and answers 503 from {server_overload} requests in flight")
+    print(f"AimdLimiter: lowered {limiter.decreases} times, to {int(limiter.lowest_limit)} requests in flight "
+          f"at its lowest, ended at {int(limiter.limit)}")
+    check_write_retries(url)
+    server.shutdown()
+
+
+run_benchmark()
@@ -0,0 +1,114 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+# Compares how long matching OpenStack Instances to NetBox VMs takes in nova_to_netboxvms,
+# with the old str(netbox_vm_dictionary.values()) search and with the VmNameIndex lookups
+# Runs without NetBox or OpenStack: python3 scripts/benchmarks/bench_vm_name_index.py
+
+import sys
+import os
+import time
+import uuid
+
+sys.path.insert(1, os.path.join(sys.path[0], '..', '..'))
+from scripts.netbox.indexes import VmNameIndex
+
+vm_amounts = [1000, 10000, 50000]
+new_instance_ratio = 0.05  # Part of the Instances that don't exist in NetBox yet
+max_sampled_instances = 200  # The old search is too slow to run completely for large amounts, so we extrapolate
+
+
+class FakeRecord(object):
+    # Just enough of a pynetbox Record: its repr is its name, like pynetbox does
+    def __init__(self, netbox_id, name, openstack_id, tenant):
+        self.id = netbox_id
+        self.name = name
+        self.custom_fields = {"openstack_id": openstack_id, "openstack_tenant": tenant}
+
+    def __repr__(self):
+        return self.name
+
+
+class FakeInstance(object):
+    def __init__(self, instance_id, name, tenant):
+        self.id = instance_id
+        self.name = name
+        self.custom_name = name[:53] + "_[" + instance_id[:8] + "]"
+        self.tenant = tenant
+
+
+def build_environment(amount):
+    netbox_vm_dictionary = {}
+    instances = []
+    for number in range(amount):
+        instance_id = str(uuid.uuid4())
+        tenant = f"tenant{number % 50}"
+        instances.append(FakeInstance(instance_id, f"instance-{number}", tenant))
+        if number >= amount * new_instance_ratio:
+            netbox_vm_dictionary[instance_id] = FakeRecord(number, f"instance-{number}", instance_id, tenant)
+    return instances, netbox_vm_dictionary
+
+
+def match_before(instances, netbox_vm_dictionary):
+    matches = 0
+    for instance in instances:
+        if instance.id in netbox_vm_dictionary.keys() and instance.custom_name in str(netbox_vm_dictionary.values()):
+            matches = matches + 1
+        elif instance.id in netbox_vm_dictionary.keys():
+            matches = matches + 1
+        elif instance.id not in netbox_vm_dictionary.keys() and instance.name in str(netbox_vm_dictionary.values()):
+            matches = matches + 1
+    return matches
+
+
+def match_after(instances, netbox_vm_dictionary):
+    matches = 0
+    netbox_vm_index = VmNameIndex(netbox_vm_dictionary.values())
+    for instance in instances:
+        if instance.id in netbox_vm_dictionary.keys():
+            netbox_vm_index.claim(netbox_vm_dictionary[instance.id])
+    for instance in instances:
+        if instance.id in netbox_vm_dictionary.keys():
+            matches = matches + 1
+        elif netbox_vm_index.has_name(instance.name):
+            if netbox_vm_index.find_replacement(instance.name, instance.tenant) is not None:
+                matches = matches + 1
+    return matches
+
+
+def run_benchmark():
+    print(f"{'NetBox VMs':>12} {'before (s)':>12} {'after (s)':>12} {'speedup':>10}")
+    for amount in vm_amounts:
+        instances, netbox_vm_dictionary = build_environment(amount)
+        # We sample evenly, so new and existing Instances are represented like they are in the whole set
+        step = max(1, len(instances) // max_sampled_instances)
+        sample = instances[::step]
+        started = time.perf_counter()
+        match_before(sample, netbox_vm_dictionary)
+        before = (time.perf_counter() - started) * len(instances) / len(sample)
+        started = time.perf_counter()
+        match_after(instances, netbox_vm_dictionary)
+        after = time.perf_counter() - started
+        print(f"{amount:>12} {before:>12.2f} {after:>12.4f} {before / after:>9.0f}x")
+    print(f"\nThe 'before' column is extrapolated from {max_sampled_instances} sampled Instances per run")
+
+
+run_benchmark()
@@ -0,0 +1,108 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# Used by openstack-to-netbox.py --daemon, which keeps running and syncs every daemon_interval seconds
+# The process keeps its OpenStack sessions, the NetBox state store and the OpenStack snapshot in memory between cycles,
+# so a cycle only pays for what changed. Our functions sys.exit() on errors, which fails just that cycle
+
+import time
+import random
+
+from scripts.netbox.inventory import inventory
+from scripts.netbox.bulk import reset_bulk_queues
+from scripts.netbox.fielddiff import reset_field_changes
+from scripts.netbox.fingerprints import reset_fingerprints
+from scripts.netbox.statestore import set_mode
+from scripts.openstack.snapshot import set_mode as set_snapshot_mode
+from scripts.openstack.snapshot import discard_snapshots
+from scripts.openstack.tenants import reset_tenants
+from scripts.parse_nova_vm import reset_nova_counters
+from scripts.parse_cinder_volumes import reset_volume_counters
+from scripts.parse_neutron_interfaces import reset_interface_counters
+from scripts.parse_neutron_ipam import reset_address_counters
+from scripts.parse_neutron_networks import reset_network_counters
+from scripts.parse_neutron_vm import reset_neutron_vm_counters
+
+import settings
+nb = settings.nb
+interval = settings.daemon_interval
+jitter = settings.daemon_jitter
+max_backoff = settings.daemon_max_backoff
+
+
+def run_daemon(sync_cycle):
+    failures = 0
+    cycle = 0
+    while True:
+        if netbox_is_healthy():
+            cycle = cycle + 1
+            started = time.monotonic()
+            reset_cycle_state()
+            try:
+                sync_cycle()
+                failures = 0
+                print(f"Sync cycle {cycle} finished succesfully in {time.monotonic() - started:.0f} seconds")
+            except (SystemExit, Exception) as e:
+                failures = failures + 1
+                print(f"Sync cycle {cycle} failed after {time.monotonic() - started:.0f} seconds \n{e}")
+            # --verify-state and --rebuild-state only apply to the first cycle
+            set_mode("incremental")
+            set_snapshot_mode("incremental")
+        else:
+            failures = failures + 1
+        delay = next_delay(failures)
+        print(f"Starting the next sync cycle in {delay:.0f} seconds\n")
+        time.sleep(delay)
+
+
+def netbox_is_healthy():
+    # The status endpoint is cheap, there's no point in starting a cycle when NetBox can't answer it
+    try:
+        nb.status()
+    except Exception as e:
+        print(f"NetBox is unhealthy, skipping this sync cycle \n{e}")
+        return False
+    return True
+
+
+def next_delay(failures):
+    # Every failure in a row doubles the wait, up to max_backoff. The jitter keeps several daemons from
+    # hitting NetBox at the same moment
+    delay = interval
+    if failures:
+        delay = min(max_backoff, interval * 2 ** failures)
+    return max(0, delay + random.uniform(-jitter, jitter))
+
+
+def reset_cycle_state():
+    inventory.reset()
+    reset_bulk_queues()
+    reset_field_changes()
+    reset_fingerprints()
+    discard_snapshots()
+    reset_tenants()
+    reset_nova_counters()
+    reset_volume_counters()
+    reset_interface_counters()
+    reset_address_counters()
+    reset_network_counters()
+    reset_neutron_vm_counters()
@@ -0,0 +1,275 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+import threading
+
+import settings
+nb = settings.nb
+batch_sizes = {"create": settings.netbox_bulk_size, "update": settings.netbox_bulk_update_size}
+update_interval = settings.netbox_bulk_update_interval
+
+# Every sync stage runs in a thread of its own, see scripts/scheduler.py, and has queues of its own
+# That way a stage only sends its own objects, and the errors of their callbacks are raised in that stage
+
+# Amount of sent objects and the seconds spent sending them, per kind of request and NetBox endpoint
+bulk_stats = {"create": {}, "update": {}}
+
+queue_lock = threading.Lock()
+local_state = threading.local()
+
+# The fields NetBox's unique constraints cover, per endpoint. NetBox validates every object of a bulk create before
+# saving any of them, so two new objects with the same key both pass and the second fails on the database with a 500
+# Such an object waits for a later batch instead, where NetBox answers with its usual 400 and its on_error can retry
+unique_keys = {
+    "virtualization.virtual_machines": lambda payload: (str(payload["name"]).lower(), payload.get("cluster"),
+                                                        payload.get("tenant")),
+    "virtualization.virtual_disks": lambda payload: (payload["virtual_machine"], str(payload["name"]).lower()),
+    "virtualization.interfaces": lambda payload: (payload["virtual_machine"], str(payload["name"]).lower()),
+}
+
+
+class StageQueues(object):
+    def __init__(self):
+        # Objects waiting to be sent, per kind of request and NetBox endpoint. For example "virtualization.virtual_machines"
+        self.pending = {"create": {}, "update": {}}
+        # When the oldest object in a queue was queued, so we can flush queues that have been waiting for too long
+        self.pending_since = {"create": {}, "update": {}}
+
+
+class BulkItem(object):
+    def __init__(self, payload, on_done, on_error):
+        self.payload = payload
+        self.on_done = on_done  # Called with the NetBox Record once the object was created or updated
+        self.on_error = on_error  # Called with the Exception that belongs to this specific object
+
+
+class BulkItemError(Exception):
+    # NetBox rejects a whole bulk request when a single object in it is invalid, but it does tell us which one
+    # We give each object its own error, worded like a pynetbox RequestError so the existing checks keep working
+    def __init__(self, message):
+        super().__init__(message)
+        self.error = message
+
+
+def get_endpoint(endpoint_name):
+    # "virtualization.virtual_machines" becomes nb.virtualization.virtual_machines
+    app_name, endpoint = endpoint_name.split(".")
+    return getattr(getattr(nb, app_name), endpoint)
+
+
+def get_stage_queues():
+    if getattr(local_state, "queues", None) is None:
+        local_state.queues = StageQueues()
+    return local_state.queues
+
+
+def queue_create(endpoint_name, payload, on_done, on_error):
+    # Objects are gathered per endpoint and sent as a single list POST once we have a full batch
+    queue_item("create", endpoint_name, payload, on_done, on_error)
+
+
+def queue_update(endpoint_name, payload, on_done, on_error):
+    # Changes are gathered per endpoint and sent as a single list PATCH once we have a full batch,
+    # or once the oldest change has been waiting longer than netbox_bulk_update_interval seconds
+    # The age is checked whenever the stage queues or flushes something, a stage that is busy elsewhere
+    # holds its changes until then, at the latest until its final flush_netbox_queues()
+    queue_item("update", endpoint_name, payload, on_done, on_error)
+
+
+def queue_item(kind, endpoint_name, payload, on_done, on_error):
+    queues = get_stage_queues()
+    queue = queues.pending[kind].setdefault(endpoint_name, [])
+    if not queue:
+        queues.pending_since[kind][endpoint_name] = time.monotonic()
+    queue.append(BulkItem(payload, on_done, on_error))
+    if getattr(local_state, "flushing", False):
+        # We don't flush from within the callbacks of another flush, they'll be picked up by that flush instead
+        return
+    if len(queue) >= batch_sizes[kind]:
+        flush_queue(kind, endpoint_name)
+    else:
+        flush_expired_updates()
+
+
+def flush_expired_updates():
+    # Every update queue of this stage whose oldest change waited netbox_bulk_update_interval seconds or longer
+    queues = get_stage_queues()
+    now = time.monotonic()
+    for name, queue in list(queues.pending["update"].items()):
+        if queue and now - queues.pending_since["update"][name] >= update_interval:
+            flush_queue("update", name)
+
+
+def flush_creates(endpoint_name=None):
+    # Updates go first, a PATCH may rename an object to free the name that one of our creates uses
+    flush_queue("update")
+    flush_queue("create", endpoint_name)
+
+
+def flush_updates(endpoint_name=None):
+    flush_queue("update", endpoint_name)
+
+
+def flush_netbox_queues():
+    # Submit everything this stage still has queued. Call this at the end of every stage,
+    # so the next stage can rely on the objects of this stage existing in NetBox
+    # Updates are sent before creates, see flush_creates()
+    # Created objects may queue updates of their own (MAC-addresses do), so we keep going until both are empty
+    queues = get_stage_queues()
+    while True:
+        flush_creates()
+        if not any(queue for kind in queues.pending.values() for queue in kind.values()):
+            break
+
+
+def flush_queue(kind, endpoint_name=None):
+    queues = get_stage_queues()
+    was_flushing = getattr(local_state, "flushing", False)
+    local_state.flushing = True
+    try:
+        while True:
+            if endpoint_name is not None:
+                endpoint_names = [endpoint_name]
+            else:
+                endpoint_names = [name for name, queue in queues.pending[kind].items() if queue]
+            if not endpoint_names:
+                break
+            for name in endpoint_names:
+                while True:
+                    batch = take_batch(kind, name, queues.pending[kind].get(name, []))
+                    queues.pending_since[kind][name] = time.monotonic()
+                    if not batch:
+                        break
+                    if kind == "create":
+                        # Updates queued by the callbacks of earlier batches still go before this batch
+                        flush_queue("update")
+                    submit_batch(kind, name, batch)
+            if endpoint_name is not None:
+                break
+    finally:
+        local_state.flushing = was_flushing
+
+
+def take_batch(kind, endpoint_name, queue):
+    # Takes the next batch off the queue, leaving objects that share a unique key with one in the batch behind
+    key_function = unique_keys.get(endpoint_name) if kind == "create" else None
+    batch = []
+    later = []
+    batch_keys = set()
+    for item in queue:
+        if len(batch) >= batch_sizes[kind]:
+            later.append(item)
+            continue
+        if key_function is not None:
+            key = key_function(item.payload)
+            if key in batch_keys:
+                later.append(item)
+                continue
+            batch_keys.add(key)
+        batch.append(item)
+    queue[:] = later
+    return batch
+
+
+def submit_batch(kind, endpoint_name, batch):
+    endpoint = get_endpoint(endpoint_name)
+    try:
+        started = time.monotonic()
+        if kind == "create":
+            records = endpoint.create([item.payload for item in batch])
+        else:
+            records = endpoint.update([item.payload for item in batch])
+        add_bulk_stats(kind, endpoint_name, len(batch), time.monotonic() - started)
+    except Exception as e:
+        if len(batch) == 1 or not is_rejected(e):
+            # Anything but a 400 may have reached NetBox after all, a 502 from a proxy or a read timeout doesn't
+            # tell us whether the batch was committed. Sending it again could create every object twice
+            for item in batch:
+                item.on_error(e)
+            return
+        item_errors = get_item_errors(e, len(batch))
+        if item_errors is None:
+            # NetBox rejected the batch without telling us which object is at fault, so we split it until we find it
+            # Bulk updates stop at the first invalid object, so they always end up here
+            middle = len(batch) // 2
+            submit_batch(kind, endpoint_name, batch[:middle])
+            submit_batch(kind, endpoint_name, batch[middle:])
+            return
+        valid_items = []
+        for item, item_error in zip(batch, item_errors):
+            if item_error:
+                item.on_error(BulkItemError(f"The request failed with code {e.req.status_code} "
+                                            f"{e.req.reason}: {item_error}"))
+            else:
+                valid_items.append(item)
+        if valid_items:
+            # The objects that were fine are sent again, without the ones that spoiled the batch
+            submit_batch(kind, endpoint_name, valid_items)
+        return
+    for item, record in zip(batch, records):
+        item.on_done(record)
+
+
+def is_rejected(error):
+    # NetBox runs a bulk request in one transaction, a 400 means none of the objects were saved
+    try:
+        return error.req.status_code == 400
+    except AttributeError:
+        return False
+
+
+def get_item_errors(error, batch_length):
+    # A rejected bulk create returns a list with an error dictionary per object, empty for the valid objects
+    try:
+        item_errors = error.req.json()
+    except Exception:
+        return None
+    if not isinstance(item_errors, list) or len(item_errors) != batch_length:
+        return None
+    return item_errors
+
+
+def add_bulk_stats(kind, endpoint_name, amount, seconds):
+    with queue_lock:
+        stats = bulk_stats[kind].setdefault(endpoint_name, [0, 0.0, 0])
+        stats[0] = stats[0] + amount
+        stats[1] = stats[1] + seconds
+        stats[2] = stats[2] + 1
+
+
+def print_bulk_summary():
+    for kind, verb in (("create", "Created"), ("update", "Updated")):
+        for endpoint_name, (amount, seconds, requests) in sorted(bulk_stats[kind].items()):
+            if seconds > 0:
+                print(f"{verb} {amount} objects in {endpoint_name} using {requests} requests in {seconds:.1f} seconds "
+                      f"({amount / seconds:.1f} objects/s)")
+            else:
+                print(f"{verb} {amount} objects in {endpoint_name} using {requests} requests")
+
+
+def reset_bulk_queues():
+    # For --daemon: a failed sync cycle may leave objects behind, the next cycle works them out again
+    # The queues of the stages went away with their threads, the main thread may still have some of its own
+    local_state.queues = None
+    with queue_lock:
+        for kind in ("create", "update"):
+            bulk_stats[kind].clear()
@@ -21,52 +21,58 @@
 
 import sys
 
+from scripts.netbox.bulk import queue_create
+from scripts.netbox.inventory import inventory
+
 import settings
 nb = settings.nb
 cluster_name = settings.cluster_name
 clusterid = settings.myclusterid
 netboxtagopenstackapiscriptid = settings.netboxtagopenstackapiscriptid
 
+# Every function below queues its object, NetBox receives them in batches through scripts/netbox/bulk.py
+# The on_done and on_error functions run once NetBox has answered for that specific object
+# The records NetBox returns are applied to our inventory, so later stages see them without fetching them again
+
 
-def createnetboxvm(os_vm):
-    try:
-        # Create a Netbox VM based on passed values
-        vm = nb.virtualization.virtual_machines.create(
-            name=os_vm.name,
-            status=os_vm.status,
-            cluster=clusterid,
-            vcpus=os_vm.flavorcpu,
-            memory=os_vm.flavorram,
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_id': os_vm.instance_id, 'openstack_hypervisor': os_vm.hypervisor,
-                           'openstack_flavor': os_vm.flavorname, 'openstack_swap': os_vm.flavorswap,
-                           'openstack_ephemeral': os_vm.flavorephemeral, 'openstack_tenant': os_vm.tenant,
-                           'openstack_hostname': os_vm.hostname},
-            comments=f"Created by OpenStack API script but this time an Instance-based VM for {cluster_name}"
-        )
+def createnetboxvm(os_vm, on_created=None):
+    # on_created receives the new VM, so it can be added to the lookups of the caller
+    def created(vm):
         print(f"Created VM {os_vm.name} in Netbox cluster {cluster_name}.")
-    except Exception as e:
+        inventory.apply("vms", vm)
+        if on_created is not None:
+            on_created(vm)
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Virtual machine name must be unique per cluster." in str(e)):
             os_vm.name = os_vm.custom_name
-            createnetboxvm(os_vm)
+            createnetboxvm(os_vm, on_created)
         else:
             print(f"Something went wrong when creating {os_vm.custom_name} in {cluster_name} \n{e}")
             sys.exit(1)
 
+    # Create a Netbox VM based on passed values
+    queue_create("virtualization.virtual_machines", dict(
+        name=os_vm.name,
+        status=os_vm.status,
+        cluster=clusterid,
+        vcpus=os_vm.flavorcpu,
+        memory=os_vm.flavorram,
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_id': os_vm.instance_id, 'openstack_hypervisor': os_vm.hypervisor,
+                       'openstack_flavor': os_vm.flavorname, 'openstack_swap': os_vm.flavorswap,
+                       'openstack_ephemeral': os_vm.flavorephemeral, 'openstack_tenant': os_vm.tenant,
+                       'openstack_hostname': os_vm.hostname},
+        comments=f"Created by OpenStack API script but this time an Instance-based VM for {cluster_name}"
+    ), created, failed)
+
 
 def createvmdisk(os_volume_object, netbox_vm):
-    try:
-        disker = nb.virtualization.virtual_disks.create(
-            virtual_machine=netbox_vm.id,
-            name=os_volume_object.vol_name,
-            size=os_volume_object.vol_size,
-            comments=f"Created by OpenStack API script but this time its a Virtual Disk for {cluster_name}",
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_volumeid': os_volume_object.vol_id}
-        )
+    def created(disker):
         print(f"Created Volume {os_volume_object.vol_name} for {netbox_vm.name} ")
-    except Exception as e:
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Virtual disk with this Virtual machine and Name already exists." in str(e)):
             os_volume_object.vol_name = os_volume_object.custom_name
@@ -75,17 +81,22 @@ def createvmdisk(os_volume_object, netbox_vm):
             print(f"Unable to create Volume {os_volume_object.vol_name} for {netbox_vm.name} \n{e}")
             sys.exit(1)
 
+    queue_create("virtualization.virtual_disks", dict(
+        virtual_machine=netbox_vm.id,
+        name=os_volume_object.vol_name,
+        size=os_volume_object.vol_size,
+        comments=f"Created by OpenStack API script but this time its a Virtual Disk for {cluster_name}",
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_volumeid': os_volume_object.vol_id}
+    ), created, failed)
+
 
 def createvminterface(os_interface_object, netbox_vm):
-    try:
-        interfacer = nb.virtualization.interfaces.create(
-            virtual_machine=netbox_vm.id,
-            name=os_interface_object.int_name,
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_interfaceid': os_interface_object.int_id}
-        )
+    def created(interfacer):
         print(f"Created interface {os_interface_object.int_name} for Virtual Machine {netbox_vm.name}")
-    except Exception as e:
+        inventory.apply("interfaces", interfacer)
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Interface with this Virtual machine and Name already exists." in str(e)):
             os_interface_object.int_name = os_interface_object.custom_name
@@ -94,67 +105,77 @@ def createvminterface(os_interface_object, netbox_vm):
             print(f"Unable to create interface {os_interface_object.int_name} for Virtual Machine {netbox_vm.name} \n{e}")
             sys.exit(1)
 
+    queue_create("virtualization.interfaces", dict(
+        virtual_machine=netbox_vm.id,
+        name=os_interface_object.int_name,
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_interfaceid': os_interface_object.int_id}
+    ), created, failed)
+
 
-def createnetboxmac(neutron_interface, netbox_interface):
-    try:
-        interfacemaccer = nb.dcim.mac_addresses.create(
-            mac_address=neutron_interface['interfacemac'],
-            assigned_object_id=netbox_interface.id,
-            assigned_object_type="virtualization.vminterface",
-            tags=[netboxtagopenstackapiscriptid],
-            comments=f"Created by OpenStack API script but this time an Interface MAC-address for {cluster_name}"
-        )
+def createnetboxmac(neutron_interface, netbox_interface, on_created):
+    # on_created receives the new MAC-address, so it can be associated with its Interface right away
+    def created(interfacemaccer):
         print(f"Created NetBox MAC-address {neutron_interface['interfacemac']} "
               f"for Interface {netbox_interface.name} ID {netbox_interface.id}.")
-        return interfacemaccer
-    except Exception as e:
+        on_created(interfacemaccer)
+
+    def failed(e):
         print(f"Unable to create NetBox MAC-address {neutron_interface['interfacemac']} "
               f"for NetBox Interface ID {netbox_interface.id} and name {netbox_interface.name}. \n {e}")
         sys.exit(1)
 
+    queue_create("dcim.mac_addresses", dict(
+        mac_address=neutron_interface['interfacemac'],
+        assigned_object_id=netbox_interface.id,
+        assigned_object_type="virtualization.vminterface",
+        tags=[netboxtagopenstackapiscriptid],
+        comments=f"Created by OpenStack API script but this time an Interface MAC-address for {cluster_name}"
+    ), created, failed)
+
 
 def createnetboxvrf(myvrf, openstacknetworkid):
-    try:
-        # We don't retry creation within the Exception, because NetBox doesn't mind duplicate VRF names
-        vrfer = nb.ipam.vrfs.create(
-            name=myvrf,
-            comments=f"Created by OpenStack API script but this time a VRF for {cluster_name}",
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_networkid': openstacknetworkid}
-        )
+    def created(vrfer):
         print(f'Created Netbox VRF {myvrf} because it contains one or more RFC1918 IPs')
-    except Exception as e:
+        inventory.apply("vrfs", vrfer)
+
+    def failed(e):
+        # We don't retry creation here, because NetBox doesn't mind duplicate VRF names
         print(f"Unable to create NetBox VRF {myvrf}. It's OpenStack ID is {openstacknetworkid}. \n {e}")
         sys.exit(1)
 
+    queue_create("ipam.vrfs", dict(
+        name=myvrf,
+        comments=f"Created by OpenStack API script but this time a VRF for {cluster_name}",
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_networkid': openstacknetworkid}
+    ), created, failed)
+
 
 def createnetboxglobalsubnet(openstack_subnet_obj):
-    try:
-        subnetter = nb.ipam.prefixes.create(
-            prefix=openstack_subnet_obj.cidr,
-            status="active",
-            comments=f"Created by OpenStack API script but this time a global subnet for {cluster_name}",
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_subnetid': openstack_subnet_obj.subnet_id}
-        )
+    def created(subnetter):
         print(f"Created global prefix {openstack_subnet_obj.cidr} for OpenStack subnet {openstack_subnet_obj.name} in the global VRF")
-    except Exception as e:
+        inventory.apply("prefixes", subnetter)
+
+    def failed(e):
         print(f"Unable to create NetBox global subnet based on OpenStack Subnet {openstack_subnet_obj.name} ID {openstack_subnet_obj.subnet_id} \n{e}")
         sys.exit(1)
 
+    queue_create("ipam.prefixes", dict(
+        prefix=openstack_subnet_obj.cidr,
+        status="active",
+        comments=f"Created by OpenStack API script but this time a global subnet for {cluster_name}",
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_subnetid': openstack_subnet_obj.subnet_id}
+    ), created, failed)
+
 
 def createnetboxprivatesubnet(openstack_subnet_obj, netbox_vrf):
-    try:
-        subnetter = nb.ipam.prefixes.create(
-            prefix=openstack_subnet_obj.cidr,
-            status="active",
-            vrf=netbox_vrf.id,
-            comments=f"Created by OpenStack API script but this time a private subnet for {cluster_name}",
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_subnetid': openstack_subnet_obj.subnet_id}
-        )
+    def created(subnetter):
         print(f"Created private prefix {openstack_subnet_obj.cidr} for {openstack_subnet_obj.name} in VRF {netbox_vrf.name}")
-    except Exception as e:
+        inventory.apply("prefixes", subnetter)
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Duplicate prefix found in VRF" in str(e)):
             print(f"Error creating NetBox Prefix {openstack_subnet_obj.cidr} in VRF {netbox_vrf.name}. "
@@ -164,58 +185,67 @@ def createnetboxprivatesubnet(openstack_subnet_obj, netbox_vrf):
             print(f"Unable to create NetBox private subnet based on OpenStack Subnet {openstack_subnet_obj.name} ID {openstack_subnet_obj.subnet_id} in VRF {netbox_vrf.name} \n{e}")
             sys.exit(1)
 
+    queue_create("ipam.prefixes", dict(
+        prefix=openstack_subnet_obj.cidr,
+        status="active",
+        vrf=netbox_vrf.id,
+        comments=f"Created by OpenStack API script but this time a private subnet for {cluster_name}",
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_subnetid': openstack_subnet_obj.subnet_id}
+    ), created, failed)
+
 
 def createglobalipamip(address_object):
     # We create Netbox IP address on vm_name on interface 'interface'
-    try:
-        addresserwan = nb.ipam.ip_addresses.create(
-            address=address_object.address,
-            status=address_object.status,
-            virtual_machine=address_object.nb_vm_id,
-            interface=address_object.nb_int_id,
-            comments=f"Created by OpenStack API script but this time a global IP-address for {cluster_name}",
-            assigned_object_type="virtualization.vminterface",
-            assigned_object_id=address_object.nb_int_id,
-            tags=[netboxtagopenstackapiscriptid]
-        )
+    def created(addresserwan):
         print(f"Created WAN IP {address_object.address} for Netbox VM {address_object.nb_vm_name}, interface {address_object.nb_int_name}")
-    except Exception as e:
+        inventory.apply_address(addresserwan)
+
+    def failed(e):
         print(f"Unable to create WAN IP {address_object.address} for Netbox VM {address_object.nb_vm_name}, interface {address_object.nb_int_name} \n{e}")
         sys.exit(1)
 
+    queue_create("ipam.ip_addresses", dict(
+        address=address_object.address,
+        status=address_object.status,
+        virtual_machine=address_object.nb_vm_id,
+        interface=address_object.nb_int_id,
+        comments=f"Created by OpenStack API script but this time a global IP-address for {cluster_name}",
+        assigned_object_type="virtualization.vminterface",
+        assigned_object_id=address_object.nb_int_id,
+        tags=[netboxtagopenstackapiscriptid]
+    ), created, failed)
+
 
 def createlanipamip(address_object, netbox_vrf):
-    try:
-        addresserlan = nb.ipam.ip_addresses.create(
-            address=address_object.address,
-            status=address_object.status,
-            virtual_machine=address_object.nb_vm_id,
-            comments=f"Created by OpenStack API script but this time a private IP-address for {cluster_name}",
-            assigned_object_type="virtualization.vminterface",
-            assigned_object_id=address_object.nb_int_id,
-            vrf=netbox_vrf.id,
-            tags=[netboxtagopenstackapiscriptid]
-        )
+    def created(addresserlan):
         print(f"Created LAN IP {address_object.address} for NetBox VM {address_object.nb_vm_name}, "
               f"interface {address_object.nb_int_name} in VRF {netbox_vrf.name}")
-    except Exception as e:
+        inventory.apply_address(addresserlan)
+
+    def failed(e):
         print(f"Unable to create LAN IP {address_object.address} for NetBox VM {address_object.nb_vm_name}, "
               f"interface {address_object.nb_int_name} in VRF {netbox_vrf.name} \n{e}")
         sys.exit(1)
 
+    queue_create("ipam.ip_addresses", dict(
+        address=address_object.address,
+        status=address_object.status,
+        virtual_machine=address_object.nb_vm_id,
+        comments=f"Created by OpenStack API script but this time a private IP-address for {cluster_name}",
+        assigned_object_type="virtualization.vminterface",
+        assigned_object_id=address_object.nb_int_id,
+        vrf=netbox_vrf.id,
+        tags=[netboxtagopenstackapiscriptid]
+    ), created, failed)
+
 
 def createnetboxrouter(router):
-    try:
-        neutroner = nb.virtualization.virtual_machines.create(
-            name=router.name,
-            status=router.status,
-            cluster=clusterid,
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_id': router.router_id, 'openstack_tenant': router.tenant},
-            comments=f"Created by OpenStack API script but this time a router-based VM for {cluster_name}"
-        )
+    def created(neutroner):
         print(f"Created router VM {router.name} in NetBox cluster {cluster_name}.")
-    except Exception as e:
+        inventory.apply("vms", neutroner)
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Virtual machine name must be unique per cluster." in str(e)):
             # If the router does not have a unique NetBox name, create it with our custom name instead
@@ -225,19 +255,30 @@ def createnetboxrouter(router):
             print(f"Unable to create router {router.name} in NetBox cluster {cluster_name} \n{e}")
             sys.exit(1)
 
+    queue_create("virtualization.virtual_machines", dict(
+        name=router.name,
+        status=router.status,
+        cluster=clusterid,
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_id': router.router_id, 'openstack_tenant': router.tenant},
+        comments=f"Created by OpenStack API script but this time a router-based VM for {cluster_name}"
+    ), created, failed)
+
 
 def createnetboxagent(name, agentid):
-    try:
-        neutronerdeux = nb.virtualization.virtual_machines.create(
-            name=name,
-            status="active",  # Assume the agent state is active
-            cluster=clusterid,
-            tags=[netboxtagopenstackapiscriptid],
-            custom_fields={'openstack_id': agentid},
-            comments=f"Created by OpenStack API script but this time a Neutron DHCP-agent based VM for {cluster_name}"
-        )
+    def created(neutronerdeux):
         print(f"Created Neutron server {name} for DHCP-service ID {agentid} Netbox cluster {cluster_name}.")
-    except Exception as e:
+        inventory.apply("vms", neutronerdeux)
+
+    def failed(e):
         print(f"Unable to create DHCP agent {name} fpr DHCP-service ID {agentid} in Netbox cluster {cluster_name} \n{e}")
         sys.exit(1)
 
+    queue_create("virtualization.virtual_machines", dict(
+        name=name,
+        status="active",  # Assume the agent state is active
+        cluster=clusterid,
+        tags=[netboxtagopenstackapiscriptid],
+        custom_fields={'openstack_id': agentid},
+        comments=f"Created by OpenStack API script but this time a Neutron DHCP-agent based VM for {cluster_name}"
+    ), created, failed)
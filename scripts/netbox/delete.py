@@ -0,0 +1,194 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import time
+import ipaddress
+
+from scripts.netbox.bulk import get_endpoint
+from scripts.netbox.fetchinfo import nbfetchprefixoccupancy
+from scripts.netbox.fetchinfo import nbfetchvrfcounts
+from scripts.netbox.indexes import build_interface_address_map
+
+import settings
+nb = settings.nb
+cluster_name = settings.cluster_name
+delete_delay = settings.netbox_delete_delay
+
+# Used by openstack-to-netbox.py --reconcile: after creating and updating, we delete what no longer exists in OpenStack
+# Everything is decided from the information fetched at the start of the run, which our creates and updates kept current
+# Children are deleted before their parents, so nothing we want to delete has been removed by NetBox already
+
+
+def reconcile_deletes(myinstances, neutron_routers, neutron_agents, cinder_volumes, neutron_interfaces, neutron_floats,
+                      netbox_vm_dictionary, netbox_volume_dictionary, netbox_interface_dictionary,
+                      netbox_lan_address_dictionary, netbox_wan_address_dictionary, netbox_prefix_dictionary,
+                      netbox_vrf_dictionary):
+    stale_vms = find_stale_vms(myinstances, neutron_routers, neutron_agents, netbox_vm_dictionary)
+    stale_vm_ids = set(vm.id for vm in stale_vms)
+    stale_disks = find_stale_disks(cinder_volumes, netbox_volume_dictionary, stale_vm_ids)
+    stale_interfaces, gone_interface_ids = find_stale_interfaces(neutron_interfaces, netbox_interface_dictionary,
+                                                                 stale_vm_ids)
+    netbox_addresses = unique_records(list(netbox_lan_address_dictionary.values()) +
+                                      list(netbox_wan_address_dictionary.values()))
+    stale_addresses = find_stale_addresses(neutron_interfaces, neutron_floats, netbox_addresses,
+                                           netbox_interface_dictionary, gone_interface_ids)
+    empty_prefixes = find_empty_prefixes(netbox_prefix_dictionary, stale_addresses)
+    deletenetboxobjects("ipam.ip_addresses", "IP-addresses", stale_addresses)
+    deletenetboxobjects("virtualization.interfaces", "Interfaces", stale_interfaces)
+    deletenetboxobjects("virtualization.virtual_disks", "Virtual Disks", stale_disks)
+    deletenetboxobjects("virtualization.virtual_machines", "Virtual Machines", stale_vms)
+    deletenetboxobjects("ipam.prefixes", "Prefixes", empty_prefixes)
+    # NetBox refuses to delete a VRF that still holds addresses or Prefixes, so we ask it for the counts after our deletes
+    empty_vrfs = find_empty_vrfs(netbox_vrf_dictionary)
+    deletenetboxobjects("ipam.vrfs", "VRFs", empty_vrfs)
+
+
+def unique_records(records):
+    # Our dictionaries may hold a record under more than one key
+    unique = {}
+    for record in records:
+        unique[record.id] = record
+    return list(unique.values())
+
+
+def find_stale_vms(myinstances, neutron_routers, neutron_agents, netbox_vm_dictionary):
+    # NetBox VMs based on Instances, routers and DHCP agents that OpenStack no longer has
+    openstack_ids = set(str(server.id) for server in myinstances)
+    openstack_ids.update(str(router) for router in neutron_routers.keys())
+    openstack_ids.update(str(agent) for agent in neutron_agents.keys())
+    stale_vms = []
+    for nb_vm_os_id, netbox_vm in netbox_vm_dictionary.items():
+        if nb_vm_os_id not in openstack_ids:
+            print(f"Queueing Netbox VM {netbox_vm.name} ID {netbox_vm.id} for deletion. OpenStack ID was {nb_vm_os_id}")
+            stale_vms.append(netbox_vm)
+    return unique_records(stale_vms)
+
+
+def find_stale_disks(cinder_volumes, netbox_volume_dictionary, stale_vm_ids):
+    stale_disks = []
+    for nb_vol_os_id, netbox_disk in netbox_volume_dictionary.items():
+        if netbox_disk.virtual_machine.id in stale_vm_ids:
+            # NetBox deletes the Virtual Disks of a VM together with the VM
+            continue
+        if nb_vol_os_id not in cinder_volumes.keys():
+            print(f"Queueing Netbox Virtual Disk {netbox_disk.name} VM {netbox_disk.virtual_machine.name} "
+                  f"as it is not attached to anything")
+            stale_disks.append(netbox_disk)
+    return unique_records(stale_disks)
+
+
+def find_stale_interfaces(neutron_interfaces, netbox_interface_dictionary, stale_vm_ids):
+    # Returns the Interfaces to delete, and the NetBox IDs of every Interface that will be gone after our deletes
+    stale_interfaces = []
+    gone_interface_ids = set()
+    for nb_int_os_id, netbox_interface in netbox_interface_dictionary.items():
+        if netbox_interface.virtual_machine.id in stale_vm_ids:
+            # NetBox deletes the Interfaces of a VM together with the VM
+            gone_interface_ids.add(netbox_interface.id)
+        elif nb_int_os_id not in neutron_interfaces.keys():
+            print(f"Queueing Interface {netbox_interface.name} ID {netbox_interface.id} of VM "
+                  f"{netbox_interface.virtual_machine.name} as it is not attached to anything of relevance")
+            stale_interfaces.append(netbox_interface)
+            gone_interface_ids.add(netbox_interface.id)
+    return unique_records(stale_interfaces), gone_interface_ids
+
+
+def find_stale_addresses(neutron_interfaces, neutron_floats, netbox_addresses, netbox_interface_dictionary,
+                         gone_interface_ids):
+    # Only addresses assigned to Interfaces of our cluster are ours to delete
+    netbox_interfaces = dict((netbox_interface.id, netbox_interface)
+                             for netbox_interface in netbox_interface_dictionary.values())
+    neutron_addresses = build_interface_address_map(neutron_interfaces, neutron_floats)
+    stale_addresses = []
+    for netbox_address in netbox_addresses:
+        if not netbox_address.tagged:
+            # Like tool_nb_cleanup_unused.py, we only delete addresses with the openstack-api-script Tag
+            continue
+        netbox_interface = netbox_interfaces.get(netbox_address.assigned_object_id)
+        if netbox_interface is None:
+            continue
+        nb_interface_os_id = netbox_interface.custom_fields['openstack_interfaceid']
+        unprefixed_ip = netbox_address.address.split('/')[0]  # NB always gives along the prefix, but Neutron doesn't
+        if netbox_interface.id in gone_interface_ids:
+            # NetBox deletes these along with their Interface, we list them anyway so the Prefix emptiness check
+            # leaves them out. Deleting the addresses first also keeps the VRF counts we ask for afterwards accurate
+            print(f"Queueing Address {netbox_address.address} as its Interface {netbox_interface.name} will be deleted")
+            stale_addresses.append(netbox_address)
+        elif unprefixed_ip not in neutron_addresses.get(nb_interface_os_id, set()):
+            print(f"Queueing Address {netbox_address.address} as it does not exist on "
+                  f"OpenStack Interface {nb_interface_os_id}")
+            stale_addresses.append(netbox_address)
+    return stale_addresses
+
+
+def find_empty_prefixes(netbox_prefix_dictionary, stale_addresses):
+    # LAN Prefixes created for OpenStack subnets, that contain no IP-addresses once our stale addresses are deleted
+    # Like tool_nb_cleanup_unused.py, we leave global Prefixes alone
+    candidates = [prefix for prefix in unique_records(netbox_prefix_dictionary.values())
+                  if prefix.vrf is not None and
+                  prefix.custom_fields["openstack_subnetid"] is not None and
+                  prefix.custom_fields["openstack_subnetid"] != "" and
+                  ipaddress.ip_network(prefix.prefix).is_private]
+    if not candidates:
+        return []
+    occupancy = nbfetchprefixoccupancy(candidates, ignored_address_ids=[address.id for address in stale_addresses])
+    empty_prefixes = []
+    for prefix in candidates:
+        if occupancy.is_empty(prefix.prefix, prefix.vrf.id):
+            print(f"Queueing LAN Prefix {prefix.prefix} ID {prefix.id} because it contains no IP-addresses. "
+                  f"OpenStack ID is or was {prefix.custom_fields['openstack_subnetid']}")
+            empty_prefixes.append(prefix)
+    return empty_prefixes
+
+
+def find_empty_vrfs(netbox_vrf_dictionary):
+    # OpenStack VRFs that contain no IP-addresses or Prefixes, according to NetBox once our other deletes are done
+    # The counts in our dictionary are from the start of the run, or from the state store
+    candidates = [vrf for vrf in unique_records(netbox_vrf_dictionary.values())
+                  if "OpenStack API script" in str(vrf.tags)]
+    if not candidates:
+        return []
+    vrf_counts = nbfetchvrfcounts([vrf.id for vrf in candidates])
+    empty_vrfs = []
+    for vrf in candidates:
+        if vrf_counts.get(vrf.id) == (0, 0):
+            print(f"Queueing NetBox VRF {vrf.name} for deletion because it contains no IP-adresses.")
+            empty_vrfs.append(vrf)
+    return empty_vrfs
+
+
+def deletenetboxobjects(endpoint_name, description, records):
+    # A single bulk DELETE per kind of object, like tool_nb_cleanup_unused.py we wait a bit before deleting
+    # so the IDs can be read and the run interrupted. See netbox_delete_delay
+    deleteids = [record.id for record in records]
+    try:
+        if not deleteids:
+            print(f"There were no NetBox {description} to delete!\n")
+        else:
+            print(f"\nDeleting the following NetBox {description} IDs in cluster {cluster_name} in {delete_delay:.0f} "
+                  f"seconds: \n{deleteids}\n")
+            time.sleep(delete_delay)
+            get_endpoint(endpoint_name).delete(deleteids)
+            print(f"Succesfully deleted old NetBox {description}.\n")
+    except Exception as e:
+        print(f"Unable to delete NetBox {description} \n{deleteids} \n{e}")
+        sys.exit(1)
@@ -22,33 +22,50 @@
 import sys
 import ipaddress
 
+from pynetbox.core.query import Request
+
+from scripts.netbox.inventory import inventory
+from scripts.netbox.indexes import address_entry_from_dict
+from scripts.netbox.indexes import AddressIndex
+from scripts.netbox.indexes import PrefixOccupancyIndex
+from scripts.netbox.statestore import fetch_records
+from scripts.netbox.statestore import fetch_dicts
+from scripts.netbox.statestore import request_dicts
+
 import settings
 nb = settings.nb
 cluster_name = settings.cluster_name
+myclusterid = settings.myclusterid
+netbox_address_fetch = settings.netbox_address_fetch
+
+# The IP-address fields our sync uses, NetBox leaves out everything else
+address_fields = "id,address,status,vrf,assigned_object_id,tags,last_updated"
+address_page_size = 1000  # NetBox's default MAX_PAGE_SIZE
+filter_chunk_size = 50  # Prefixes or addresses per request, to keep URLs reasonably short
+# Fields that change without renewing last_updated, see scripts/netbox/statestore.py
+# Assigning a MAC-address to an Interface, or an address to a VRF, only changes the MAC-address or the address
+interface_live_fields = "mac_address,mac_addresses,primary_mac_address"
+vrf_live_fields = "ipaddress_count,prefix_count"
 
 
 def nbfetchvms():
     try:
-        netbox_vm_dictionary = {}
-        for nbvm in nb.virtualization.virtual_machines.filter(tag="openstack-api-script", cluster=cluster_name):
-            netbox_vm_dictionary[nbvm.custom_fields["openstack_id"]] = nbvm
+        # The VMs are fetched once per run by our inventory, which nbfetchvolumes() and nbfetchinterfaces() share
+        netbox_vm_dictionary = inventory.track("vms", inventory.vm_dictionary())
     except Exception as e:
         print(f"Unable to collect Netbox Virtual Machines \n{e}")
         sys.exit(1)
-    print("Fetched NetBox Virtual Machines")
     return netbox_vm_dictionary
 
 
 def nbfetchvolumes():
     try:
-        # Collect all IDs of VMs in the Netbox cluster
-        netboxvolumes = nb.virtualization.virtual_disks.filter(tag="openstack-api-script")
-        netboxclustervms = nb.virtualization.virtual_machines.filter(tag="openstack-api-script", cluster=cluster_name)
-        netboxclustervmids = set()
+        # NetBox can't filter Virtual Disks by cluster, it ignores filters it doesn't know. We fetch every tagged one,
+        # those that didn't change come from our state store
+        netboxvolumes = fetch_records(nb.virtualization.virtual_disks, {"tag": "openstack-api-script"})
+        # NB Virtual Disks lack information, so we also check them against the IDs of the Clusters' tagged VMs
+        netboxclustervmids = inventory.vm_ids()
         netbox_vol_dictionary = {}
-        for vm in netboxclustervms:
-            # NB Virtual Disks lack information, so first collect the Clusters' VM IDs instead
-            netboxclustervmids.add(str(vm.id))
         for nbvol in netboxvolumes:
             if str(nbvol.virtual_machine.id) in netboxclustervmids:
                 # Check whether NB Virtual Disks are bound to NB VMs in the cluster, and add them to the set if so
@@ -62,12 +79,13 @@ def nbfetchvolumes():
 
 def nbfetchinterfaces():
     try:
-        netboxclustervmids = set()
-        netboxinterfacestotal = nb.virtualization.interfaces.filter(tag="openstack-api-script")
+        # NetBox only sends us the Interfaces of our own cluster, those that didn't change come from our state store
+        netboxinterfacestotal = fetch_records(nb.virtualization.interfaces,
+                                              {"tag": "openstack-api-script", "cluster_id": myclusterid},
+                                              live_fields=interface_live_fields)
+        # NB Interfaces lack information, so we also check them against the IDs of the Clusters' tagged VMs
+        netboxclustervmids = inventory.vm_ids()
         netbox_int_dictionary = {}
-        for vm in nb.virtualization.virtual_machines.filter(tag="openstack-api-script", cluster=cluster_name):
-            # NB Interfaces lack information, so first collect the Clusters' VM IDs instead
-            netboxclustervmids.add(str(vm.id))
         for nbinterface in netboxinterfacestotal:
             if str(nbinterface.virtual_machine.id) in netboxclustervmids:
                 # Collect Netbox OpenStack Interface IDs, only if said interface is bound to a VM that is in our cluster
@@ -76,12 +94,13 @@ def nbfetchinterfaces():
         print(f"Unable to collect Netbox Interfaces \n{e}")
         sys.exit(1)
     print("Fetched NetBox Interfaces")
-    return netbox_int_dictionary
+    # Interfaces we create or update from here on are added to this dictionary, see scripts/netbox/inventory.py
+    return inventory.track("interfaces", netbox_int_dictionary)
 
 
 def nbfetchvrfs():
     try:
-        netboxvrfstotal = nb.ipam.vrfs.all()
+        netboxvrfstotal = fetch_records(nb.ipam.vrfs, {}, live_fields=vrf_live_fields)
         # We fetch all VRFs and check all of them for potential OpenStack Neutron IDs
         netbox_vrf_dictionary = {}
         for nbvrf in netboxvrfstotal:
@@ -104,12 +123,12 @@ def nbfetchvrfs():
         print(f"Unable to collect Netbox VRFs \n{e}")
         sys.exit(1)
     print("Fetched NetBox VRFs")
-    return netbox_vrf_dictionary
+    return inventory.track("vrfs", netbox_vrf_dictionary)
 
 
 def nbfetchsubnets():
     try:
-        netboxprefixstotal = nb.ipam.prefixes.filter()  # Prefixes don't necessarily have the tag, in case of WAN subnets
+        netboxprefixstotal = fetch_records(nb.ipam.prefixes, {})  # Prefixes don't necessarily have the tag, in case of WAN subnets
         netbox_prefix_dictionary = {}
         for subnet in netboxprefixstotal:
             if ipaddress.ip_network(subnet.prefix).is_global:
@@ -126,30 +145,114 @@ def nbfetchsubnets():
         print(f"Unable to collect Netbox Prefixes \n{e}")
         sys.exit(1)
     print("Fetched NetBox Prefixes")
-    return netbox_prefix_dictionary
+    return inventory.track("prefixes", netbox_prefix_dictionary)
+
+
+def stream_addresses(filters):
+    # We handle every page of addresses as it comes in, rather than building pynetbox Records for all of them first
+    request = Request(base=nb.ipam.ip_addresses.url, http_session=nb.http_session, token=nb.token,
+                      filters=dict(filters, fields=address_fields), limit=address_page_size)
+    for ip in request.get():
+        yield address_entry_from_dict(ip)
+
+
+def nbfetchtaggedaddresses():
+    # All private addresses we create for OpenStack have the "openstack-api-script" Tag
+    try:
+        if netbox_address_fetch == "all":
+            # Every address in NetBox, the way this script used to fetch them
+            address_filters = {}
+        else:
+            address_filters = {"tag": "openstack-api-script"}
+        # Addresses that didn't change come from our state store
+        netboxaddresses = [address_entry_from_dict(ip) for ip in fetch_dicts(nb.ipam.ip_addresses, address_filters,
+                                                                             address_fields)]
+    except Exception as e:
+        print(f"Unable to collect Netbox addresses \n{e}")
+        sys.exit(1)
+    print(f"Fetched {len(netboxaddresses)} NetBox addresses to start with")
+    return netboxaddresses
+
+
+def global_address_filters(neutron_subnet_dictionary, neutron_float_dictionary):
+    # WAN addresses don't necessarily have the tag because we want to play nice
+    # The only ones that can matter are inside the global OpenStack subnets, or are one of our Floating-IPs
+    global_networks = set()
+    for subnet in neutron_subnet_dictionary.values():
+        if ipaddress.ip_network(subnet['subnet_cidr']).is_global:
+            global_networks.add(ipaddress.ip_network(subnet['subnet_cidr']))
+    float_ips = set()
+    for osfloat in neutron_float_dictionary.values():
+        float_ip = ipaddress.ip_address(osfloat['floatip'])
+        if float_ip.is_global and not any(float_ip in network for network in global_networks):
+            # A non-admin user may not see the subnets of the external network, so we ask for the address itself
+            float_ips.add(str(float_ip))
+    global_cidrs = sorted(str(network) for network in global_networks)
+    for chunk in range(0, len(global_cidrs), filter_chunk_size):
+        yield {"parent": global_cidrs[chunk:chunk + filter_chunk_size]}
+    float_ips = sorted(float_ips)
+    for chunk in range(0, len(float_ips), filter_chunk_size):
+        yield {"address": float_ips[chunk:chunk + filter_chunk_size]}
 
 
-def nbfetchaddresses():
-    # All private addresses we create for OpenStack have the "openstack-api-script"
-    # But WAN addresses don't necessarily have the tag because we want to play nice
-    # So we create 2 dictionaries, one with all filtered LAN IPs and another with just all the global ones
+def nbfetchaddresses(tagged_addresses, neutron_subnet_dictionary, neutron_float_dictionary):
+    # We add the global addresses that can matter to the tagged ones from nbfetchtaggedaddresses()
+    # and create 2 dictionaries, one with all filtered LAN IPs and another with just all the global ones
+    # LAN IPs are keyed by VRF and address, because the same private address is often used in many VRFs
     try:
-        netboxaddresses = nb.ipam.ip_addresses.filter()
-        netbox_lan_addresses_dic = {}
+        netbox_lan_addresses_dic = AddressIndex()
         netbox_wan_addresses_dic = {}
-        for ip in netboxaddresses:
-            prefixed_ip = str(ip.address)
-            unprefixed_ip = prefixed_ip.split('/', 1)[0]
-            # We use unprefixed_ip because NB always includes the subnet when returning address data
-            if "OpenStack API script" in str(ip.tags) and ipaddress.ip_address(unprefixed_ip).is_private:
-                # We over-fetch here, in case you have multiple OpenStack clusters
-                netbox_lan_addresses_dic[unprefixed_ip] = ip
-            elif ipaddress.ip_address(unprefixed_ip).is_global:
-                netbox_wan_addresses_dic[unprefixed_ip] = ip
-            else:
-                pass
+        netboxaddresses = [tagged_addresses]
+        if netbox_address_fetch != "all":
+            netboxaddresses += [stream_addresses(filters)
+                                for filters in global_address_filters(neutron_subnet_dictionary,
+                                                                      neutron_float_dictionary)]
+        for addresses in netboxaddresses:
+            for ip in addresses:
+                unprefixed_ip = ip.address.split('/', 1)[0]
+                # We use unprefixed_ip because NB always includes the subnet when returning address data
+                if ip.tagged and ipaddress.ip_address(unprefixed_ip).is_private:
+                    # We over-fetch here, in case you have multiple OpenStack clusters
+                    netbox_lan_addresses_dic.add(ip)
+                elif ipaddress.ip_address(unprefixed_ip).is_global:
+                    netbox_wan_addresses_dic[unprefixed_ip] = ip
+                else:
+                    pass
     except Exception as e:
         print(f"Unable to collect Netbox addresses \n{e}")
         sys.exit(1)
     print("Fetched NetBox addresses")
-    return netbox_lan_addresses_dic, netbox_wan_addresses_dic
+    return inventory.track("lan addresses", netbox_lan_addresses_dic), inventory.track("wan addresses", netbox_wan_addresses_dic)
+
+
+def nbfetchprefixoccupancy(prefixes, ignored_address_ids=()):
+    # Fetch the addresses inside the given Prefixes, a chunk of Prefixes per request, to check which are empty
+    # Addresses in ignored_address_ids are left out, for example because we're about to delete them
+    prefix_cidrs = sorted(set(str(prefix.prefix) for prefix in prefixes))
+    ignored_address_ids = set(ignored_address_ids)
+    addresses = []
+    try:
+        for chunk in range(0, len(prefix_cidrs), filter_chunk_size):
+            for ip in stream_addresses({"parent": prefix_cidrs[chunk:chunk + filter_chunk_size]}):
+                if ip.id not in ignored_address_ids:
+                    addresses.append(ip)
+    except Exception as e:
+        print(f"Unable to collect Netbox addresses inside Prefixes \n{e}")
+        sys.exit(1)
+    print(f"Fetched {len(addresses)} addresses inside {len(prefix_cidrs)} Prefixes")
+    return PrefixOccupancyIndex(addresses)
+
+
+def nbfetchvrfcounts(vrf_ids):
+    # The current amount of IP-addresses and Prefixes per VRF ID, always asked from NetBox itself
+    vrf_ids = sorted(set(vrf_ids))
+    vrf_counts = {}
+    try:
+        for chunk in range(0, len(vrf_ids), filter_chunk_size):
+            for vrf in request_dicts(nb.ipam.vrfs, {"id": vrf_ids[chunk:chunk + filter_chunk_size]},
+                                     f"id,{vrf_live_fields}"):
+                vrf_counts[vrf["id"]] = (vrf["ipaddress_count"], vrf["prefix_count"])
+    except Exception as e:
+        print(f"Unable to count the addresses and Prefixes inside Netbox VRFs \n{e}")
+        sys.exit(1)
+    return vrf_counts
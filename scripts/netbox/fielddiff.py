@@ -0,0 +1,103 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+# Works out which fields of a NetBox object actually have to change, so our PATCHes only carry those
+# Every field NetBox receives ends up in its change log, webhooks and search index, even when its value is the same
+# Nothing in here talks to NetBox itself
+
+import threading
+
+from pynetbox.core.response import Record
+
+# Amount of changed values per NetBox endpoint and field, custom fields are counted per key like "custom_fields.openstack_tenant"
+field_changes = {}
+field_changes_lock = threading.Lock()
+
+
+def netbox_value(value):
+    # pynetbox gives choices like status as {value, label} and related objects as nested objects with an ID
+    # We compare their value or ID, which is also what we send
+    if isinstance(value, dict):
+        if "id" in value:
+            return value["id"]
+        if "value" in value:
+            return value["value"]
+    return value
+
+
+def current_value(current, field):
+    if current is None:
+        return None
+    if isinstance(current, dict):
+        value = current.get(field)
+    else:
+        value = getattr(current, field, None)
+    if field == "custom_fields":
+        return value
+    return netbox_value(value)
+
+
+def changed_fields(endpoint_name, desired, current):
+    # desired is the payload we would send for the NetBox object, current is the object as we fetched it:
+    # a pynetbox Record, an object with the same attribute names or None when we don't know it
+    # Returns only the fields of desired that differ, and within custom_fields only the keys that differ
+    # NetBox keeps the custom fields we leave out of a PATCH as they were
+    if isinstance(current, Record):
+        # dict() only reads what NetBox already sent us. Asking a Record for an attribute it doesn't have,
+        # even through hasattr(), makes pynetbox fetch the whole object again
+        current = dict(current)
+    changes = {}
+    for field, value in desired.items():
+        if field == "custom_fields":
+            current_custom_fields = current_value(current, "custom_fields") or {}
+            custom_changes = dict((key, custom_value) for key, custom_value in value.items()
+                                  if current_custom_fields.get(key) != custom_value)
+            if custom_changes:
+                changes["custom_fields"] = custom_changes
+        elif current is None or current_value(current, field) != value:
+            changes[field] = value
+    add_field_changes(endpoint_name, changes)
+    return changes
+
+
+def add_field_changes(endpoint_name, changes):
+    with field_changes_lock:
+        counts = field_changes.setdefault(endpoint_name, {})
+        for field, value in changes.items():
+            if field == "custom_fields":
+                for key in value.keys():
+                    counts[f"custom_fields.{key}"] = counts.get(f"custom_fields.{key}", 0) + 1
+            else:
+                counts[field] = counts.get(field, 0) + 1
+
+
+def print_field_change_summary():
+    # Shows which fields drift between OpenStack and NetBox the most
+    for endpoint_name, counts in sorted(field_changes.items()):
+        summary = ", ".join(f"{field}: {amount}" for field, amount in sorted(counts.items(),
+                                                                             key=lambda count: count[1], reverse=True))
+        print(f"Changed fields in {endpoint_name}: {summary}")
+
+
+def reset_field_changes():
+    # For --daemon, every sync cycle prints its own summary
+    with field_changes_lock:
+        field_changes.clear()
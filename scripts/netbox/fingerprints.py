@@ -0,0 +1,104 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# Remembers a fingerprint of the OpenStack state each NetBox object had, the last time we found them to be equal
+# When neither the OpenStack state nor the NetBox object changed since, we can skip comparing them altogether
+# The NetBox side is covered by the ID and last_updated moment of the object, so edits in NetBox are still corrected
+# They are kept in the state store, see scripts/netbox/statestore.py
+
+import json
+import hashlib
+import threading
+
+from scripts.netbox.statestore import read_fingerprints
+from scripts.netbox.statestore import write_fingerprints
+
+import settings
+state_file = settings.netbox_state_file
+
+fingerprint_lock = threading.Lock()
+previous_fingerprints = None  # As loaded from the state store, per kind of object and OpenStack key
+current_fingerprints = {}  # What we will save, only objects we found unchanged this run
+fingerprint_hits = {}
+
+
+def object_fingerprint(os_object, *related_ids):
+    # A stable hash over the desired state, like a CreateNovaVmObject, plus the NetBox objects it should be bound to
+    state = json.dumps([vars(os_object), related_ids], sort_keys=True, default=str)
+    return hashlib.sha1(state.encode("utf-8")).hexdigest()
+
+
+def netbox_state(netbox_object):
+    # NetBox renews last_updated on every change, including those made by hand
+    last_updated = getattr(netbox_object, "last_updated", None)
+    if last_updated is None:
+        return None
+    return [netbox_object.id, str(last_updated)]
+
+
+def is_unchanged(kind, key, fingerprint, netbox_object):
+    global previous_fingerprints
+    if not state_file:
+        return False
+    state = netbox_state(netbox_object)
+    with fingerprint_lock:
+        if previous_fingerprints is None:
+            previous_fingerprints = read_fingerprints()
+        remembered = previous_fingerprints.get(kind, {}).get(key)
+        if state is None or remembered is None or remembered != [fingerprint] + state:
+            return False
+        # We carry it over to this run, objects we don't see anymore are dropped from the file
+        current_fingerprints.setdefault(kind, {})[key] = remembered
+        fingerprint_hits[kind] = fingerprint_hits.get(kind, 0) + 1
+        return True
+
+
+def remember(kind, key, fingerprint, netbox_object):
+    # Only call this once the OpenStack state and the NetBox object turned out to be equal
+    state = netbox_state(netbox_object)
+    if not state_file or fingerprint is None or state is None:
+        return
+    with fingerprint_lock:
+        current_fingerprints.setdefault(kind, {})[key] = [fingerprint] + state
+
+
+def save_fingerprints():
+    global previous_fingerprints
+    if not state_file:
+        return
+    with fingerprint_lock:
+        try:
+            write_fingerprints(current_fingerprints)
+            # The next sync cycle of --daemon doesn't have to read them back
+            previous_fingerprints = dict(current_fingerprints)
+        except Exception as e:
+            # A missing fingerprint only costs us a comparison
+            print(f"Unable to save fingerprints to {state_file} \n{e}")
+        summary = ", ".join(f"{kind}: {amount}" for kind, amount in sorted(fingerprint_hits.items()))
+        print(f"Skipped comparing objects with unchanged fingerprints: {summary or 'none'}")
+
+
+def reset_fingerprints():
+    # For --daemon, at the start of every sync cycle
+    with fingerprint_lock:
+        current_fingerprints.clear()
+        fingerprint_hits.clear()
@@ -0,0 +1,160 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+# Lookup structures built from NetBox objects we already fetched, so matching doesn't need extra API calls
+# Nothing in here talks to NetBox itself
+
+import bisect
+import ipaddress
+
+ANY_VRF = "any"  # For PrefixOccupancyIndex, None already means the global VRF
+
+
+class VmNameIndex(object):
+    def __init__(self, netbox_vms=()):
+        # NetBox VM name → NetBox VMs. Custom names like "myvm_[1a2b3c4d]" are NetBox names too, so they land here as well
+        self.by_name = {}
+        # (NetBox VM name, OpenStack tenant name) → NetBox VMs
+        self.by_name_tenant = {}
+        # IDs of the NetBox VMs an Instance was matched to during this run. Our changes to them may still be queued,
+        # so NetBox doesn't know yet that they're taken
+        self.claimed_ids = set()
+        for netbox_vm in netbox_vms:
+            self.add(netbox_vm)
+
+    def add(self, netbox_vm):
+        # Call this for every VM we create, so later Instances in the same run can find it
+        tenant = netbox_vm.custom_fields.get("openstack_tenant")
+        self.by_name.setdefault(netbox_vm.name, []).append(netbox_vm)
+        self.by_name_tenant.setdefault((netbox_vm.name, tenant), []).append(netbox_vm)
+
+    def add_claimed(self, netbox_vm):
+        # A VM we created for an Instance is that Instance's VM, it can't replace anything else
+        self.add(netbox_vm)
+        self.claim(netbox_vm)
+
+    def claim(self, netbox_vm):
+        self.claimed_ids.add(netbox_vm.id)
+
+    def has_name(self, name):
+        return name in self.by_name
+
+    def find_replacement(self, name, tenant):
+        # A NetBox VM with the same name and tenant is assumed to be the predecessor of a rebuilt Instance
+        # Only one Instance can replace it, so it is claimed right away
+        for netbox_vm in self.by_name_tenant.get((name, tenant), []):
+            if netbox_vm.id not in self.claimed_ids:
+                self.claim(netbox_vm)
+                return netbox_vm
+        return None
+
+
+class AddressEntry(object):
+    # The fields of a NetBox IP-address our sync looks at, much lighter than a pynetbox Record
+    __slots__ = ("id", "address", "status", "vrf_id", "assigned_object_id", "tagged", "last_updated")
+
+    def __init__(self, id, address, status, vrf_id, assigned_object_id, tagged, last_updated=None):
+        self.id = id
+        self.address = address
+        self.status = status  # The status value, like "active"
+        self.vrf_id = vrf_id  # None for the global VRF
+        self.assigned_object_id = assigned_object_id
+        self.tagged = tagged  # Whether it has the openstack-api-script Tag
+        self.last_updated = last_updated  # Used by scripts/netbox/fingerprints.py
+
+
+def address_entry_from_dict(ip):
+    # ip is an IP-address as NetBox returns it in JSON. A pynetbox Record can be passed as dict(record)
+    status = ip.get("status")
+    vrf = ip.get("vrf")
+    return AddressEntry(ip["id"], str(ip["address"]),
+                        status.get("value") if isinstance(status, dict) else status,
+                        vrf.get("id") if isinstance(vrf, dict) else vrf,
+                        ip.get("assigned_object_id"),
+                        any(tag.get("slug") == "openstack-api-script" for tag in ip.get("tags") or []),
+                        ip.get("last_updated"))
+
+
+class AddressIndex(dict):
+    # NetBox LAN addresses keyed by (VRF ID, address without prefix length)
+    # Tenants often use the same private ranges, so the address alone doesn't tell us which NetBox object is ours
+    def __init__(self, addresses=()):
+        super().__init__()
+        # Address without prefix length → the addresses with it, in any VRF
+        self.by_address = {}
+        for address in addresses:
+            self.add(address)
+
+    def __setitem__(self, key, address):
+        if key in self:
+            del self[key]
+        super().__setitem__(key, address)
+        self.by_address.setdefault(key[1], []).append(address)
+
+    def __delitem__(self, key):
+        address = self[key]
+        super().__delitem__(key)
+        self.by_address[key[1]] = [other for other in self.by_address[key[1]] if other is not address]
+        if not self.by_address[key[1]]:
+            del self.by_address[key[1]]
+
+    def add(self, address):
+        self[(address.vrf_id, address.address.split('/', 1)[0])] = address
+
+    def has_address(self, unprefixed_ip):
+        return unprefixed_ip in self.by_address
+
+    def find(self, unprefixed_ip, vrf_id):
+        return self.get((vrf_id, unprefixed_ip))
+
+
+class PrefixOccupancyIndex(object):
+    # Answers "which IP-addresses are inside this prefix?" with a binary search,
+    # using the integer value of every address, sorted per VRF and IP-version
+    def __init__(self, addresses=()):
+        unsorted = {}
+        for address in addresses:
+            ip = ipaddress.ip_interface(address.address).ip
+            for vrf_id in (address.vrf_id, ANY_VRF):
+                unsorted.setdefault((vrf_id, ip.version), []).append(int(ip))
+        self.sorted_addresses = {key: sorted(values) for key, values in unsorted.items()}
+
+    def count(self, prefix, vrf_id=ANY_VRF):
+        # Like NetBox's parent filter: the amount of addresses in prefix, in VRF vrf_id or in any VRF
+        network = ipaddress.ip_network(prefix)
+        values = self.sorted_addresses.get((vrf_id, network.version), [])
+        return (bisect.bisect_right(values, int(network.broadcast_address)) -
+                bisect.bisect_left(values, int(network.network_address)))
+
+    def is_empty(self, prefix, vrf_id=ANY_VRF):
+        return self.count(prefix, vrf_id) == 0
+
+
+def build_interface_address_map(neutron_interface_dictionary, neutron_float_dictionary):
+    # OpenStack Interface ID → every address Neutron has for it, its fixed IPs plus the Floating-IPs bound to it
+    interface_addresses = {}
+    for interface_id, interface in neutron_interface_dictionary.items():
+        addresses = interface_addresses.setdefault(interface_id, set())
+        for ip in interface["interfaceips"]:
+            addresses.add(ip["ip_address"])
+    for osfloat in neutron_float_dictionary.values():
+        interface_addresses.setdefault(osfloat["boundtointerfaceid"], set()).add(osfloat["floatip"])
+    return interface_addresses
@@ -0,0 +1,156 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import threading
+import ipaddress
+
+from scripts.netbox.indexes import VmNameIndex
+from scripts.netbox.indexes import address_entry_from_dict
+from scripts.netbox.statestore import fetch_records
+
+import settings
+nb = settings.nb
+cluster_name = settings.cluster_name
+
+
+def vm_keys(vm):
+    return [vm.custom_fields["openstack_id"]]
+
+
+def interface_keys(interface):
+    return [interface.custom_fields["openstack_interfaceid"]]
+
+
+def vrf_keys(vrf):
+    # Same rules as nbfetchvrfs(), a VRF may combine several OpenStack networks
+    openstack_networkid = vrf.custom_fields["openstack_networkid"]
+    if openstack_networkid is None or openstack_networkid == "":
+        return []
+    return str(openstack_networkid).split(',')
+
+
+def prefix_keys(prefix):
+    # Same rules as nbfetchsubnets(), global prefixes by CIDR and every prefix by its OpenStack subnet ID
+    keys = []
+    if ipaddress.ip_network(prefix.prefix).is_global:
+        keys.append(prefix.prefix)
+    if prefix.custom_fields["openstack_subnetid"] is not None:
+        keys.append(prefix.custom_fields["openstack_subnetid"])
+    return keys
+
+
+def lan_address_keys(address):
+    # Same rules as nbfetchaddresses()
+    unprefixed_ip = str(address.address).split('/', 1)[0]
+    if address.tagged and ipaddress.ip_address(unprefixed_ip).is_private:
+        return [(address.vrf_id, unprefixed_ip)]
+    return []
+
+
+def wan_address_keys(address):
+    unprefixed_ip = str(address.address).split('/', 1)[0]
+    if not lan_address_keys(address) and ipaddress.ip_address(unprefixed_ip).is_global:
+        return [unprefixed_ip]
+    return []
+
+
+key_functions = {"vms": vm_keys, "interfaces": interface_keys, "vrfs": vrf_keys, "prefixes": prefix_keys,
+                 "lan addresses": lan_address_keys, "wan addresses": wan_address_keys}
+
+
+class NetboxInventory(object):
+    # The NetBox VMs of our cluster, fetched once and shared by everything that needs them
+    # Our fetches run at the same time, so the first caller fetches and the others wait for its result
+    # It also keeps the dictionaries our stages work with up to date, with the records NetBox returns when we
+    # create or update something. That way later stages see our own changes, without fetching everything again
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vms = None
+        self.dictionaries = {}
+        self.keys_by_id = {}
+
+    def cluster_vms(self):
+        with self.lock:
+            if self.vms is None:
+                self.vms = {vm.id: vm for vm in fetch_records(nb.virtualization.virtual_machines,
+                                                              {"tag": "openstack-api-script", "cluster": cluster_name})}
+                print("Fetched NetBox Virtual Machines")
+            return list(self.vms.values())
+
+    def refresh(self):
+        # The next caller fetches the VMs again, for when they were changed in NetBox
+        with self.lock:
+            self.vms = None
+
+    def reset(self):
+        # For --daemon, every sync cycle tracks the dictionaries of its own fetches
+        with self.lock:
+            self.vms = None
+            self.dictionaries = {}
+            self.keys_by_id = {}
+
+    def vm_ids(self):
+        # NB Interfaces and Virtual Disks only tell us the ID of their VM
+        return set(str(vm.id) for vm in self.cluster_vms())
+
+    def vm_dictionary(self):
+        # OpenStack ID → NetBox VM
+        return {vm.custom_fields["openstack_id"]: vm for vm in self.cluster_vms()}
+
+    def vm_name_index(self):
+        return VmNameIndex(self.cluster_vms())
+
+    def track(self, name, dictionary):
+        # dictionary is one of the dictionaries returned by scripts/netbox/fetchinfo.py, see key_functions
+        with self.lock:
+            self.dictionaries[name] = dictionary
+            keys_by_id = {}
+            for key, record in dictionary.items():
+                keys_by_id.setdefault(record.id, []).append(key)
+            self.keys_by_id[name] = keys_by_id
+        return dictionary
+
+    def apply(self, name, record):
+        # Called with every record NetBox returns for our creates and updates
+        with self.lock:
+            if name == "vms" and self.vms is not None:
+                self.vms[record.id] = record
+            if name not in self.dictionaries:
+                return
+            dictionary = self.dictionaries[name]
+            new_keys = key_functions[name](record)
+            for old_key in self.keys_by_id[name].get(record.id, []):
+                # An update may have changed the OpenStack ID, then the old one should no longer find this record
+                if old_key not in new_keys and getattr(dictionary.get(old_key), "id", None) == record.id:
+                    del dictionary[old_key]
+            for key in new_keys:
+                dictionary[key] = record
+            self.keys_by_id[name][record.id] = new_keys
+
+    def apply_address(self, record):
+        # Our address dictionaries hold AddressEntry objects rather than Records, see nbfetchaddresses()
+        # An address belongs in either the LAN or the WAN dictionary, their key functions decide which
+        address = address_entry_from_dict(dict(record))
+        self.apply("lan addresses", address)
+        self.apply("wan addresses", address)
+
+
+inventory = NetboxInventory()
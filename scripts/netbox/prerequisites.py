@@ -0,0 +1,96 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# Checks whether the NetBox objects we rely on exist and are unique: our cluster, its type, the custom fields and our Tag
+# Every type of object is checked with a single list call, and the result is kept on disk for a while
+# The cache is only used for the same NetBox version, so an upgraded NetBox is always checked again
+
+import os
+import json
+import time
+
+required_custom_fields = ["openstack_id", "openstack_hypervisor", "openstack_tenant", "openstack_flavor",
+                          "openstack_swap", "openstack_ephemeral", "openstack_hostname", "openstack_interfaceid",
+                          "openstack_networkid", "openstack_volumeid", "openstack_subnetid"]
+required_tag = "openstack-api-script"
+
+
+def check_prerequisites(nb, netbox_domain, cluster_name, cluster_type, cache_file, cache_ttl):
+    # Returns the IDs of our cluster and our Tag, raises a ValueError when something is missing or not unique
+    cache_key = [netbox_domain, cluster_name, cluster_type, required_custom_fields, required_tag]
+    netbox_version = nb.version
+    prerequisites = load_prerequisites(cache_file, cache_ttl, cache_key, netbox_version)
+    if prerequisites is None:
+        prerequisites = {
+            'cluster_id': unique_id(nb.virtualization.clusters.filter(name=cluster_name), "cluster", cluster_name),
+            'cluster_type_id': unique_id(nb.virtualization.cluster_types.filter(name=cluster_type),
+                                         "cluster type", cluster_type),
+            'tag_id': unique_id(nb.extras.tags.filter(slug=required_tag), "Tag", required_tag),
+            'custom_fields': custom_field_ids(nb.extras.custom_fields.filter(name=required_custom_fields))
+        }
+        save_prerequisites(cache_file, cache_key, netbox_version, prerequisites)
+    return prerequisites['cluster_id'], prerequisites['tag_id']
+
+
+def unique_id(records, description, name):
+    records = list(records)
+    if len(records) != 1:
+        raise ValueError(f"Found {len(records)} NetBox {description}s named {name}, instead of exactly one")
+    return records[0].id
+
+
+def custom_field_ids(records):
+    found = {}
+    for custom_field in records:
+        found.setdefault(custom_field.name, []).append(custom_field.id)
+    problems = [f"{name} ({len(found.get(name, []))} found)" for name in required_custom_fields
+                if len(found.get(name, [])) != 1]
+    if problems:
+        raise ValueError(f"These NetBox custom fields are missing or not unique: {', '.join(problems)}")
+    return dict((name, found[name][0]) for name in required_custom_fields)
+
+
+def load_prerequisites(cache_file, cache_ttl, cache_key, netbox_version):
+    if not cache_file or not os.path.isfile(cache_file):
+        return None
+    try:
+        with open(cache_file) as prerequisite_file:
+            cache = json.load(prerequisite_file)
+    except Exception as e:
+        print(f"Ignoring unreadable NetBox prerequisite cache {cache_file} \n{e}")
+        return None
+    if (cache.get('key') != cache_key or cache.get('version') != netbox_version or
+            time.time() - cache.get('saved', 0) > cache_ttl):
+        return None
+    return cache['prerequisites']
+
+
+def save_prerequisites(cache_file, cache_key, netbox_version, prerequisites):
+    if not cache_file:
+        return
+    try:
+        with open(cache_file + ".tmp", "w") as prerequisite_file:
+            json.dump({'key': cache_key, 'version': netbox_version, 'saved': time.time(),
+                       'prerequisites': prerequisites}, prerequisite_file)
+        os.replace(cache_file + ".tmp", cache_file)
+    except Exception as e:
+        print(f"Unable to save NetBox prerequisite cache {cache_file} \n{e}")
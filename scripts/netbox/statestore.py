@@ -0,0 +1,198 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# An SQLite file holding what we know about NetBox from previous runs:
+# the NetBox objects we fetched, per endpoint + filters, and the fingerprints from scripts/netbox/fingerprints.py
+# A run then only fetches the IDs of an endpoint and the objects changed since the newest one we know of,
+# rather than every object again. The IDs tell us which objects were deleted in NetBox, or no longer match our filters
+# Counts and reverse relations, like a VRF's ipaddress_count or an Interface's mac_addresses, change without NetBox
+# renewing the object's last_updated. Those are passed as live_fields and fetched along with the IDs on every run
+
+import json
+import sqlite3
+import threading
+
+from pynetbox.core.query import Request
+
+import settings
+nb = settings.nb
+state_file = settings.netbox_state_file
+
+page_size = 1000  # NetBox's default MAX_PAGE_SIZE
+id_chunk_size = 50  # IDs per request, to keep URLs reasonably short
+
+# "incremental" trusts the store, "verify" also fetches everything to compare it with the store,
+# "rebuild" throws the store away and fetches everything, see --verify-state and --rebuild-state
+mode = "incremental"
+
+store_lock = threading.Lock()
+connection = None
+# The stored objects per scope, so the sync cycles of --daemon don't read them back from the file every time
+memory = {}
+
+
+def get_connection():
+    # Our fetches run at the same time, they share one connection under store_lock
+    global connection
+    if connection is None:
+        connection = sqlite3.connect(state_file, check_same_thread=False)
+        connection.execute("CREATE TABLE IF NOT EXISTS records (scope TEXT, netbox_id INTEGER, last_updated TEXT, "
+                           "record TEXT, PRIMARY KEY (scope, netbox_id))")
+        connection.execute("CREATE TABLE IF NOT EXISTS fingerprints (kind TEXT, openstack_key TEXT, "
+                           "fingerprint TEXT, netbox_id INTEGER, last_updated TEXT, PRIMARY KEY (kind, openstack_key))")
+        connection.commit()
+    return connection
+
+
+def set_mode(new_mode):
+    global mode
+    mode = new_mode
+    if mode == "rebuild" and state_file:
+        with store_lock:
+            store = get_connection()
+            store.execute("DELETE FROM records")
+            store.execute("DELETE FROM fingerprints")
+            store.commit()
+            memory.clear()
+        print(f"Emptied NetBox state store {state_file}, everything will be fetched from NetBox")
+
+
+def request_dicts(endpoint, filters, fields=None):
+    # Raw JSON objects, page by page. fields is a comma separated list of fields, NetBox leaves out everything else
+    if fields is not None:
+        filters = dict(filters, fields=fields)
+    return Request(base=endpoint.url, http_session=nb.http_session, token=nb.token,
+                   filters=filters, limit=page_size).get()
+
+
+def fetch_records(endpoint, filters, live_fields=None):
+    # Like endpoint.filter(**filters), except that unchanged objects come from the state store
+    return [endpoint.return_obj(values, nb, endpoint) for values in fetch_dicts(endpoint, filters,
+                                                                                live_fields=live_fields)]
+
+
+def fetch_dicts(endpoint, filters, fields=None, live_fields=None):
+    if not state_file:
+        return list(request_dicts(endpoint, filters, fields))
+    # The same endpoint with other filters or fields is stored separately
+    scope = json.dumps([endpoint.url, filters, fields], sort_keys=True)
+    with store_lock:
+        if scope not in memory:
+            memory[scope] = dict((netbox_id, (last_updated, record)) for netbox_id, last_updated, record in
+                                 get_connection().execute("SELECT netbox_id, last_updated, record FROM records "
+                                                          "WHERE scope = ?", (scope,)))
+        cached = dict(memory[scope])
+    stored_moments = [last_updated for last_updated, record in cached.values() if last_updated]
+    if mode == "rebuild" or not stored_moments:
+        records = list(request_dicts(endpoint, filters, fields))
+        store_records(scope, records, replace=True)
+        return records
+    if live_fields is None:
+        listing = dict((values["id"], values) for values in request_dicts(endpoint, filters, "id"))
+    else:
+        listing = dict((values["id"], values) for values in request_dicts(endpoint, filters, f"id,{live_fields}"))
+    current_ids = set(listing)
+    # NetBox renews last_updated on every change, also when an object starts matching our filters
+    since = max(stored_moments)
+    changed = dict((values["id"], values) for values in request_dicts(endpoint, dict(filters, last_updated__gte=since),
+                                                                      fields))
+    missing_ids = sorted(current_ids - set(cached) - set(changed))
+    for chunk in range(0, len(missing_ids), id_chunk_size):
+        # Objects we never stored, like those that lost and regained our Tag
+        for values in request_dicts(endpoint, dict(filters, id=missing_ids[chunk:chunk + id_chunk_size]), fields):
+            changed[values["id"]] = values
+    records = []
+    for netbox_id in current_ids:
+        if netbox_id in changed:
+            records.append(changed[netbox_id])
+        else:
+            values = json.loads(cached[netbox_id][1])
+            # The stored values of live_fields are outdated by definition
+            values.update(listing[netbox_id])
+            records.append(values)
+    gone_ids = set(cached) - current_ids
+    store_records(scope, [changed[netbox_id] for netbox_id in changed if netbox_id in current_ids], gone_ids=gone_ids)
+    print(f"Fetched {len(changed)} changed objects from {endpoint.url}, "
+          f"{len(records) - len(changed)} came from the state store and {len(gone_ids)} were gone")
+    if mode == "verify":
+        records = verify_records(endpoint, filters, fields, scope, records)
+    return records
+
+
+def verify_records(endpoint, filters, fields, scope, records):
+    # Fetch everything after all, and tell what the store got wrong. NetBox's answer replaces the store
+    netbox_records = list(request_dicts(endpoint, filters, fields))
+    stored = dict((values["id"], values.get("last_updated")) for values in records)
+    fetched = dict((values["id"], values.get("last_updated")) for values in netbox_records)
+    missing = len(set(fetched) - set(stored))
+    extra = len(set(stored) - set(fetched))
+    outdated = len([netbox_id for netbox_id in fetched if netbox_id in stored and stored[netbox_id] != fetched[netbox_id]])
+    if missing or extra or outdated:
+        print(f"The state store disagrees with NetBox on {endpoint.url}: {missing} missing, {extra} deleted "
+              f"and {outdated} outdated objects. They have been corrected")
+    else:
+        print(f"The state store agrees with NetBox on {endpoint.url}")
+    store_records(scope, netbox_records, replace=True)
+    return netbox_records
+
+
+def store_records(scope, records, replace=False, gone_ids=()):
+    rows = [(scope, values["id"], values.get("last_updated"), json.dumps(values)) for values in records]
+    with store_lock:
+        store = get_connection()
+        if replace:
+            store.execute("DELETE FROM records WHERE scope = ?", (scope,))
+            memory[scope] = {}
+        store.executemany("DELETE FROM records WHERE scope = ? AND netbox_id = ?",
+                          [(scope, netbox_id) for netbox_id in gone_ids])
+        store.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)", rows)
+        store.commit()
+        in_memory = memory.setdefault(scope, {})
+        for netbox_id in gone_ids:
+            in_memory.pop(netbox_id, None)
+        for row_scope, netbox_id, last_updated, record in rows:
+            in_memory[netbox_id] = (last_updated, record)
+
+
+def read_fingerprints():
+    # kind → OpenStack key → [fingerprint, NetBox ID, last_updated]
+    fingerprints = {}
+    if not state_file:
+        return fingerprints
+    with store_lock:
+        for kind, openstack_key, fingerprint, netbox_id, last_updated in get_connection().execute(
+                "SELECT kind, openstack_key, fingerprint, netbox_id, last_updated FROM fingerprints"):
+            fingerprints.setdefault(kind, {})[openstack_key] = [fingerprint, netbox_id, last_updated]
+    return fingerprints
+
+
+def write_fingerprints(fingerprints):
+    if not state_file:
+        return
+    with store_lock:
+        store = get_connection()
+        store.execute("DELETE FROM fingerprints")
+        store.executemany("INSERT INTO fingerprints VALUES (?, ?, ?, ?, ?)",
+                          [(kind, openstack_key, fingerprint, netbox_id, last_updated)
+                           for kind, remembered in fingerprints.items()
+                           for openstack_key, (fingerprint, netbox_id, last_updated) in remembered.items()])
+        store.commit()
@@ -0,0 +1,205 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# The HTTP transport all our NetBox requests go through, mounted on nb.http_session by settings.py
+# It keeps a pool of connections to NetBox as large as the amount of requests we make at the same time,
+# so threads wait for a connection instead of opening (and throwing away) extra TLS connections
+# It also counts what each NetBox endpoint costs us, and decodes JSON with orjson when it is installed
+# requests already asks for gzip/deflate compressed responses, NetBox's web server decides whether to compress them
+#
+# A busy NetBox answers with 502, 503, 504 or 429. Rather than failing the whole sync on the first one, we retry
+# with a jittered backoff, and lower the amount of requests we have in flight (see AimdLimiter) until NetBox copes
+# Requests that may have changed something in NetBox (POST, PATCH) are only retried on 429, which NetBox sends
+# before handling the request. This module doesn't use settings.py, settings.py passes the values along
+
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+transport_stats = {}  # "ipam/ip-addresses" → [requests, bytes over the wire, bytes after decompressing, seconds]
+transport_stats_lock = threading.Lock()
+retry_stats = {}  # Status code or "connection error" → amount of retries
+
+idempotent_methods = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+retry_statuses = (429, 502, 503, 504)
+overload_statuses = (429, 500, 502, 503, 504)  # Responses that tell the limiter NetBox is struggling
+
+
+class AimdLimiter(object):
+    # Limits the amount of requests in flight. Every request that comes back quickly and healthy grows the limit
+    # by 1 / limit, so roughly by one per round of requests. A slow or overloaded response halves it
+    # Requests that were sent before the last decrease can't lower it again, so one bad moment only counts once
+    def __init__(self, max_limit, min_limit=1, latency_target=5.0, decrease_factor=0.5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_target = latency_target  # Seconds a response may take before we consider NetBox overloaded
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_limit)
+        self.lowest_limit = float(max_limit)
+        self.decreases = 0
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        # Returns the moment the request was allowed to go, which release() needs
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight = self.in_flight + 1
+            return time.monotonic()
+
+    def release(self, started, overloaded):
+        with self.condition:
+            self.in_flight = self.in_flight - 1
+            if overloaded or time.monotonic() - started > self.latency_target:
+                if started >= self.last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self.lowest_limit = min(self.lowest_limit, self.limit)
+                    self.last_decrease = time.monotonic()
+                    self.decreases = self.decreases + 1
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class NetboxTransport(HTTPAdapter):
+    def __init__(self, pool_size, fast_json=True, retries=5, retry_backoff=0.5, retry_backoff_max=30.0,
+                 min_in_flight=1, latency_target=5.0):
+        # We only talk to a single NetBox, so one pool of pool_size connections
+        super().__init__(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.fast_json = fast_json and orjson is not None
+        self.retries = retries
+        self.retry_backoff = retry_backoff  # Seconds, doubled for every retry of the same request
+        self.retry_backoff_max = retry_backoff_max
+        self.limiter = AimdLimiter(pool_size, min_in_flight, latency_target)
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            started = self.limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except ConnectionError as e:
+                self.limiter.release(started, True)
+                if attempt >= self.retries or request.method not in idempotent_methods:
+                    raise
+                attempt = attempt + 1
+                self.wait_before_retry("connection error", attempt, None)
+                continue
+            except BaseException:
+                # A read timeout, an invalid header or anything else, the slot must come back or we run out of them
+                self.limiter.release(started, True)
+                raise
+            self.limiter.release(started, response.status_code in overload_statuses)
+            if attempt < self.retries and should_retry(request.method, response.status_code):
+                attempt = attempt + 1
+                retry_after = response.headers.get("Retry-After")
+                # Reading the (small) error first lets the connection go back to the pool, rather than being closed
+                response.content
+                response.close()
+                self.wait_before_retry(response.status_code, attempt, retry_after)
+                continue
+            break
+        if kwargs.get("stream"):
+            return response
+        # pynetbox reads every response completely anyway. Reading it here tells us its size on the wire
+        content = response.content
+        add_transport_stats(endpoint_name(request.url), response.raw.tell() or len(content), len(content),
+                            response.elapsed.total_seconds())
+        if self.fast_json:
+            response.json = lambda **json_arguments: orjson.loads(content)
+        return response
+
+    def wait_before_retry(self, reason, attempt, retry_after):
+        with transport_stats_lock:
+            retry_stats[reason] = retry_stats.get(reason, 0) + 1
+        # Full jitter, so the requests that failed together don't all come back at the same moment
+        delay = random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * 2 ** attempt))
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(self.retry_backoff_max, int(retry_after)))
+        time.sleep(delay)
+
+    def connection_reuse(self):
+        # urllib3 counts the requests and the connections it had to open, per pool
+        requests_made = 0
+        connections_opened = 0
+        for pool_key in list(self.poolmanager.pools.keys()):
+            pool = self.poolmanager.pools.get(pool_key)
+            if pool is not None:
+                requests_made = requests_made + pool.num_requests
+                connections_opened = connections_opened + pool.num_connections
+        return requests_made, connections_opened
+
+
+def should_retry(method, status_code):
+    if status_code not in retry_statuses:
+        return False
+    # 429 means NetBox didn't handle the request, anything else may have been handled before it failed
+    return method in idempotent_methods or status_code == 429
+
+
+def endpoint_name(url):
+    # https://netbox.example.com/api/ipam/ip-addresses/?limit=1000 → ipam/ip-addresses
+    path = urlsplit(url).path.strip("/").split("/")
+    if "api" in path:
+        path = path[path.index("api") + 1:]
+    return "/".join(part for part in path[:2] if not part.isdigit()) or "api"
+
+
+def add_transport_stats(endpoint, wire_bytes, content_bytes, seconds):
+    with transport_stats_lock:
+        stats = transport_stats.setdefault(endpoint, [0, 0, 0, 0.0])
+        stats[0] = stats[0] + 1
+        stats[1] = stats[1] + wire_bytes
+        stats[2] = stats[2] + content_bytes
+        stats[3] = stats[3] + seconds
+
+
+def print_transport_summary(transport):
+    requests_made, connections_opened = transport.connection_reuse()
+    if requests_made:
+        print(f"NetBox connections: {requests_made} requests over {connections_opened} connections "
+              f"({100 * (1 - connections_opened / requests_made):.1f}% reused), "
+              f"JSON decoded with {'orjson' if transport.fast_json else 'json'}")
+    limiter = transport.limiter
+    if limiter.decreases:
+        print(f"NetBox was overloaded {limiter.decreases} times, requests in flight went down to "
+              f"{int(limiter.lowest_limit)} of {limiter.max_limit} and are now at {int(limiter.limit)}")
+    with transport_stats_lock:
+        retries = ", ".join(f"{reason}: {amount}" for reason, amount in sorted(retry_stats.items(), key=str))
+    if retries:
+        print(f"Retried NetBox requests: {retries}")
+    with transport_stats_lock:
+        for endpoint, (amount, wire_bytes, content_bytes, seconds) in sorted(transport_stats.items(),
+                                                                          key=lambda stats: stats[1][1], reverse=True):
+            print(f"  {endpoint}: {amount} requests, {wire_bytes / 1024:.0f} KiB transferred "
+                  f"({content_bytes / 1024:.0f} KiB uncompressed) in {seconds:.1f} seconds")
@@ -1,6 +1,6 @@
 #  MIT License
 #
-#  Copyright (c) 2024. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
 #
 #  Permission is hereby granted, free of charge, to any person obtaining a copy
 #  of this software and associated documentation files (the "Software"), to deal
@@ -20,58 +20,64 @@
 #  SOFTWARE.
 
 import sys
-from pynetbox import RequestError
+
+from scripts.netbox.bulk import queue_update
+from scripts.netbox.inventory import inventory
+from scripts.netbox.fielddiff import changed_fields
 
 import settings
 nb = settings.nb
 cluster_name = settings.cluster_name
 netboxtagopenstackapiscriptid = settings.netboxtagopenstackapiscriptid
 
+# Every function below queues its changes, NetBox receives them in batched PATCHes through scripts/netbox/bulk.py
+# Any value passed to Netbox API, will only do something if the value is different
+# That's why we only pass the fields that differ from the NetBox object we fetched, see scripts/netbox/fielddiff.py
+# The records NetBox returns are applied to our inventory, so later stages see them without fetching them again
+
+
+def queue_changes(endpoint_name, netbox_id, desired, current, updated, failed):
+    changes = changed_fields(endpoint_name, desired, current)
+    if changes:
+        queue_update(endpoint_name, dict(changes, id=netbox_id), updated, failed)
 
-def updatenetboxvm(netbox_vm_id, os_vm):
+
+def updatenetboxvm(netbox_vm, os_vm):
     # Update OpenStack VM in Netbox based on given values
-    # Any value passed to Netbox API, will only do something if the value is different
-    try:
-        vmer = nb.virtualization.virtual_machines.update([
-            {'id': netbox_vm_id,
-             'name': os_vm.name,
-             'status': os_vm.status,
-             'vcpus': os_vm.flavorcpu,
-             'memory': os_vm.flavorram,
-             'custom_fields': {'openstack_id': os_vm.instance_id, 'openstack_hypervisor': os_vm.hypervisor,
-                               'openstack_flavor': os_vm.flavorname, 'openstack_swap': os_vm.flavorswap,
-                               'openstack_ephemeral': os_vm.flavorephemeral, 'openstack_tenant': os_vm.tenant,
-                               'openstack_hostname': os_vm.hostname}
-             }
-        ])
+    def updated(vmer):
         print(f"Updated {os_vm.name} in Netbox cluster {cluster_name} based on OpenStack ID {os_vm.instance_id}")
-    except Exception as e:
+        inventory.apply("vms", vmer)
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Virtual machine name must be unique per cluster." in str(e)):
             # If the VM in OpenStack still does not have a unique name for us to use in NetBox
             # We update it with our custom name instead
             os_vm.name = os_vm.custom_name
-            updatenetboxvm(netbox_vm_id, os_vm)
-            print(f"Updated custom-named VM {os_vm.custom_name} in Netbox cluster {cluster_name} "
-                  f"based on OpenStack ID {os_vm.instance_id}")
+            updatenetboxvm(netbox_vm, os_vm)
         else:
             print(f"Unable to update custom-named VM {os_vm.custom_name} in Netbox cluster {cluster_name} "
                   f"based on OpenStack ID {os_vm.instance_id} \n{e}")
             sys.exit(1)
 
+    queue_changes("virtualization.virtual_machines", netbox_vm.id,
+                  {'name': os_vm.name,
+                   'status': os_vm.status,
+                   'vcpus': os_vm.flavorcpu,
+                   'memory': os_vm.flavorram,
+                   'custom_fields': {'openstack_id': os_vm.instance_id, 'openstack_hypervisor': os_vm.hypervisor,
+                                     'openstack_flavor': os_vm.flavorname, 'openstack_swap': os_vm.flavorswap,
+                                     'openstack_ephemeral': os_vm.flavorephemeral, 'openstack_tenant': os_vm.tenant,
+                                     'openstack_hostname': os_vm.hostname}
+                   }, netbox_vm, updated, failed)
+
 
 def updatevmdisk(openstack_volume_obj, netbox_vm, netbox_vol):
-    try:
-        disker = nb.virtualization.virtual_disks.update([
-            {"id": netbox_vol.id,
-             "virtual_machine": netbox_vm.id,
-             "name": openstack_volume_obj.vol_name,
-             "size": openstack_volume_obj.vol_size
-             }
-        ])
+    def updated(disker):
         print(f"Updated Volume {openstack_volume_obj.vol_name} for VM "
               f"{netbox_vm.name} because ID {openstack_volume_obj.vol_id} was found")
-    except Exception as e:
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Virtual disk with this Virtual machine and Name already exists." in str(e)):
             openstack_volume_obj.vol_name = openstack_volume_obj.custom_name
@@ -80,18 +86,20 @@ def updatevmdisk(openstack_volume_obj, netbox_vm, netbox_vol):
             print(f"Unable to update Volume {openstack_volume_obj.vol_name} for {netbox_vm.name} \n{e}")
             sys.exit(1)
 
+    queue_changes("virtualization.virtual_disks", netbox_vol.id,
+                  {"virtual_machine": netbox_vm.id,
+                   "name": openstack_volume_obj.vol_name,
+                   "size": openstack_volume_obj.vol_size
+                   }, netbox_vol, updated, failed)
+
 
 def updatevminterface(openstack_interface_obj, netbox_int, netbox_vm):
-    try:
-        interfacer = nb.virtualization.interfaces.update([
-            {'id': netbox_int.id,
-             'virtual_machine': netbox_vm.id,
-             'name': openstack_interface_obj.int_name
-             }
-        ])
+    def updated(interfacer):
         print(f"Updated Interface {openstack_interface_obj.int_name} for VM "
               f"{netbox_vm.name} because ID {openstack_interface_obj.int_id} was found")
-    except Exception as e:
+        inventory.apply("interfaces", interfacer)
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Interface with this Virtual machine and Name already exists." in str(e)):
             openstack_interface_obj.int_name = openstack_interface_obj.custom_name
@@ -100,148 +108,169 @@ def updatevminterface(openstack_interface_obj, netbox_int, netbox_vm):
             print(f"Unable to update Interface {openstack_interface_obj.int_name} VM {netbox_vm.name} \n{e}")
             sys.exit(1)
 
+    queue_changes("virtualization.interfaces", netbox_int.id,
+                  {'virtual_machine': netbox_vm.id,
+                   'name': openstack_interface_obj.int_name
+                   }, netbox_int, updated, failed)
+
 
 def update_netbox_interface_mac(netbox_mac_address, netbox_interface):
-    try:
-        interfacer = nb.virtualization.interfaces.update([
-            {'id': netbox_interface.id,
-             'primary_mac_address': netbox_mac_address.id,
-             }
-        ])
+    def updated(interfacer):
         print(f"Set MAC-address {netbox_mac_address.mac_address} as primary for "
               f"Interface {netbox_interface.name} ID Interface {netbox_interface.id}.")
-    except Exception as e:
+        inventory.apply("interfaces", interfacer)
+
+    def failed(e):
         print(f"Unable to set MAC-address {netbox_mac_address.mac_address} as primary"
               f" for Interface {netbox_interface.name} \n{e}")
         # It's not worth exiting the script for
         # sys.exit(1)
 
+    queue_changes("virtualization.interfaces", netbox_interface.id,
+                  {'primary_mac_address': netbox_mac_address.id
+                   }, netbox_interface, updated, failed)
+
 
 def updatenetboxvrf(osvrfname, nbvrfid):
-    try:
-        vrfer = nb.ipam.vrfs.update([
-            {"name": osvrfname,
-             "id": nbvrfid
-             }
-        ])
+    def updated(vrfer):
         print(f'Updated Netbox VRF {osvrfname} ID {nbvrfid} because it contains one or more RFC1918 IPs')
-    except Exception as e:
+        inventory.apply("vrfs", vrfer)
+
+    def failed(e):
         print(f"Unable to update NetBox VRF {osvrfname}: NetBox ID {nbvrfid} \n{e}")
         sys.exit(1)
 
+    # Only called when the name differs
+    queue_changes("ipam.vrfs", nbvrfid, {"name": osvrfname}, None, updated, failed)
+
+
 def updatenetboxglobalsubnet(openstack_subnet_obj, netbox_prefix):
-    try:
-        subnetter = nb.ipam.prefixes.update([
-            # We already found the prefix in NetBox, so all we're doing is adding the OpenStack subnet ID to it
-            {"id": netbox_prefix.id,
-             "custom_fields": {'openstack_subnetid': openstack_subnet_obj.subnet_id}
-             }
-        ])
+    def updated(subnetter):
         print(f"Updated global prefix {netbox_prefix.prefix} by adding "
               f"OpenStack Subnet ID {openstack_subnet_obj.subnet_id}")
-    except Exception as e:
+        inventory.apply("prefixes", subnetter)
+
+    def failed(e):
         print(f"Unable to update global prefix {netbox_prefix.prefix} based on "
               f"OpenStack Subnet {openstack_subnet_obj.name} ID {openstack_subnet_obj.subnet_id} \n{e}")
         sys.exit(1)
 
+    queue_changes("ipam.prefixes", netbox_prefix.id,
+                  # We already found the prefix in NetBox, so all we're doing is adding the OpenStack subnet ID to it
+                  {"custom_fields": {'openstack_subnetid': openstack_subnet_obj.subnet_id}
+                   }, netbox_prefix, updated, failed)
+
 
 def updatenetboxsubnet(openstack_subnet_obj, netbox_prefix):
-    try:
-        subnetter = nb.ipam.prefixes.update([
-            {"prefix": openstack_subnet_obj.cidr,
-             "id": netbox_prefix.id
-             }
-        ])
+    def updated(subnetter):
         print(f'Updated prefix {netbox_prefix.prefix} based on '
               f'OpenStack network {openstack_subnet_obj.name} CIDR {openstack_subnet_obj.cidr}')
-    except Exception as e:
+        inventory.apply("prefixes", subnetter)
+
+    def failed(e):
         print(f"Unabled to update prefix {netbox_prefix.prefix} based on "
               f"OpenStack Subnet {openstack_subnet_obj.name} ID {openstack_subnet_obj.subnet_id} \n{e}")
         sys.exit(1)
 
+    queue_changes("ipam.prefixes", netbox_prefix.id,
+                  {"prefix": openstack_subnet_obj.cidr
+                   }, netbox_prefix, updated, failed)
+
 
 def updateglobalipamip(address_object, nb_ip):
-    try:
-        addresserglobal = nb.ipam.ip_addresses.update([
-            {"id": nb_ip.id,
-             "status": address_object.status,
-             "assigned_object_type": "virtualization.vminterface",
-             "assigned_object_id": address_object.nb_int_id
-             }
-        ])
+    def updated(addresserglobal):
         print(f"Updated WAN IP {nb_ip.address} to VM {address_object.nb_vm_name} "
               f"Interface {address_object.nb_int_name}")
-    except RequestError as rq_error:
-        if "Cannot reassign IP address while it is designated as the primary IP for the parent object" in str(rq_error.error):
+        inventory.apply_address(addresserglobal)
+
+    def failed(e):
+        if "Cannot reassign IP address while it is designated as the primary IP for the parent object" in str(e):
             print(f"Error: Unable to update NetBox Address {nb_ip.address} "
                   f"as it is currently assigned as primary to NetBox object {nb_ip.assigned_object_id}!")
             pass
         else:
             print(f"Unable to update WAN IP {nb_ip.address} for Netbox VM {address_object.nb_vm_name} "
-                  f"Interface {address_object.nb_int_name} \n{rq_error}")
+                  f"Interface {address_object.nb_int_name} \n{e}")
             sys.exit(1)
-    except Exception as e:
-        print(f"Unable to update WAN IP {nb_ip.address} for Netbox VM {address_object.nb_vm_name} "
-              f"Interface {address_object.nb_int_name} \n{e}")
-        sys.exit(1)
+
+    queue_address_changes(address_object, nb_ip, updated, failed)
 
 
 def updatelanipamip(address_object, nb_ip):
-    try:
-        addresserprivate = nb.ipam.ip_addresses.update([
-            {"id": nb_ip.id,
-             "status": address_object.status,
-             "assigned_object_type": "virtualization.vminterface",
-             "assigned_object_id": address_object.nb_int_id
-             }
-        ])
+    def updated(addresserprivate):
         print(f"Updated LAN IP {nb_ip.address} to VM {address_object.nb_vm_name}, "
               f"interface {address_object.nb_int_name}")
-    except RequestError as rq_error:
-        if "Cannot reassign IP address while it is designated as the primary IP for the parent object" in str(rq_error.error):
+        inventory.apply_address(addresserprivate)
+
+    def failed(e):
+        if "Cannot reassign IP address while it is designated as the primary IP for the parent object" in str(e):
             print(f"Error: Unable to update NetBox Address {nb_ip.address} "
                   f"as it is currently assigned as primary to NetBox object {nb_ip.assigned_object_id}!")
             pass
         else:
             print(f"Unable to update LAN IP {nb_ip.address} for Netbox VM {address_object.nb_vm_name}, "
-                  f"interface {address_object.nb_int_name} \n{rq_error}")
+                  f"interface {address_object.nb_int_name} \n{e}")
             sys.exit(1)
-    except Exception as e:
-        print(f"Unable to update LAN IP {nb_ip.address} for Netbox VM {address_object.nb_vm_name}, "
-              f"interface {address_object.nb_int_name} \n{e}")
-        sys.exit(1)
+
+    queue_address_changes(address_object, nb_ip, updated, failed)
+
+
+def queue_address_changes(address_object, nb_ip, updated, failed):
+    # We are left with updating only 2 useful values: the status and the bound Interface
+    changes = changed_fields("ipam.ip_addresses",
+                             {"status": address_object.status,
+                              "assigned_object_id": address_object.nb_int_id
+                              }, nb_ip)
+    if "assigned_object_id" in changes:
+        # NetBox needs the type of object along with its ID
+        changes["assigned_object_type"] = "virtualization.vminterface"
+    if changes:
+        queue_update("ipam.ip_addresses", dict(changes, id=nb_ip.id), updated, failed)
 
 
-def updatenetboxrouter(netbox_vm_id, router):
-    try:
-        routerer = nb.virtualization.virtual_machines.update([
-            {'id': netbox_vm_id,
-             'name': router.name,
-             'status': router.status
-             }
-        ])
-        print(f"Updated router {router.name} in NetBox cluster {cluster_name} for NetBox VM {netbox_vm_id}")
-    except Exception as e:
+def updatenetboxrouter(netbox_vm, router):
+    def updated(routerer):
+        print(f"Updated router {router.name} in NetBox cluster {cluster_name} for NetBox VM {netbox_vm.id}")
+        inventory.apply("vms", routerer)
+
+    def failed(e):
         if ("The request failed with code 400 Bad Request:" in str(e) and
                 "Virtual machine name must be unique per cluster." in str(e)):
             # If the router does not have a unique NetBox name, update it with our custom name
             router.name = router.custom_name
-            updatenetboxrouter(netbox_vm_id, router)
-            print(f"Updated custom-named VM {router.custom_name} in NetBox cluster {cluster_name} "
-                  f"based on OpenStack ID {router.router_id}")
+            updatenetboxrouter(netbox_vm, router)
         else:
-            print(f"Unable to update router {router.name} in NetBox cluster {cluster_name} for NetBox VM {netbox_vm_id} \n{e}")
+            print(f"Unable to update router {router.name} in NetBox cluster {cluster_name} for NetBox VM {netbox_vm.id} \n{e}")
             sys.exit(1)
 
+    queue_changes("virtualization.virtual_machines", netbox_vm.id,
+                  {'name': router.name,
+                   'status': router.status
+                   }, netbox_vm, updated, failed)
+
 
 def updatenetboxagent(netbox_vm_id, name):
-    try:
-        agenter = nb.virtualization.virtual_machines.update([
-            {'id': netbox_vm_id,
-             'name': name
-             }
-        ])
+    def updated(agenter):
         print(f"Updated Neutron server {name} in Netbox cluster {cluster_name}, because its DHCP-service ID was found")
-    except Exception as e:
+        inventory.apply("vms", agenter)
+
+    def failed(e):
         print(f"Unable to update Neutron server {name} in Netbox cluster {cluster_name} \n{e}")
         sys.exit(1)
+
+    # Only called when the name differs
+    queue_changes("virtualization.virtual_machines", netbox_vm_id, {'name': name}, None, updated, failed)
+
+
+def updatenetboxvmstatus(netbox_vm_id, status, vm_name):
+    # Used by tool_nb_update_vm_status.py, where a mass status change would otherwise be a PATCH per VM
+    def updated(vmer):
+        print(f"The status of {vm_name} in Netbox cluster {cluster_name} was updated")
+        inventory.apply("vms", vmer)
+
+    def failed(e):
+        print(f"Unable to update the status of {vm_name} in Netbox cluster {cluster_name} \n{e}")
+        sys.exit(1)
+
+    # Only called when the status differs
+    queue_changes("virtualization.virtual_machines", netbox_vm_id, {'status': status}, None, updated, failed)
@@ -0,0 +1,97 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# Our OpenStack clients share a single Keystone session, and with it one token and one pool of connections
+# Clients are only built when they are first used, so a tool that only talks to Nova never sets up the others
+# The scoped token can be kept on disk, so the next run doesn't have to authenticate again until it expires
+
+import os
+import sys
+import json
+import threading
+
+from keystoneauth1 import session
+from requests import Session as HTTPSession
+from requests.adapters import HTTPAdapter
+
+
+class LazyClient(object):
+    # Stands in for an OpenStack client like settings.nova, and builds it on first use
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory  # Returns the client
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                try:
+                    self._client = self._factory()
+                except Exception as e:
+                    print(f"Unable to authenticaticate with {self._name} using the supplied credentials. \n{e}")
+                    sys.exit(1)
+            return self._client
+
+    def __getattr__(self, attribute):
+        # Only called for attributes LazyClient doesn't have itself
+        return getattr(self.client(), attribute)
+
+
+def create_session(auth, pool_size):
+    # One connection pool, large enough for the API calls we make at the same time
+    http_session = HTTPSession()
+    adapter = HTTPAdapter(pool_maxsize=pool_size)
+    http_session.mount("http://", adapter)
+    http_session.mount("https://", adapter)
+    return session.Session(auth=auth, session=http_session)
+
+
+def load_token(auth, token_cache_file):
+    # keystoneauth renews the token by itself, once the one we give it is about to expire
+    if not token_cache_file or not os.path.isfile(token_cache_file):
+        return
+    try:
+        with open(token_cache_file) as cache_file:
+            token_cache = json.load(cache_file)
+        if token_cache['cache_id'] == auth.get_cache_id():
+            # The cache ID changes along with the credentials, so we never use the token of another user or project
+            auth.set_auth_state(token_cache['state'])
+    except Exception as e:
+        print(f"Ignoring unreadable OpenStack token cache {token_cache_file} \n{e}")
+
+
+def save_token(auth, token_cache_file):
+    if not token_cache_file:
+        return
+    state = auth.get_auth_state()
+    if state is None:
+        # We never authenticated, so there's nothing to keep
+        return
+    try:
+        # It holds a token, so only we may read it
+        cache_descriptor = os.open(token_cache_file + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(cache_descriptor, "w") as cache_file:
+            json.dump({'cache_id': auth.get_cache_id(), 'state': state}, cache_file)
+        os.replace(token_cache_file + ".tmp", token_cache_file)
+    except Exception as e:
+        print(f"Unable to save OpenStack token cache {token_cache_file} \n{e}")
@@ -22,11 +22,25 @@
 import sys
 import ipaddress
 
+from scripts.scheduler import Task
+from scripts.scheduler import run_tasks
+from scripts.scheduler import print_task_timings
+from scripts.openstack.snapshot import incremental_collection
+from scripts.openstack.snapshot import collect
+
 import settings
 keystone = settings.keystone
 cinder = settings.cinder
 nova = settings.nova
 neutron = settings.neutron
+api_workers = settings.os_api_workers
+neutron_page_size = settings.os_neutron_page_size
+
+# The only ports getinterfaces() keeps, and the only fields it reads. Neutron leaves out everything else
+port_device_owners = ['compute:nova', 'network:router_gateway', 'network:ha_router_replicated_interface',
+                      'network:router_ha_interface', 'network:dhcp']
+port_fields = ['id', 'name', 'status', 'mac_address', 'network_id', 'fixed_ips', 'device_owner', 'device_id',
+               'binding:host_id', 'updated_at']
 
 
 def get_keystone():
@@ -48,19 +62,44 @@ def get_keystone():
 
 
 def get_nova():
+    # Instances and Flavors don't depend on each other, so we fetch them at the same time
+    nova_results, nova_timings = run_tasks([Task("Nova Instances", get_nova_instances),
+                                            Task("Nova Flavors", get_nova_flavors)], api_workers)
+    print_task_timings(nova_timings, "Nova API calls")
+    return nova_results["Nova Instances"], nova_results["Nova Flavors"]
+
+
+def get_nova_instances():
+    if incremental_collection():
+        # Nova reports Instances changed since a moment, including those that were deleted since
+        from novaclient.v2.servers import Server
+        myinstances = collect("Nova Instances",
+                              lambda: [server.to_dict() for server in list_nova_instances({})],
+                              lambda since: [server.to_dict() for server in
+                                             list_nova_instances({'changes-since': since})],
+                              'updated', is_deleted=lambda server: server['status'] == "DELETED")
+        return [Server(nova.servers, server, loaded=True) for server in myinstances]
+    return list_nova_instances({})
+
+
+def list_nova_instances(search_opts):
     try:
         # We try to fetch information from Nova with an admin-only API call
-        myinstances = nova.servers.list(search_opts={'all_tenants': 1})
+        myinstances = nova.servers.list(search_opts=dict(search_opts, all_tenants=1))
         print(f"Fetched Instance information as an admin")
     except Exception as e:
         if "Policy doesn't allow os_compute_api:servers:detail:get_all_tenants" in str(e):
             # On an Exception, We try to fetch information from Nova with a regular user API call
             print(f"Fetching Instances failed: {e}\nFetching Instance information as a regular user")
-            myinstances = nova.servers.list()
+            myinstances = nova.servers.list(search_opts=search_opts)
             print(f"Fetched OpenStack Instance information as a regular user")
         else:
             print(f"Unable to collection Instance information \n{e}")
             sys.exit(1)
+    return myinstances
+
+
+def get_nova_flavors():
     try:
         # We fetch Flavor information using a semi-admin API call
         myflavors = nova.flavors.list(is_public=None)
@@ -76,7 +115,7 @@ def get_nova():
         except Exception as e:
             print(f"Unable to collect Flavor information \n{e}")
             sys.exit(1)
-    return myinstances, flavordictionary
+    return flavordictionary
 
 
 def get_cinder():
@@ -99,6 +138,46 @@ def get_cinder():
 
 
 def get_neutron():
+    # The Neutron list calls don't depend on each other, so we run them at the same time
+    # Only building our dictionaries has to wait: Interfaces need the DHCP agents and the VRFs need the Interfaces
+    neutron_results, neutron_timings = run_tasks([
+        Task("Neutron DHCP agents", get_neutron_dhcpagents),
+        Task("Neutron ports", get_neutron_ports),
+        Task("Neutron networks", get_neutron_networks),
+        Task("Neutron subnets", get_neutron_subnets),
+        Task("Neutron Floating-IPs", get_neutron_floatips),
+        Task("Neutron routers", get_neutron_routers),
+        # Ports are streamed, page by page, while the interfaces are built
+        Task("Neutron interfaces", build_neutron_interfaces, depends_on=["Neutron ports", "Neutron DHCP agents"]),
+        Task("Neutron VRFs", build_neutron_vrfs, depends_on=["Neutron interfaces", "Neutron networks"])
+    ], api_workers)
+    print_task_timings(neutron_timings, "Neutron API calls")
+    return (neutron_results["Neutron interfaces"], neutron_results["Neutron VRFs"],
+            neutron_results["Neutron Floating-IPs"], neutron_results["Neutron routers"],
+            neutron_results["Neutron DHCP agents"], neutron_results["Neutron subnets"])
+
+
+def list_neutron(kind, list_call, **filters):
+    # list_call is a Neutron list method like neutron.list_ports, its response holds the objects under kind
+    if not incremental_collection():
+        return list_call(**filters)[kind]
+    # Neutron only reports objects that still exist, so we list their IDs to find out which were deleted
+    id_filters = dict(filters, fields='id')
+    return collect("Neutron " + kind,
+                   lambda: list_call(**filters)[kind],
+                   lambda since: list_call(changed_since=since, **filters)[kind],
+                   'updated_at', list_ids=lambda: [item['id'] for item in list_call(**id_filters)[kind]])
+
+
+def stream_neutron_ports():
+    # Only a page of ports is held at a time, getinterfaces() keeps what it needs from each
+    for page in neutron.list_ports(retrieve_all=False, limit=neutron_page_size, fields=port_fields,
+                                   device_owner=port_device_owners):
+        for port in page['ports']:
+            yield port
+
+
+def get_neutron_dhcpagents():
     try:
         # We attempt to collect information from Neutron for existing DHCP-agents
         neutronagents = neutron.list_agents()  # Empty result if regular user is used
@@ -108,45 +187,82 @@ def get_neutron():
     except Exception as e:
         print(f"Unable to collect Neutron DHCP agent information \n{e}")
         sys.exit(1)
+    return neutron_dhcp_agent_dictionary
+
+
+def get_neutron_ports():
     try:
         # We attempt to collect information from Neutron for Interfaces used for pretty much anything, except Float-IPs
-        neutronports = neutron.list_ports()
-        neutronports = neutronports['ports']
+        if incremental_collection():
+            # The snapshot needs every port anyway
+            neutronports = list_neutron('ports', neutron.list_ports, fields=port_fields,
+                                        device_owner=port_device_owners)
+        else:
+            # Nothing is asked from Neutron yet, build_neutron_interfaces() goes through the pages
+            neutronports = stream_neutron_ports()
+    except Exception as e:
+        print(f"Unable to collect Neutron interface information \n{e}")
+        sys.exit(1)
+    return neutronports
+
+
+def build_neutron_interfaces(neutronports, neutron_dhcp_agent_dictionary):
+    try:
         neutroninterfacedictionary = getinterfaces(neutronports, neutron_dhcp_agent_dictionary)
         # We pass along the neutron agent dictionary to perform ID-substitution
         print(f"Fetched Neutron interface information")
     except Exception as e:
         print(f"Unable to collect Neutron interface information \n{e}")
         sys.exit(1)
+    return neutroninterfacedictionary
+
+
+def get_neutron_networks():
     try:
         # We attempt to collect information from Neutron for all Networks available to this user
-        neutronlistnetworks = neutron.list_networks()
-        neutronlistnetworks = neutronlistnetworks['networks']
+        neutronlistnetworks = list_neutron('networks', neutron.list_networks)
+    except Exception as e:
+        print(f"Unable to collect Neutron network information \n{e}")
+        sys.exit(1)
+    return neutronlistnetworks
+
+
+def build_neutron_vrfs(neutroninterfacedictionary, neutronlistnetworks):
+    try:
         neutronnetworkdictionary = getneutronnetworks(neutroninterfacedictionary, neutronlistnetworks)
         print(f"Fetched Neutron network information")
     except Exception as e:
         print(f"Unable to collect Neutron network information \n{e}")
         sys.exit(1)
+    return neutronnetworkdictionary
+
+
+def get_neutron_subnets():
     try:
-        # We attempt to collect information from Neutron for Interfaces used for pretty much anything, except Float-IPs
-        neutronsubnets = neutron.list_subnets()
-        neutronsubnets = neutronsubnets['subnets']
+        # We attempt to collect information from Neutron for all Subnets available to this user
+        neutronsubnets = list_neutron('subnets', neutron.list_subnets)
         neutronsubnetdictionary = getsubnets(neutronsubnets)
-        # We pass along the neutron agent dictionary to perform ID-substitution
         print(f"Fetched Neutron subnet information")
     except Exception as e:
         print(f"Unable to collect Neutron subnet information \n{e}")
         sys.exit(1)
+    return neutronsubnetdictionary
+
+
+def get_neutron_floatips():
     try:
         # We attempt to collect information from Neutron for Floating IPs used by Nova available to this user
         # Although Neutron Interfaces were collected earlier, we use this API call because there's better information
-        neutronfloatports = neutron.list_floatingips()
-        neutronfloatports = neutronfloatports['floatingips']
+        neutronfloatports = list_neutron('floatingips', neutron.list_floatingips)
         neutronfloatdictionary = parsefloatips(neutronfloatports)
         print(f"Fetched Neutron Floating-IP information")
     except Exception as e:
         print(f"Unable to collect Neutron FLoating-IP information \n{e}")
         sys.exit(1)
+    return neutronfloatdictionary
+
+
+def get_neutron_routers():
     try:
         # We attempt to collect information from Neutron for Routers available to this user
         neutronrouters = neutron.list_routers()
@@ -156,7 +272,7 @@ def get_neutron():
     except Exception as e:
         print(f"Unable to collect fetch Neutron Router information \n{e}")
         sys.exit(1)
-    return neutroninterfacedictionary, neutronnetworkdictionary, neutronfloatdictionary, neutronrouterdictionary, neutron_dhcp_agent_dictionary, neutronsubnetdictionary
+    return neutronrouterdictionary
 
 
 def getflavor(myflavors):
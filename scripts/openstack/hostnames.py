@@ -0,0 +1,124 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+hostname_cache_file = settings.os_hostname_cache_file
+console_workers = settings.os_console_workers
+console_lines = settings.os_console_lines
+
+hostname_cache_hits = 0
+hostname_cache_misses = 0
+
+
+def resolve_hostnames(myinstances):
+    # We collect the hostnames of all Instances up front, several console-output calls at a time
+    # Hostnames are cached on disk per Instance ID + launch moment, so unchanged Instances are never asked again
+    global hostname_cache_hits
+    global hostname_cache_misses
+    hostname_cache = load_hostname_cache()
+    hits = 0
+    misses = 0
+    hostname_dictionary = {}
+    instances_to_query = []
+    for instance in myinstances:
+        if instance.status != "ACTIVE":
+            # Console output won't be available for Instances that are shutoff/unavailable, so set hostname to unknown
+            hostname_dictionary[instance.id] = "unknown"
+            continue
+        cached_hostname = hostname_cache.get(instance.id)
+        if cached_hostname is not None and cached_hostname['launched'] == get_launch_moment(instance):
+            hits = hits + 1
+            hostname_dictionary[instance.id] = cached_hostname['hostname']
+        else:
+            misses = misses + 1
+            instances_to_query.append(instance)
+    with ThreadPoolExecutor(max_workers=console_workers) as pool:
+        for instance, (hostname, error) in zip(instances_to_query, pool.map(fetch_hostname, instances_to_query)):
+            if error is not None:
+                print(f"Unable to get console-output for Instance {instance.name} \n{error}")
+                sys.exit(1)
+            hostname_dictionary[instance.id] = hostname
+            if hostname != "unknown":
+                # We don't cache misses, the login prompt may simply not have shown up yet
+                hostname_cache[instance.id] = {'launched': get_launch_moment(instance), 'hostname': hostname}
+    # Instances that no longer exist are dropped from the cache
+    hostname_cache = {instance_id: cached for instance_id, cached in hostname_cache.items()
+                      if instance_id in hostname_dictionary}
+    save_hostname_cache(hostname_cache)
+    # The module counters keep adding up, for when the sync runs more than once in the same process
+    hostname_cache_hits = hostname_cache_hits + hits
+    hostname_cache_misses = hostname_cache_misses + misses
+    print(f"Resolved Instance hostnames: {hits} from cache, {misses} via the console-output of the Instance")
+    return hostname_dictionary
+
+
+def get_launch_moment(instance):
+    # launched_at is renewed when an Instance is rebuilt, which is when its hostname may have changed
+    launched = getattr(instance, 'OS-SRV-USG:launched_at', None)
+    if launched is None:
+        launched = getattr(instance, 'created', None)
+    return str(launched)
+
+
+def fetch_hostname(instance):
+    # Runs in a worker thread, so we return errors rather than exiting from here
+    try:
+        # Attempt to get hostname from console output, only the last lines because that's where the login prompt is
+        consoleoutput = instance.get_console_output(length=console_lines)  # Admin only call
+    except Exception as e:
+        if "Policy doesn't allow os_compute_api:os-console-output to be performed. (HTTP 403)" in str(e):
+            # A non-admin was used to request this information, so we set the hostname to Unknown
+            return "unknown", None
+        return None, e
+    hostnamesearch = re.search(r'(.*)\s\blogin:\s', consoleoutput)
+    if hostnamesearch is None:
+        # If the regex finds no matches, we set the hostname to unknown
+        return "unknown", None
+    return re.sub(r'\s\blogin:\s', '', hostnamesearch.group(0)), None
+
+
+def load_hostname_cache():
+    if not hostname_cache_file or not os.path.isfile(hostname_cache_file):
+        return {}
+    try:
+        with open(hostname_cache_file) as cache_file:
+            return json.load(cache_file)
+    except Exception as e:
+        # A broken cache only costs us some console-output calls
+        print(f"Ignoring unreadable hostname cache {hostname_cache_file} \n{e}")
+        return {}
+
+
+def save_hostname_cache(hostname_cache):
+    if not hostname_cache_file:
+        return
+    try:
+        with open(hostname_cache_file + ".tmp", "w") as cache_file:
+            json.dump(hostname_cache, cache_file)
+        os.replace(hostname_cache_file + ".tmp", hostname_cache_file)
+    except Exception as e:
+        print(f"Unable to save hostname cache {hostname_cache_file} \n{e}")
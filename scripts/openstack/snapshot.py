@@ -0,0 +1,164 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+
+# Only used when os_collection_mode is "incremental"
+# A snapshot of the OpenStack objects we collected, kept in an SQLite file between runs
+# A run asks OpenStack only for the objects changed since the newest one in the snapshot and merges them in
+# The changes are saved once the whole run succeeded, so a failed run asks for the same changes again
+
+import json
+import time
+import sqlite3
+import threading
+
+import settings
+snapshot_file = settings.os_snapshot_file
+collection_mode = settings.os_collection_mode
+snapshot_max_age = settings.os_snapshot_max_age
+
+# "incremental" trusts the snapshot, "verify" also collects everything to compare it with the snapshot,
+# "rebuild" ignores the snapshot and collects everything, see --verify-state and --rebuild-state
+mode = "incremental"
+
+snapshot_lock = threading.Lock()
+connection = None
+# The snapshot per kind, so the sync cycles of --daemon don't read it back from the file every time
+memory = {}
+pending_snapshots = {}  # kind → (whether it was a full collection, changed objects, IDs of objects that are gone)
+
+
+def incremental_collection():
+    return collection_mode == "incremental" and bool(snapshot_file)
+
+
+def set_mode(new_mode):
+    global mode
+    mode = new_mode
+
+
+def get_connection():
+    global connection
+    if connection is None:
+        connection = sqlite3.connect(snapshot_file, check_same_thread=False)
+        connection.execute("CREATE TABLE IF NOT EXISTS objects (kind TEXT, object_id TEXT, updated TEXT, "
+                           "record TEXT, PRIMARY KEY (kind, object_id))")
+        connection.execute("CREATE TABLE IF NOT EXISTS collections (kind TEXT PRIMARY KEY, collected REAL)")
+        connection.commit()
+    return connection
+
+
+def collect(kind, list_all, list_changed, updated_key, list_ids=None, is_deleted=None):
+    # list_all() returns every object as a dictionary, list_changed(since) those updated since that moment
+    # Deleted objects are either reported by list_changed() and recognised by is_deleted(),
+    # or found because list_ids() doesn't return their ID anymore
+    with snapshot_lock:
+        store = get_connection()
+        if kind not in memory:
+            memory[kind] = dict((object_id, (updated, record)) for object_id, updated, record in
+                                store.execute("SELECT object_id, updated, record FROM objects WHERE kind = ?", (kind,)))
+        cached = dict(memory[kind])
+        collected = store.execute("SELECT collected FROM collections WHERE kind = ?", (kind,)).fetchone()
+    stored_moments = [updated for updated, record in cached.values() if updated]
+    if (mode == "rebuild" or not stored_moments or collected is None or
+            time.time() - collected[0] > snapshot_max_age):
+        # Deleted markers don't last forever, so every now and then we collect everything again
+        return collect_everything(kind, list_all, updated_key)
+    since = max(stored_moments)
+    changed = {}
+    gone_ids = set()
+    for item in list_changed(since):
+        if is_deleted is not None and is_deleted(item):
+            gone_ids.add(item['id'])
+        else:
+            changed[item['id']] = item
+    if list_ids is not None:
+        current_ids = set(list_ids())
+        gone_ids.update(set(cached) - current_ids)
+        if current_ids - set(cached) - set(changed):
+            # Something appeared that wasn't updated since our newest object, we don't guess and collect everything
+            return collect_everything(kind, list_all, updated_key)
+    current_ids = (set(cached) | set(changed)) - gone_ids
+    items = [changed[object_id] if object_id in changed else json.loads(cached[object_id][1])
+             for object_id in current_ids]
+    with snapshot_lock:
+        pending_snapshots[kind] = (False, [(item, item.get(updated_key)) for item in changed.values()], gone_ids)
+    print(f"Collected {len(changed)} changed {kind}, {len(items) - len(changed)} came from the snapshot "
+          f"and {len(gone_ids & set(cached))} were deleted")
+    if mode == "verify":
+        items = verify_snapshot(kind, list_all, updated_key, items)
+    return items
+
+
+def collect_everything(kind, list_all, updated_key):
+    items = list_all()
+    with snapshot_lock:
+        pending_snapshots[kind] = (True, [(item, item.get(updated_key)) for item in items], set())
+    return items
+
+
+def verify_snapshot(kind, list_all, updated_key, items):
+    # Collect everything after all, and tell what the snapshot got wrong. OpenStack's answer replaces it
+    openstack_items = list_all()
+    snapshot = dict((item['id'], item.get(updated_key)) for item in items)
+    collected = dict((item['id'], item.get(updated_key)) for item in openstack_items)
+    missing = len(set(collected) - set(snapshot))
+    extra = len(set(snapshot) - set(collected))
+    outdated = len([object_id for object_id in collected
+                    if object_id in snapshot and snapshot[object_id] != collected[object_id]])
+    if missing or extra or outdated:
+        print(f"The snapshot disagrees with OpenStack on {kind}: {missing} missing, {extra} deleted "
+              f"and {outdated} outdated objects. They have been corrected")
+    else:
+        print(f"The snapshot agrees with OpenStack on {kind}")
+    with snapshot_lock:
+        pending_snapshots[kind] = (True, [(item, item.get(updated_key)) for item in openstack_items], set())
+    return openstack_items
+
+
+def save_snapshots():
+    # Called at the end of a succesful run
+    if not incremental_collection():
+        return
+    with snapshot_lock:
+        store = get_connection()
+        for kind, (everything, items, gone_ids) in pending_snapshots.items():
+            rows = [(kind, item['id'], updated, json.dumps(item)) for item, updated in items]
+            if everything:
+                store.execute("DELETE FROM objects WHERE kind = ?", (kind,))
+                store.execute("INSERT OR REPLACE INTO collections VALUES (?, ?)", (kind, time.time()))
+                memory[kind] = {}
+            store.executemany("DELETE FROM objects WHERE kind = ? AND object_id = ?",
+                              [(kind, object_id) for object_id in gone_ids])
+            store.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)", rows)
+            in_memory = memory.setdefault(kind, {})
+            for object_id in gone_ids:
+                in_memory.pop(object_id, None)
+            for row_kind, object_id, updated, record in rows:
+                in_memory[object_id] = (updated, record)
+        store.commit()
+        pending_snapshots.clear()
+
+
+def discard_snapshots():
+    # For --daemon, the changes of a failed sync cycle are collected again by the next one
+    with snapshot_lock:
+        pending_snapshots.clear()
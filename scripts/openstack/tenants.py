@@ -0,0 +1,119 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+keystone = settings.keystone
+tenant_cache_file = settings.os_tenant_cache_file
+tenant_cache_ttl = settings.os_tenant_cache_ttl
+keystone_workers = settings.os_keystone_workers
+
+# Only used when get_keystone() couldn't list all projects, and we have to ask Keystone per Tenant ID
+# Thousands of Instances share a handful of Tenants, so we ask once per Tenant and remember the answer
+tenant_names = {}  # Tenant ID → Tenant name
+tenant_errors = {}  # Tenant ID → the Exception Keystone gave us for it
+tenant_lock = threading.Lock()
+
+
+def prefetch_tenants(tenant_ids):
+    # Resolve every distinct Tenant ID up front, several Keystone calls at a time
+    tenant_ids = set(tenant_ids)
+    load_tenant_cache()
+    with tenant_lock:
+        missing_ids = [tenant_id for tenant_id in tenant_ids
+                       if tenant_id not in tenant_names and tenant_id not in tenant_errors]
+    with ThreadPoolExecutor(max_workers=keystone_workers) as pool:
+        list(pool.map(fetch_tenant, missing_ids))
+    save_tenant_cache()
+    print(f"Resolved {len(tenant_ids)} Tenants using {len(missing_ids)} Keystone calls")
+
+
+def get_tenant_name(tenant_id):
+    # Behaves like keystone.projects.get(tenant_id).name, including raising the error Keystone gave us
+    with tenant_lock:
+        if tenant_id in tenant_names:
+            return tenant_names[tenant_id]
+        if tenant_id in tenant_errors:
+            raise tenant_errors[tenant_id]
+    fetch_tenant(tenant_id)
+    return get_tenant_name(tenant_id)
+
+
+def fetch_tenant(tenant_id):
+    try:
+        tenantname = keystone.projects.get(tenant_id).name  # We fetch Tenant name via Keystone call
+    except Exception as e:
+        # We remember failures as well, so a missing Tenant doesn't cost us a call per Instance
+        with tenant_lock:
+            tenant_errors[tenant_id] = e
+        return
+    with tenant_lock:
+        tenant_names[tenant_id] = tenantname
+
+
+def load_tenant_cache():
+    if not tenant_cache_file or not os.path.isfile(tenant_cache_file):
+        return
+    try:
+        with open(tenant_cache_file) as cache_file:
+            tenant_cache = json.load(cache_file)
+    except Exception as e:
+        print(f"Ignoring unreadable Tenant cache {tenant_cache_file} \n{e}")
+        return
+    if time.time() - tenant_cache['saved'] > tenant_cache_ttl:
+        # Tenants may have been renamed in the meantime, so we ask Keystone again
+        return
+    with tenant_lock:
+        for tenant_id, tenantname in tenant_cache['tenants'].items():
+            tenant_names.setdefault(tenant_id, tenantname)
+
+
+def save_tenant_cache():
+    if not tenant_cache_file:
+        return
+    try:
+        saved = time.time()
+        if os.path.isfile(tenant_cache_file):
+            # Tenants that came from the cache keep the age of the cache, so they still expire in time
+            with open(tenant_cache_file) as cache_file:
+                old_cache = json.load(cache_file)
+            if time.time() - old_cache['saved'] <= tenant_cache_ttl:
+                saved = old_cache['saved']
+        with tenant_lock:
+            tenant_cache = {'saved': saved, 'tenants': dict(tenant_names)}
+        with open(tenant_cache_file + ".tmp", "w") as cache_file:
+            json.dump(tenant_cache, cache_file)
+        os.replace(tenant_cache_file + ".tmp", tenant_cache_file)
+    except Exception as e:
+        print(f"Unable to save Tenant cache {tenant_cache_file} \n{e}")
+
+
+def reset_tenants():
+    # For --daemon: a Keystone error shouldn't stick for the life of the process, and Tenants may be renamed
+    # Names that are still fresh come back from the Tenant cache file on the next prefetch_tenants()
+    with tenant_lock:
+        tenant_names.clear()
+        tenant_errors.clear()
@@ -23,6 +23,10 @@ import sys
 
 from scripts.netbox.create import createvmdisk
 from scripts.netbox.update import updatevmdisk
+from scripts.netbox.bulk import flush_netbox_queues
+from scripts.netbox.fingerprints import object_fingerprint
+from scripts.netbox.fingerprints import is_unchanged
+from scripts.netbox.fingerprints import remember
 
 import settings
 cluster_name = settings.cluster_name
@@ -49,7 +53,11 @@ def cinder_to_netboxdisks(cinderdictionary, netbox_volume_dictionary, netbox_vm_
             if volumeid in netbox_volume_dictionary.keys():
                 # If the disk ID is found in Netbox, we update said Volume
                 netboxdisk = netbox_volume_dictionary.get(volumeid)
-                compare_vol_objects(os_cinder_vol, netboxdisk, netboxvm)
+                vol_fingerprint = object_fingerprint(os_cinder_vol, netboxvm.id)
+                if is_unchanged("disks", volumeid, vol_fingerprint, netboxdisk):
+                    unchanged_vol_counter()
+                    continue
+                compare_vol_objects(os_cinder_vol, netboxdisk, netboxvm, vol_fingerprint)
             elif volumeid not in netbox_volume_dictionary.keys():
                 # If the Volume is not found, we create a Netbox Volume and attach it
                 createvmdisk(os_cinder_vol, netboxvm)
@@ -57,6 +65,7 @@ def cinder_to_netboxdisks(cinderdictionary, netbox_volume_dictionary, netbox_vm_
             print(f"Unable to create or update OpenStack Volume {osvolumename} \n{e}")
             print(vars(os_cinder_vol))
             sys.exit(1)
+    flush_netbox_queues()
     print(f"Skipped {unchangedvols} Virtual Disks because their state hasn't changed.")
 
 
@@ -69,8 +78,7 @@ class CreateCinderVolumeObject(object):
         self.vol_size = os_vol_size
 
 
-def compare_vol_objects(os_cinder_vol_obj, nb_vol, nb_vm):
-    global unchangedvols
+def compare_vol_objects(os_cinder_vol_obj, nb_vol, nb_vm, fingerprint=None):
     try:
         if (nb_vol.size != os_cinder_vol_obj.vol_size or
                 (nb_vol.name != os_cinder_vol_obj.vol_name and nb_vol.name != os_cinder_vol_obj.custom_name) or
@@ -78,11 +86,22 @@ def compare_vol_objects(os_cinder_vol_obj, nb_vol, nb_vm):
             updatevmdisk(os_cinder_vol_obj, nb_vm, nb_vol)
         else:
             # If nothing changed, we skip updating the Volume
-            unchangedvols = unchangedvols + 1
-            if (unchangedvols % 10) == 0:
-                print(f"Skipped {unchangedvols} NetBox Virtual Disks because nothing changed")
-            pass
+            remember("disks", os_cinder_vol_obj.vol_id, fingerprint, nb_vol)
+            unchanged_vol_counter()
     except Exception as e:
         print(f"Unable to compare states for Virtual Disk {os_cinder_vol_obj} \n{e}")
         print(vars(os_cinder_vol_obj))
         sys.exit(1)
+
+
+def unchanged_vol_counter():
+    global unchangedvols
+    unchangedvols = unchangedvols + 1
+    if (unchangedvols % 10) == 0:
+        print(f"Skipped {unchangedvols} NetBox Virtual Disks because nothing changed")
+
+
+def reset_volume_counters():
+    # For --daemon, every sync cycle counts its own skipped objects
+    global unchangedvols
+    unchangedvols = 0
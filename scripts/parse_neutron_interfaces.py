@@ -27,6 +27,11 @@ from scripts.netbox.update import updatevminterface
 from scripts.netbox.create import createnetboxmac
 from scripts.netbox.update import update_netbox_interface_mac
 
+from scripts.netbox.bulk import flush_netbox_queues
+from scripts.netbox.fingerprints import object_fingerprint
+from scripts.netbox.fingerprints import is_unchanged
+from scripts.netbox.fingerprints import remember
+
 unchangedints = 0
 unchangedmacs = 0
 
@@ -56,7 +61,11 @@ def netboxinterfaces(neutrondictionary, netbox_interface_dictionary, netbox_vm_d
             if interfaceid in netbox_interface_dictionary.keys():
                 # If the OpenStack interface ID already exists, we find and update it
                 netboxint = netbox_interface_dictionary.get(interfaceid)
-                compare_int_objects(os_interface, netboxint, nb_vm)
+                int_fingerprint = object_fingerprint(os_interface, nb_vm.id)
+                if is_unchanged("interfaces", interfaceid, int_fingerprint, netboxint):
+                    unchanged_int_counter()
+                    continue
+                compare_int_objects(os_interface, netboxint, nb_vm, int_fingerprint)
             elif interfaceid not in netbox_interface_dictionary.keys():
                 # If we don't find the Interface ID, we create an Interface
                 createvminterface(os_interface, nb_vm)
@@ -67,6 +76,7 @@ def netboxinterfaces(neutrondictionary, netbox_interface_dictionary, netbox_vm_d
         print(f"Unable to run Neutron interfaces to NetBox function \n{e}\n")
         print(f"{neutrondictionary} \n {netbox_interface_dictionary}")
         sys.exit(1)
+    flush_netbox_queues()
     print(f"Skipped {unchangedints} Interfaces in total, because their state hasn't changed.")
 
 
@@ -82,8 +92,7 @@ class CreateNeutronInterfaceObject(object):
         self.instance_id = os_int_instance_id  # Instance the Interface is bound to
 
 
-def compare_int_objects(os_int_obj, nb_int, nb_vm):
-    global unchangedints
+def compare_int_objects(os_int_obj, nb_int, nb_vm, fingerprint=None):
     try:
         if ((nb_int.name != os_int_obj.int_name and nb_int.name != os_int_obj.custom_name) or
                 nb_int.virtual_machine.id != nb_vm.id):
@@ -92,17 +101,23 @@ def compare_int_objects(os_int_obj, nb_int, nb_vm):
             # We don't check for a changed MAC-address because that would be weird
             updatevminterface(os_int_obj, nb_int, nb_vm)
         else:
-            unchangedints = unchangedints + 1
-            if (unchangedints % 10) == 0:
-                print(f"Skipped {unchangedints} NetBox Interfaces because nothing changed")
-            else:
-                pass
+            remember("interfaces", os_int_obj.int_id, fingerprint, nb_int)
+            unchanged_int_counter()
     except Exception as e:
         print(f"Unable to compare states for Interface {os_int_obj} VM {nb_vm.name} \n{e}")
         print(vars(os_int_obj))
         sys.exit(1)
 
 
+def unchanged_int_counter():
+    global unchangedints
+    unchangedints = unchangedints + 1
+    if (unchangedints % 10) == 0:
+        print(f"Skipped {unchangedints} NetBox Interfaces because nothing changed")
+    else:
+        pass
+
+
 def netboxmacs(neutrondictionary, netbox_interface_dictionary):
     global unchangedmacs
     try:
@@ -128,15 +143,16 @@ def netboxmacs(neutrondictionary, netbox_interface_dictionary):
                     update_netbox_interface_mac(netbox_mac, netbox_interface)
                 elif netbox_interface.mac_addresses is None or netbox_interface.mac_address is None:
                     # This Interface doesn't have a MAC-address, thus it can't have one set as primary either
-                    netbox_mac = createnetboxmac(osinterface, netbox_interface)
-                    # If the above script doesn't error out, let's associate the MAC-address right away!
-                    update_netbox_interface_mac(netbox_mac, netbox_interface)
+                    # Once the MAC-address has been created, we associate it right away!
+                    createnetboxmac(osinterface, netbox_interface,
+                                    lambda netbox_mac, nb_int=netbox_interface: update_netbox_interface_mac(netbox_mac, nb_int))
                 else:
                     pass
     except Exception as e:
         print(f"Unable to run Neutron interface MAC-addresses to NetBox function \n{e}\n")
         print(f"Neutron source: {neutrondictionary} \n NetBox interfaces source: {netbox_interface_dictionary}")
         sys.exit(1)
+    flush_netbox_queues()
     print(f"Skipped {unchangedmacs} MAC-addresses in total, because there were no changes")
 
 
@@ -147,3 +163,11 @@ def unchanged_mac_counter():
         print(f"Skipped {unchangedmacs} NetBox MAC-addresses because nothing changed")
     else:
         pass
+
+
+def reset_interface_counters():
+    # For --daemon, every sync cycle counts its own skipped objects
+    global unchangedints
+    global unchangedmacs
+    unchangedints = 0
+    unchangedmacs = 0
@@ -28,8 +28,12 @@ from scripts.netbox.create import createlanipamip
 from scripts.netbox.update import updateglobalipamip
 from scripts.netbox.update import updatelanipamip
 
+from scripts.netbox.bulk import flush_netbox_queues
+from scripts.netbox.fingerprints import object_fingerprint
+from scripts.netbox.fingerprints import is_unchanged
+from scripts.netbox.fingerprints import remember
+
 import settings
-nb = settings.nb
 cluster_name = settings.cluster_name
 
 unchanged_wan_ips = 0
@@ -91,6 +95,7 @@ def netboxipam(neutronintdic, neutronsubnetdictionary, netbox_vm_dictionary, net
             print(f"Unable to run script to parse IP-addresses to pass to IP-creation script for Interface {portid}")
             print(f"{e}")
             sys.exit(1)
+    flush_netbox_queues()
     print(f"Skipped {unchanged_wan_ips} WAN IPs and {unchanged_lan_ips} LAN IPs thus far, because there were no changes.")
 
 
@@ -123,6 +128,7 @@ def netboxipamfloat(neutronfloatdictionary, neutronsubnetdictionary, netbox_vm_d
             print(f"Unable to run script to parse Floating IP-addresses to pass to IP-creation script because of Float ID {floatid}")
             print(f"{e}")
             sys.exit(1)
+    flush_netbox_queues()
     print(f"Skipped {unchanged_wan_ips} WAN IPs and {unchanged_lan_ips} LAN IPs in total, because there were no changes.")
 
 
@@ -135,7 +141,7 @@ def netboxipamglobalip(openstack_ip, address_obj, netbox_wan_dic):
             # This means if you already have this global IP in Netbox, my script will 'take ownership'and modify it
             # We don't add a NetBox Tag to it either
             netbox_ip = netbox_wan_dic.get(openstack_ip)
-            compare_wan_address(address_obj, netbox_ip)
+            compare_wan_address(address_obj, netbox_ip, "wan " + str(openstack_ip))
         elif openstack_ip not in netbox_wan_dic.keys():
             # If the IP doesn't exist, we create and associate it
             createglobalipamip(address_obj)
@@ -146,33 +152,19 @@ def netboxipamglobalip(openstack_ip, address_obj, netbox_wan_dic):
 
 def netboxipamlanip(unprefixed_ip, address_obj, netbox_lan_dic, netbox_vrf):
     try:
-        if unprefixed_ip not in netbox_lan_dic.keys():
+        if not netbox_lan_dic.has_address(unprefixed_ip):
             # The IP should at least always be found in NetBox, so we immediately create it!
             createlanipamip(address_obj, netbox_vrf)
-        elif unprefixed_ip in netbox_lan_dic.keys():
-            netbox_ip = netbox_lan_dic.get(unprefixed_ip)
-            if netbox_ip.vrf.id == netbox_vrf.id:
-                # Local IPs/Interfaces are never migrated between OpenStack Networks/VRFs,
-                # So we should assume the Network on the OpenStack side, is still the same on the NetBox side too
-                # If this IP already exists in the VRF we expect it to, we can start comparing
-                compare_lan_address(address_obj, netbox_ip)
-            elif netbox_ip.vrf.id != netbox_vrf.id:
-                # Otherwise, if the IP is in the dictionary but not in the VRF we expect
-                # That means the same IP address exists in NetBox but also in different VRF(s),
-                # which will have gotten squashed together in our dictionary
-                # So we do an API call to check if the object exists in our specific VRF
-                if nb.ipam.ip_addresses.get(address=unprefixed_ip, vrf_id=netbox_vrf.id, tag="openstack-api-script") is not None:
-                    netbox_ip = nb.ipam.ip_addresses.get(address=unprefixed_ip, vrf_id=netbox_vrf.id, tag="openstack-api-script")
-                    compare_lan_address(address_obj, netbox_ip)
-                else:
-                    # And if we truly could not find it, we create it instead
-                    createlanipamip(address_obj, netbox_vrf)
-            else:
-                # In case the IP exists in multiple VRFs, but not in the VRF we expect it to
-                createlanipamip(address_obj, netbox_vrf)
+        elif netbox_lan_dic.find(unprefixed_ip, netbox_vrf.id) is not None:
+            # Local IPs/Interfaces are never migrated between OpenStack Networks/VRFs,
+            # So we should assume the Network on the OpenStack side, is still the same on the NetBox side too
+            # If this IP already exists in the VRF we expect it to, we can start comparing
+            netbox_ip = netbox_lan_dic.find(unprefixed_ip, netbox_vrf.id)
+            compare_lan_address(address_obj, netbox_ip, f"lan {netbox_vrf.id} {unprefixed_ip}")
         else:
-            print(f"Something weird is happening for lan IP {unprefixed_ip}")
-            pass  # In case of 100.64.0.0/10 RFC6598 maybe
+            # In case the IP exists in one or more other VRFs, but not in the VRF we expect it to
+            # Our dictionary holds every tagged LAN IP per VRF, so we don't have to ask NetBox to be sure
+            createlanipamip(address_obj, netbox_vrf)
     except Exception as e:
         print(f"Unable to run LAN IP creation and updating script \n{e}")
         sys.exit(1)
@@ -188,8 +180,12 @@ class CreateAddressObject:
         self.nb_vm_id = nb_vm_id
 
 
-def compare_wan_address(os_address_object, nb_addr):
+def compare_wan_address(os_address_object, nb_addr, fingerprint_key):
     global unchanged_wan_ips
+    fingerprint = object_fingerprint(os_address_object)
+    if is_unchanged("addresses", fingerprint_key, fingerprint, nb_addr):
+        unchanged_wan_ips = unchanged_wan_ips + 1
+        return
     try:
         nb_addr_status = str(nb_addr.status)
         nb_addr_status = nb_addr_status.lower()
@@ -197,6 +193,7 @@ def compare_wan_address(os_address_object, nb_addr):
             # We are left with updating only 2 useful values: the status and the bound Interface
             updateglobalipamip(os_address_object, nb_addr)
         else:
+            remember("addresses", fingerprint_key, fingerprint, nb_addr)
             unchanged_wan_ips = unchanged_wan_ips + 1
             if (unchanged_wan_ips % 10) == 0:
                 print(f"Skipped {unchanged_wan_ips} WAN IPs because nothing changed")
@@ -208,8 +205,12 @@ def compare_wan_address(os_address_object, nb_addr):
         sys.exit(1)
 
 
-def compare_lan_address(os_address_object, nb_addr):
+def compare_lan_address(os_address_object, nb_addr, fingerprint_key):
     global unchanged_lan_ips
+    fingerprint = object_fingerprint(os_address_object)
+    if is_unchanged("addresses", fingerprint_key, fingerprint, nb_addr):
+        unchanged_lan_ips = unchanged_lan_ips + 1
+        return
     try:
         nb_addr_status = str(nb_addr.status)
         nb_addr_status = nb_addr_status.lower()
@@ -217,6 +218,7 @@ def compare_lan_address(os_address_object, nb_addr):
             # We are left with updating only 2 useful values: the status and the bound Interface
             updatelanipamip(os_address_object, nb_addr)
         else:
+            remember("addresses", fingerprint_key, fingerprint, nb_addr)
             unchanged_lan_ips = unchanged_lan_ips + 1
             if (unchanged_lan_ips % 10) == 0:
                 print(f"Skipped {unchanged_lan_ips} LAN IPs because nothing changed")
@@ -227,3 +229,10 @@ def compare_lan_address(os_address_object, nb_addr):
         print(f"Unable to compare LAN address {print(vars(os_address_object))} state to NetBox \n {nb_addr} {nb_addr.status} \n{e}")
         sys.exit(1)
 
+
+def reset_address_counters():
+    # For --daemon, every sync cycle counts its own skipped objects
+    global unchanged_wan_ips
+    global unchanged_lan_ips
+    unchanged_wan_ips = 0
+    unchanged_lan_ips = 0
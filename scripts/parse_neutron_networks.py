@@ -30,6 +30,8 @@ from scripts.netbox.create import createnetboxvrf
 from scripts.netbox.create import createnetboxglobalsubnet
 from scripts.netbox.create import createnetboxprivatesubnet
 
+from scripts.netbox.bulk import flush_netbox_queues
+
 import settings
 cluster_name = settings.cluster_name
 
@@ -69,6 +71,7 @@ def netboxipamvrfs(openstack_vrf_dic, netbox_vrf_dic):
         elif openstacknetworkid not in netbox_vrf_dic.keys():
             # If the VRF does not exist yet, we create it
             createnetboxvrf(customvrfname, openstacknetworkid)
+    flush_netbox_queues()
     print(f"Skipped {unchangedvrfs} VRFS in total, because there were no changes.")
 
 
@@ -98,6 +101,7 @@ def netboxipamsubnets(openstack_subnet_dic, openstack_interface_dic, netbox_subn
         except Exception as e:
             print(f"Unable to define OpenStack subnet object {subnet} \n{e}")
             sys.exit(1)
+    flush_netbox_queues()
     print(f"Skipped {unchangedsubnets} prefixes in total, because there were no changes.")
 
 
@@ -167,3 +171,11 @@ def comparsubnets(os_subnet, netbox_prefix):
         print(f"Unable to compare states for Subnet {os_subnet} \n{e}")
         print(vars(os_subnet))
         sys.exit(1)
+
+
+def reset_network_counters():
+    # For --daemon, every sync cycle counts its own skipped objects
+    global unchangedvrfs
+    global unchangedsubnets
+    unchangedvrfs = 0
+    unchangedsubnets = 0
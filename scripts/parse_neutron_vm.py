@@ -24,13 +24,15 @@ from scripts.netbox.create import createnetboxagent
 
 from scripts.netbox.update import updatenetboxrouter
 from scripts.netbox.update import updatenetboxagent
+from scripts.netbox.bulk import flush_netbox_queues
 
 from scripts.openstack.checkstatus import getstatus
+from scripts.openstack.tenants import prefetch_tenants
+from scripts.openstack.tenants import get_tenant_name
 
 import sys
 
 import settings
-keystone = settings.keystone
 cluster_name = settings.cluster_name
 
 skippedneutronrouters = 0
@@ -39,6 +41,9 @@ skippedneutrondhcp = 0
 
 def neutronrouter_to_netboxvms(neutronrouters, flavordictionary, tenantdictionary, netbox_vm_dictionary):
     global skippedneutronrouters
+    if tenantdictionary == "none":
+        # We couldn't list all Tenants, so we look up each Tenant our routers use, once
+        prefetch_tenants(neutronrouters[router]['tenantid'] for router in neutronrouters)
     for router in neutronrouters:
         name = f"Router_{neutronrouters[router]['name']}"
         name = name[:64]  # Netbox wants unique names per cluster, so it will get it...!
@@ -48,8 +53,7 @@ def neutronrouter_to_netboxvms(neutronrouters, flavordictionary, tenantdictionar
             # This is where we attempt fetching Keystone information for the last time
             # but only if collectopenstackinformation() didn't populate tenantdictionary properly
             try:
-                tenantname = keystone.projects.get(neutronrouters[router]['tenantid'])  # We fetch Tenant name via Keystone call
-                tenantname = tenantname.name
+                tenantname = get_tenant_name(neutronrouters[router]['tenantid'])  # Looked up by prefetch_tenants()
             except Exception as e:
                 print(f"Unable to access OpenStack Keystone tenant name for router {router} via Keystone API call \n{e}")
                 tenantname = "Unknown"
@@ -89,7 +93,7 @@ def neutronrouter_to_netboxvms(neutronrouters, flavordictionary, tenantdictionar
             if ((netbox_vm.name != neutron_router.name and netbox_vm.name != neutron_router.custom_name) or
                 netbox_vm_status != neutron_router.status):
                 # We perform a comparison of states before we throw stuff at NetBox
-                updatenetboxrouter(netbox_vm.id, neutron_router)
+                updatenetboxrouter(netbox_vm, neutron_router)
 
             else:
                 skippedneutronrouters = skippedneutronrouters + 1
@@ -99,6 +103,7 @@ def neutronrouter_to_netboxvms(neutronrouters, flavordictionary, tenantdictionar
         elif neutron_router.router_id not in netbox_vm_dictionary.keys():
             # We create the Netbox VM based on the router, if we couldn't find its ID in Netbox.
             createnetboxrouter(neutron_router)
+    flush_netbox_queues()
     print(f"Skipped {skippedneutronrouters} Neutron Routers in total, because there were no changes.")
 
 
@@ -135,4 +140,13 @@ def neutrondhcp_to_netboxvms(agentdictionary, netbox_vm_dictionary):
         elif agentid not in netbox_vm_dictionary.keys():
             # We create a Neutron Netbox VM if we couldn't find it in Netbox.
             createnetboxagent(name, agentid)
+    flush_netbox_queues()
     print(f"Skipped {skippedneutrondhcp} Neutron DHCP servers in total, because there were no changes.")
+
+
+def reset_neutron_vm_counters():
+    # For --daemon, every sync cycle counts its own skipped objects
+    global skippedneutronrouters
+    global skippedneutrondhcp
+    skippedneutronrouters = 0
+    skippedneutrondhcp = 0
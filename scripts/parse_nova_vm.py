@@ -20,15 +20,20 @@
 #  SOFTWARE.
 
 import sys
-import re
 
 from scripts.netbox.create import createnetboxvm
 from scripts.netbox.update import updatenetboxvm
+from scripts.netbox.bulk import flush_netbox_queues
+from scripts.netbox.inventory import inventory
+from scripts.netbox.fingerprints import object_fingerprint
+from scripts.netbox.fingerprints import is_unchanged
+from scripts.netbox.fingerprints import remember
 from scripts.openstack.checkstatus import getstatus
+from scripts.openstack.hostnames import resolve_hostnames
+from scripts.openstack.tenants import prefetch_tenants
+from scripts.openstack.tenants import get_tenant_name
 
 import settings
-keystone = settings.keystone
-nb = settings.nb
 cluster_name = settings.cluster_name
 
 unchangedvms = 0
@@ -36,49 +41,58 @@ unchangedvms = 0
 
 def nova_to_netboxvms(myinstances, nova_dictionary, keystone_dictionary,  netbox_vm_dictionary):
     global unchangedvms
+    # We build our name lookups once, rather than searching through all NetBox VMs for every Instance
+    # The index holds every VM in our cluster, including those whose OpenStack ID is shared with another VM
+    netbox_vm_index = inventory.vm_name_index()
     for os_instance in myinstances:
-        os_nova_vm = define_nova_object(os_instance, nova_dictionary, keystone_dictionary)
+        # The VMs of current Instances are taken, no matter which Instance our loop reaches first
+        if os_instance.id in netbox_vm_dictionary.keys():
+            netbox_vm_index.claim(netbox_vm_dictionary[os_instance.id])
+    hostname_dictionary = resolve_hostnames(myinstances)
+    if keystone_dictionary == "none":
+        # We couldn't list all Tenants, so we look up each Tenant our Instances use, once
+        prefetch_tenants(os_instance.tenant_id for os_instance in myinstances)
+    for os_instance in myinstances:
+        os_nova_vm = define_nova_object(os_instance, nova_dictionary, keystone_dictionary, hostname_dictionary)
         try:
             # print(vars(os_nova_vm))
-            if os_nova_vm.instance_id in netbox_vm_dictionary.keys() and os_nova_vm.custom_name in str(netbox_vm_dictionary.values()):
-                # First we check for custom-named VMs we were forced to create, whenever there were duplicates
+            if os_nova_vm.instance_id in netbox_vm_dictionary.keys():
+                # This includes the custom-named VMs we were forced to create, whenever there were duplicates
                 # NetBox doesn't allow unique names per cluster, unless a Tenant was assigned to said VM
                 netboxvm = netbox_vm_dictionary.get(os_nova_vm.instance_id)
+                vm_fingerprint = object_fingerprint(os_nova_vm)
+                if is_unchanged("vms", os_nova_vm.instance_id, vm_fingerprint, netboxvm):
+                    # Neither side changed since they were last equal
+                    unchanged_vm_counter()
+                    continue
                 nb_vm = CreateNetboxVmObject(netboxvm)
-                compare_vm_objects(os_nova_vm, nb_vm)
-            elif os_nova_vm.instance_id in netbox_vm_dictionary.keys():
-                netboxvm = netbox_vm_dictionary.get(os_nova_vm.instance_id)
-                nb_vm = CreateNetboxVmObject(netboxvm)
-                compare_vm_objects(os_nova_vm, nb_vm)
-            elif (os_nova_vm.instance_id not in netbox_vm_dictionary.keys() and
-                  os_nova_vm.name in str(netbox_vm_dictionary.values()) and
-                    nb.virtualization.virtual_machines.get(name=os_nova_vm.name, cluster_name=cluster_name,
-                                                              tag="openstack-api-script") is not None):
+                compare_vm_objects(os_nova_vm, nb_vm, vm_fingerprint)
+            elif netbox_vm_index.has_name(os_nova_vm.name):
                 # We're dealing with a new VM that may, or may not be, a replacement of an older VM
-                # So we fetch the ID of said machine, based on the OpenStack name and then replace its values
-                nbvm_fetch = nb.virtualization.virtual_machines.get(name=os_nova_vm.name, cluster_name=cluster_name,
-                                                              tag="openstack-api-script")
-                if nbvm_fetch.custom_fields["openstack_tenant"] == os_nova_vm.tenant:
+                # So we look for said machine, based on the OpenStack name and then replace its values
+                nbvm_fetch = netbox_vm_index.find_replacement(os_nova_vm.name, os_nova_vm.tenant)
+                if nbvm_fetch is not None:
                     # If there is a NB VM in the same NB cluster with the same OS VM-name + OS tenant,
-                    # we will assume it is a replacement
+                    # that no other Instance was matched to during this run, we will assume it is a replacement
                     # Notably, the passed instance.id will overwrite the 'old' OpenStack Instance ID field
-                    # The next run, our second or first if statement should trigger for this specific Instance instead
+                    # The next run, our first if statement should trigger for this specific Instance instead
                     nb_vm = CreateNetboxVmObject(nbvm_fetch)
                     compare_vm_objects(os_nova_vm, nb_vm)
                 else:
                     # If the tenant is not equal, we create a new VM instead
-                    createnetboxvm(os_nova_vm)
+                    createnetboxvm(os_nova_vm, netbox_vm_index.add_claimed)
             else:
                 # Finally we create the Netbox VM if we couldn't find or compare it to anything NetBox.
-                createnetboxvm(os_nova_vm)
+                createnetboxvm(os_nova_vm, netbox_vm_index.add_claimed)
         except Exception as e:
             print(f"Unable to create or update VM {os_nova_vm.name} \n{e}")
             print(vars(os_nova_vm))
             sys.exit(1)
+    flush_netbox_queues()
     print(f"Skipped {unchangedvms} VMS in total, because there were no changes.")
 
 
-def define_nova_object(instance, flavordictionary, tenantdictionary):
+def define_nova_object(instance, flavordictionary, tenantdictionary, hostnamedictionary):
     os_instance_flavorname = flavordictionary[instance.flavor['id']]['name']
     os_instance_flavorcpu = flavordictionary[instance.flavor['id']]['vcpu']
     os_instance_flavorram = flavordictionary[instance.flavor['id']]['ram']
@@ -94,8 +108,7 @@ def define_nova_object(instance, flavordictionary, tenantdictionary):
             # This is where we attempt fetching Keystone information for the last time
             # but only if collectopenstackinformation() didn't populate tenantdictionary properly
             try:
-                instancetenant = keystone.projects.get(instance.tenant_id)  # We fetch Tenant name via Keystone call
-                instancetenant = instancetenant.name
+                instancetenant = get_tenant_name(instance.tenant_id)  # Looked up via Keystone by prefetch_tenants()
             except Exception as e:
                 print(f"Unable to access OpenStack Keystone tenant name \n{e}")
                 sys.exit(1)
@@ -119,30 +132,9 @@ def define_nova_object(instance, flavordictionary, tenantdictionary):
         else:
             print(f"Unable to fetch and or set instancehypervisor variable \n{e}")
             sys.exit(1)
-    if instance.status == "ACTIVE":
-        try:
-            # Attempt to get hostname from console output, only if the Instance in a normal state
-            consoleoutput = instance.get_console_output()  # Admin only call
-            hostnamesearch = re.search(r'(.*)\s\blogin:\s', consoleoutput)
-            try:
-                hostname = re.sub(r'\s\blogin:\s', '', hostnamesearch.group(0))
-            except Exception as e:
-                if str(e) == "'NoneType' object has no attribute 'group'":
-                    # If the regex finds no matches, we set the hostname to unknown
-                    hostname = "unknown"
-                else:
-                    print(f"Unable to fetch hostname for {instance.name} \n{e}")
-                    sys.exit(1)
-        except Exception as e:
-            if "Policy doesn't allow os_compute_api:os-console-output to be performed. (HTTP 403)" in str(e):
-                # A non-admin was used to request this information, so we set the hostname to Unknown
-                hostname = "unknown"
-            else:
-                print(f"Unable to get console-output for Instance {instance.name} \n{e}")
-                sys.exit(1)
-    else:
-        # Console output won't be available for Instances that are shutoff/unavailable, so set hostname to unknown
-        hostname = "unknown"
+    # Hostnames were collected from the console output beforehand, see scripts/openstack/hostnames.py
+    # compare_vm_objects() keeps the hostname stored in NetBox whenever this turns out "unknown"
+    hostname = hostnamedictionary.get(instance.id, "unknown")
     nova_vm = CreateNovaVmObject(instancename, custom_instance_name, instance.id, instancetenant,
                                  currentstatus, instancehypervisor, hostname,
                                  os_instance_flavorname, os_instance_flavorcpu, os_instance_flavorram,
@@ -170,6 +162,7 @@ class CreateNovaVmObject(object):
 
 class CreateNetboxVmObject(object):
     def __init__(self, dictionary):
+        self.record = dictionary  # So updatenetboxvm() can send only the fields that differ from it
         self.name = dictionary.name
         self.netbox_id = dictionary.id
         self.openstack_id = dictionary.custom_fields["openstack_id"]
@@ -188,8 +181,7 @@ class CreateNetboxVmObject(object):
         self.flavorephemeral = dictionary.custom_fields["openstack_ephemeral"]
 
 
-def compare_vm_objects(os_nova_vm_obj, nb_vm_obj):
-    global unchangedvms
+def compare_vm_objects(os_nova_vm_obj, nb_vm_obj, fingerprint=None):
     if os_nova_vm_obj.hostname != "unknown":
         pass
     elif nb_vm_obj.hostname != "unknown" and os_nova_vm_obj.hostname == "unknown":
@@ -211,17 +203,28 @@ def compare_vm_objects(os_nova_vm_obj, nb_vm_obj):
                 nb_vm_obj.flavorephemeral != os_nova_vm_obj.flavorephemeral):
             #print(vars(os_nova_vm_obj))
             #print(vars(nb_vm_obj))
-            updatenetboxvm(nb_vm_obj.netbox_id, os_nova_vm_obj)
+            updatenetboxvm(nb_vm_obj.record, os_nova_vm_obj)
         else:
-            unchangedvms = unchangedvms + 1
-            if (unchangedvms % 10) == 0:
-                print(f"Skipped {unchangedvms} VMs because nothing changed")
-            else:
-                pass
-            pass
+            remember("vms", os_nova_vm_obj.instance_id, fingerprint, nb_vm_obj.record)
+            unchanged_vm_counter()
     except Exception as e:
         print(f"Unable to compare OpenStack Instance to Netbox Virtual Machine:\n")
         print(f"{e}\n")
         print(f"{vars(os_nova_vm_obj)}\n")
         print(f"{vars(nb_vm_obj)}\n")
         sys.exit(1)
+
+
+def unchanged_vm_counter():
+    global unchangedvms
+    unchangedvms = unchangedvms + 1
+    if (unchangedvms % 10) == 0:
+        print(f"Skipped {unchangedvms} VMs because nothing changed")
+    else:
+        pass
+
+
+def reset_nova_counters():
+    # For --daemon, every sync cycle counts its own skipped objects
+    global unchangedvms
+    unchangedvms = 0
@@ -0,0 +1,81 @@
+#  MIT License
+#
+#  Copyright (c) 2025. Patrick Brammerloo, Mark Zijdemans, DirectVPS [https://directvps.nl/]
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+
+class Task(object):
+    def __init__(self, name, function, depends_on=(), pass_results=True):
+        self.name = name
+        self.function = function  # Receives the results of depends_on, in that same order
+        self.depends_on = list(depends_on)
+        self.pass_results = pass_results  # False when the task only has to wait for depends_on, not use their results
+
+
+def run_tasks(tasks, max_workers):
+    # We run every task as soon as the tasks it depends on have finished, up to max_workers at the same time
+    # Returns the result and the amount of seconds it took, per task name
+    results = {}
+    timings = {}
+    waiting = {task.name: task for task in tasks}
+    running = {}
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while waiting or running:
+            for name, task in list(waiting.items()):
+                if all(dependency in results for dependency in task.depends_on):
+                    del waiting[name]
+                    dependency_results = [results[dependency] for dependency in task.depends_on]
+                    running[pool.submit(run_timed, task, dependency_results)] = task
+            if not running:
+                raise ValueError(f"Tasks {list(waiting.keys())} depend on tasks that don't exist")
+            finished, not_finished = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                # Errors of a task, including the sys.exit() of our fetch functions, are raised again here
+                results[task.name], timings[task.name] = future.result()
+    except BaseException:
+        for future in running.keys():
+            future.cancel()
+        raise
+    finally:
+        # Tasks that already started can't be stopped, we wait for them so nothing of this run is still busy
+        # once we return. The next sync cycle of --daemon resets the queues and dictionaries they work with
+        pool.shutdown(wait=True)
+    return results, timings
+
+
+def run_timed(task, dependency_results):
+    started = time.monotonic()
+    if task.pass_results:
+        result = task.function(*dependency_results)
+    else:
+        result = task.function()
+    return result, time.monotonic() - started
+
+
+def print_task_timings(timings, title):
+    print(f"{title}:")
+    for name, seconds in sorted(timings.items(), key=lambda timing: timing[1], reverse=True):
+        print(f"  {name}: {seconds:.2f} seconds")
@@ -32,6 +32,8 @@ cluster_name = settings.cluster_name
 from openstack.fetchinfo import get_nova
 from openstack.fetchinfo import get_cinder
 from openstack.fetchinfo import get_neutron
+from netbox.fetchinfo import nbfetchprefixoccupancy
+from netbox.indexes import build_interface_address_map
 
 
 def get_netbox_vms():
@@ -122,16 +124,13 @@ def get_netbox_prefixes(netbox_vrf_dic):
             netbox_prefix_dic_filt[subnet.id] = subnet
         else:
             continue
+    # Rather than asking NetBox for the IPs of every Prefix, we fetch the addresses inside all of them at once
+    occupancy = nbfetchprefixoccupancy(netbox_prefix_dic_filt.values())
     for prefix_id, prefix in netbox_prefix_dic_filt.items():
         if prefix.vrf is not None and ipaddress.ip_network(prefix.prefix).is_private:
             # We filter for LAN VRFs
             # Only LAN addresses have VRFs assigned to them by our script
-            parents = nb.ipam.ip_addresses.filter(parent=prefix.prefix, vrf_id=prefix.vrf.id)
-            amountofips = 0
-            for ip in parents:
-                # We count the number of IPs within the subnet
-                amountofips = amountofips + 1
-            if amountofips == 0:
+            if occupancy.is_empty(prefix.prefix, prefix.vrf.id):
                 # If the prefix comes back empty, only then do we add the Subnet for potential deletion
                 netbox_prefix_dic_openstack[prefix.custom_fields["openstack_subnetid"]] = prefix
                 netbox_prefix_dic_netbox[prefix.id] = prefix
@@ -143,12 +142,8 @@ def get_netbox_prefixes(netbox_vrf_dic):
               prefix.custom_fields["openstack_subnetid"] is not None and
               prefix.custom_fields["openstack_subnetid"] != ""):
             # We make sure to filter for Global addresses unassigned to VRFs, but also yoinked by our OpenStack script
-            parents = nb.ipam.ip_addresses.filter(parent=prefix.prefix)
-            amountofips = 0
-            for ip in parents:
-                # We count the number of IPs within the subnet
-                amountofips = amountofips + 1
-            if amountofips == 0:
+            # Just like the Prefix itself, we count the IPs within it in any VRF
+            if occupancy.is_empty(prefix.prefix):
                 # If the prefix comes back empty, only then do we add the Subnet for potential deletion
                 netbox_prefix_dic_openstack[prefix.custom_fields["openstack_subnetid"]] = prefix
                 netbox_prefix_dic_netbox[prefix.id] = prefix
@@ -275,25 +270,22 @@ def cleaninterfaces(neutroninterfaces, netbox_interface_os_dic):
 def cleanaddresses(neutroninterfaces, neutronfloat, nb_addresses, netbox_int_dic):
     # We match NetBox addresses to Neutron Nova/Float addresses
     netboxaddressesdeleteid = []
+    # The Neutron addresses of every OpenStack Interface, including the Floating IPs bound to it, collected once
+    neutron_addresses = build_interface_address_map(neutroninterfaces, neutronfloat)
+    netbox_addresses = {}
     for nb_address_id, nb_address in nb_addresses.items():
+        # We group the NetBox addresses per OpenStack Interface the same way
         address_interface = netbox_int_dic.get(nb_address.assigned_object.id)
         nb_interface_os_id = address_interface.custom_fields['openstack_interfaceid']
-        neutron_addresses = set()
         split_address = str(nb_address.address)
         split_address = split_address.split('/')[0]  # NB always gives along the prefix, but Neutron doesn't
-        for ip in neutroninterfaces[nb_interface_os_id]["interfaceips"]:
-            neutron_addresses.add(ip["ip_address"])
-        for floatid in neutronfloat:
-            if neutronfloat[floatid]["boundtointerfaceid"] == nb_interface_os_id:
-                # I'm sorry for looping over the entire dictionary each time ;_;
-                # We fetch any relevant Floating IPs from our other dictionary and add them our address collection
-                neutron_addresses.add(neutronfloat[floatid]["floatip"])
-        if split_address in neutron_addresses:
-            continue
-        elif split_address not in neutron_addresses:
-            # Finally, we check if the NB address is not in our Neutron address set.
-            print(f"Queueing Address {nb_address.address} as it does not exist on OpenStack Interface {nb_interface_os_id}")
-            netboxaddressesdeleteid.append(nb_address.id)
+        netbox_addresses.setdefault(nb_interface_os_id, {}).setdefault(split_address, []).append(nb_address)
+    for nb_interface_os_id, nb_interface_addresses in netbox_addresses.items():
+        # Finally, we check which NB addresses are not in our Neutron address set
+        for split_address in nb_interface_addresses.keys() - neutron_addresses.get(nb_interface_os_id, set()):
+            for nb_address in nb_interface_addresses[split_address]:
+                print(f"Queueing Address {nb_address.address} as it does not exist on OpenStack Interface {nb_interface_os_id}")
+                netboxaddressesdeleteid.append(nb_address.id)
     try:
         if not netboxaddressesdeleteid:
             # We evaluate whether there is anything in the array before attempting deletion
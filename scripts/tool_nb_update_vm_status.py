@@ -30,6 +30,8 @@ cluster_name = settings.cluster_name
 from openstack.checkstatus import getstatus
 from openstack.fetchinfo import get_nova
 from netbox.fetchinfo import nbfetchvms
+from netbox.update import updatenetboxvmstatus
+from scripts.netbox.bulk import flush_netbox_queues
 
 try:
     print(f'\nFetching information from OpenStack \n')
@@ -66,25 +68,15 @@ def updatestatus(nova_instances, netbox_vm_dictionary):
                 pass
             elif nbvmvstatus != currentstatus:
                 # The status is different now, so we update it!
-                try:
-                    # Update the Netbox VM info if its OpenStack ID is found in the Netbox-cluster, with the new status
-                    updatenetboxvmstatus(nbvm.id, currentstatus)
-                    print(f"The status of {instance.name} in Netbox cluster {cluster_name} was updated")
-                except Exception as e:
-                    print(f"Unable to update the status of {instance.name} in Netbox cluster {cluster_name} \n{e}")
-                    sys.exit(1)
+                # Update the Netbox VM info if its OpenStack ID is found in the Netbox-cluster, with the new status
+                # The changes are sent to NetBox in batches, rather than a PATCH per VM
+                updatenetboxvmstatus(nbvm.id, currentstatus, instance.name)
         else:
             print(f"Skipping VM {instance.name}, its OpenStack ID was not found in the Netbox cluster. ID: {instance.id}")
             continue
+    flush_netbox_queues()
     print(f"\nThe script finished succesfully.")
     print(f"{unchangedvms} VMs were skipped because their status hasn't changed.")
 
 
-def updatenetboxvmstatus(netbox_vm_id, status):
-    # Update OpenStack VM in Netbox based on given values
-    vm = nb.virtualization.virtual_machines.update([
-        {'id': netbox_vm_id, 'status': status}
-    ])
-
-
 updatestatus(myinstances, netboxvmdic)
@@ -21,13 +21,20 @@
 
 import os
 import sys
+import atexit
 
 from dotenv import load_dotenv
 from dotenv import find_dotenv
 
 # OpenStacks' authentication modules
 from keystoneauth1.identity import v3
-from keystoneauth1 import session
+
+from scripts.openstack.clients import LazyClient
+from scripts.openstack.clients import create_session
+from scripts.openstack.clients import load_token
+from scripts.openstack.clients import save_token
+from scripts.netbox.prerequisites import check_prerequisites
+from scripts.netbox.transport import NetboxTransport
 
 import pynetbox
 
@@ -48,27 +55,59 @@ os_user_domain_id = os.getenv("os_user_domain_id")
 os_project_name = os.getenv("os_project_name")
 os_project_domain_id = os.getenv("os_project_domain_id")
 
+# Optional tuning values
+netbox_bulk_size = int(os.getenv("netbox_bulk_size", 100))  # Objects per bulk create request
+netbox_bulk_update_size = int(os.getenv("netbox_bulk_update_size", 100))  # Objects per bulk update request
+netbox_bulk_update_interval = float(os.getenv("netbox_bulk_update_interval", 30))  # Seconds after which queued updates are sent anyway
+netbox_state_file = os.getenv("netbox_state_file", ".netbox-state.sqlite")  # Empty always fetches and compares everything
+netbox_address_fetch = os.getenv("netbox_address_fetch", "filtered")  # "filtered" or "all" NetBox IP-addresses
+netbox_prerequisite_cache_file = os.getenv("netbox_prerequisite_cache_file", ".netbox-prerequisites.json")
+netbox_prerequisite_cache_ttl = int(os.getenv("netbox_prerequisite_cache_ttl", 3600))  # Seconds before checking again
+netbox_delete_delay = float(os.getenv("netbox_delete_delay", 10))  # Seconds --reconcile waits before each bulk DELETE
+netbox_stage_workers = int(os.getenv("netbox_stage_workers", 4))  # Independent sync stages running side by side
+netbox_workers = int(os.getenv("netbox_workers", 6))  # Simultaneous NetBox fetches
+# Connections kept open to NetBox, enough for our fetches and the stages writing to NetBox at the same time
+netbox_pool_size = int(os.getenv("netbox_pool_size", netbox_workers + netbox_stage_workers))
+netbox_retries = int(os.getenv("netbox_retries", 5))  # Retries of a request NetBox answered with 429/502/503/504
+netbox_retry_backoff = float(os.getenv("netbox_retry_backoff", 0.5))  # Seconds, doubled for every retry
+netbox_retry_backoff_max = float(os.getenv("netbox_retry_backoff_max", 30))  # Max seconds between retries
+netbox_min_in_flight = int(os.getenv("netbox_min_in_flight", 1))  # NetBox requests in flight when it is overloaded
+netbox_latency_target = float(os.getenv("netbox_latency_target", 5))  # Slower responses mean NetBox is overloaded
+netbox_fast_json = os.getenv("netbox_fast_json", "true")  # "true" decodes NetBox responses with orjson, if installed
+os_collection_mode = os.getenv("os_collection_mode", "full")  # "full" or "incremental" OpenStack collection
+os_snapshot_file = os.getenv("os_snapshot_file", ".openstack-snapshot.sqlite")  # Used by the incremental collection
+os_snapshot_max_age = int(os.getenv("os_snapshot_max_age", 86400))  # Seconds before everything is collected again
+daemon_interval = float(os.getenv("daemon_interval", 900))  # Seconds between sync cycles of --daemon
+daemon_jitter = float(os.getenv("daemon_jitter", 60))  # Random seconds added to or taken from daemon_interval
+daemon_max_backoff = float(os.getenv("daemon_max_backoff", 3600))  # Max seconds between cycles after failures
+os_neutron_page_size = int(os.getenv("os_neutron_page_size", 1000))  # Neutron ports per request
+os_api_workers = int(os.getenv("os_api_workers", 8))  # Simultaneous OpenStack list calls while collecting
+os_console_workers = int(os.getenv("os_console_workers", 8))  # Simultaneous console-output calls for hostnames
+os_console_lines = int(os.getenv("os_console_lines", 500))  # Console-output lines searched for the login prompt
+os_hostname_cache_file = os.getenv("os_hostname_cache_file", ".openstack-hostnames.json")  # Empty disables the cache
+os_keystone_workers = int(os.getenv("os_keystone_workers", 8))  # Simultaneous Tenant lookups for non-admin users
+os_tenant_cache_file = os.getenv("os_tenant_cache_file", "")  # Keep Tenant names between runs, empty disables it
+os_tenant_cache_ttl = int(os.getenv("os_tenant_cache_ttl", 86400))  # Seconds before cached Tenant names are asked again
+os_token_cache_file = os.getenv("os_token_cache_file", ".openstack-token.json")  # Empty always authenticates again
+
 
 try:
     # Connect to Netbox
     nb = pynetbox.api(
         netbox_domain, token=netbox_token, threading=True
     )
+    # All NetBox fetches and writes share these connections. When every connection is busy, requests wait for one
+    # instead of opening (and throwing away) extra connections to NetBox, see scripts/netbox/transport.py
+    netbox_transport = NetboxTransport(netbox_pool_size, netbox_fast_json == "true", netbox_retries,
+                                       netbox_retry_backoff, netbox_retry_backoff_max, netbox_min_in_flight,
+                                       netbox_latency_target)
+    nb.http_session.mount("http://", netbox_transport)
+    nb.http_session.mount("https://", netbox_transport)
     try:
-        # Check whether required Netbox resources exist and are unique
-        myclusterid = nb.virtualization.clusters.get(name=cluster_name).id
-        nb.virtualization.cluster_types.get(name=cluster_type).id
-        nb.extras.custom_fields.get(name="openstack_id").id
-        nb.extras.custom_fields.get(name="openstack_hypervisor").id
-        nb.extras.custom_fields.get(name="openstack_tenant").id
-        nb.extras.custom_fields.get(name="openstack_flavor").id
-        nb.extras.custom_fields.get(name="openstack_swap").id
-        nb.extras.custom_fields.get(name="openstack_ephemeral").id
-        nb.extras.custom_fields.get(name="openstack_interfaceid").id
-        nb.extras.custom_fields.get(name="openstack_networkid").id
-        nb.extras.custom_fields.get(name="openstack_volumeid").id
-        nb.extras.custom_fields.get(name="openstack_subnetid").id
-        netboxtagopenstackapiscriptid = nb.extras.tags.get(slug="openstack-api-script").id
+        # Check whether required Netbox resources exist and are unique, see scripts/netbox/prerequisites.py
+        myclusterid, netboxtagopenstackapiscriptid = check_prerequisites(nb, netbox_domain, cluster_name, cluster_type,
+                                                                          netbox_prerequisite_cache_file,
+                                                                          netbox_prerequisite_cache_ttl)
     except Exception as e:
         if "Token expired" in str(e):
             print(f"The supplied Netbox user has its token expired: \n{e}")
@@ -101,43 +140,35 @@ elif os_auth_url_type != "public" or os_auth_url_type != "internal":
 auth = v3.Password(auth_url=os_auth_url, username=os_username,
                    password=os_password, project_name=os_project_name,
                    user_domain_id=os_user_domain_id, project_domain_id=os_project_domain_id)
+# A token from a previous run is used until it expires, and the token we end up with is kept for the next run
+load_token(auth, os_token_cache_file)
+atexit.register(save_token, auth, os_token_cache_file)
 
-# Initialize all modules in a row, so sessions don't get overwritten
-try:
-    # Keystone client
+# All clients share this session, with its token and connections. They are only built when first used
+openstack_session = create_session(auth, max(os_api_workers, os_console_workers, os_keystone_workers))
+
+
+def create_keystone():
     from keystoneclient import client
-    sesis = session.Session(auth=auth)
-    keystone = client.Client(session=sesis, interface=keystoneendpoint)
-except Exception as e:
-    print(f"Unable to authenticaticate with Keystone using the supplied credentials. \n{e}")
-    sys.exit(1)
+    return client.Client(session=openstack_session, interface=keystoneendpoint)
 
 
-try:
-    # Nova client
+def create_nova():
     from novaclient import client
-    sess = session.Session(auth=auth)
-    nova = client.Client(2.8, session=sess, endpoint_type=novaendpoint)
-except Exception as e:
-    print(f"Unable to authenticaticate with Nova using the supplied credentials. \n{e}")
-    sys.exit(1)
+    return client.Client(2.8, session=openstack_session, endpoint_type=novaendpoint)
 
 
-try:
-    # Cinder client
+def create_cinder():
     from cinderclient import client
-    sesder = session.Session(auth=auth)
-    cinder = client.Client(3.6, session=sesder, endpoint_type=cinderendpoint)
-except Exception as e:
-    print(f"Unable to authenticaticate with Cinder using the supplied credentials. \n{e}")
-    sys.exit(1)
+    return client.Client(3.6, session=openstack_session, endpoint_type=cinderendpoint)
 
 
-try:
-    # Neutron
+def create_neutron():
     from neutronclient.v2_0 import client
-    sesa = session.Session(auth=auth)
-    neutron = client.Client(session=sesa, endpoint_type=neutronendpoint)
-except Exception as e:
-    print(f"Unable to authenticaticate with Neutron using the supplied credentials. \n{e}")
-    sys.exit(1)
+    return client.Client(session=openstack_session, endpoint_type=neutronendpoint)
+
+
+keystone = LazyClient("Keystone", create_keystone)
+nova = LazyClient("Nova", create_nova)
+cinder = LazyClient("Cinder", create_cinder)
+neutron = LazyClient("Neutron", create_neutron)